@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of DoMapping.
+# Copyright (C) 2015, 2016 CERN.
+#
+# DoMapping is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# DoMapping is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DoMapping; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Analysis of the size of mappings.
+
+Elasticsearch limits the number of fields, the depth and the number of
+nested fields of a mapping, and every mapping is part of the cluster state.
+:py:func:`analyze_mapping` measures a mapping in a single pass so that
+mappings exceeding these limits are detected before deploying them.
+"""
+
+from six import iteritems
+
+from . import serialization
+from .events import iter_dict_events
+
+DEFAULT_LIMITS = {
+    'total_fields': 1000,
+    'depth': 20,
+    'nested_fields': 50,
+    'size': None,
+}
+"""Default limits, the ones of elasticsearch's ``index.mapping.*.limit``
+settings. The cluster state size of a mapping is not limited by default."""
+
+
+class MappingAnalysis(object):
+    """Measures of a mapping."""
+
+    def __init__(self):
+        """Constructor."""
+        self.total_fields = 0
+        """Number of fields, counted as elasticsearch does: objects and
+        multi-fields included."""
+        self.max_depth = 0
+        """Maximum number of objects enclosing a field, plus one."""
+        self.nested_fields = 0
+        """Number of fields of type "nested"."""
+        self.size = 0
+        """Size of the compact JSON mapping in bytes. It estimates the size
+        of the mapping in the cluster state."""
+        self.subtree_fields = {}
+        """Dict of dotted object path -> number of fields in the object."""
+        self.violations = []
+        """List of ``{"limit", "value", "max"}`` dicts of the exceeded
+        limits."""
+
+    def largest_subtrees(self, count=10):
+        """Return the (path, number of fields) of the largest objects."""
+        return sorted(iteritems(self.subtree_fields),
+                      key=lambda item: (-item[1], item[0]))[:count]
+
+    def to_dict(self, subtrees=10):
+        """Convert the analysis to a json serializable dict.
+
+        :param subtrees: number of largest objects to include.
+        """
+        return {
+            'total_fields': self.total_fields,
+            'max_depth': self.max_depth,
+            'nested_fields': self.nested_fields,
+            'size': self.size,
+            'largest_subtrees': [
+                {'path': path, 'fields': fields}
+                for path, fields in self.largest_subtrees(subtrees)
+            ],
+            'violations': self.violations,
+        }
+
+
+def analyze_mapping(mapping, limits=None):
+    """Measure a type mapping and check it against limits.
+
+    :param mapping: type mapping, e.g. produced by
+        :py:func:`domapping.mapping.schema_to_mapping`.
+    :param limits: dict overriding :py:data:`DEFAULT_LIMITS`. ``None``
+        disables a limit.
+    :return: a :py:class:`MappingAnalysis`.
+    """
+    return analyze_events(iter_dict_events(mapping), limits)
+
+
+def analyze_events(events, limits=None):
+    """Measure a mapping described by events.
+
+    See :py:mod:`domapping.events` and :py:func:`analyze_mapping`.
+    """
+    analysis = MappingAnalysis()
+    # one [number of fields, size, number of properties] entry per open
+    # object
+    stack = []
+    for event, path, es_mapping in events:
+        if event == 'end_object':
+            fields, size, properties = stack.pop()
+            # '"properties":{...}}' with the commas between properties
+            size += len('"properties":{}}') + max(properties - 1, 0)
+            if es_mapping:
+                # ',"name":value,...' members following the properties
+                size += len(serialization.dumps(es_mapping)) - 1
+            if path:
+                analysis.subtree_fields['.'.join(path)] = fields
+                stack[-1][0] += fields
+                stack[-1][1] += size
+                stack[-1][2] += 1
+            else:
+                analysis.size = size
+            continue
+
+        depth = len(path)
+        analysis.max_depth = max(analysis.max_depth, depth)
+        # '"name":' followed by the mapping
+        size = len(serialization.dumps(path[-1])) + 1 if path else 0
+        fields = 0
+        if path:
+            fields = 1 + len(es_mapping.get('fields', ()))
+            if es_mapping.get('type') == 'nested':
+                analysis.nested_fields += 1
+            if stack:
+                stack[-1][0] += fields
+        analysis.total_fields += fields
+
+        if event == 'field':
+            stack[-1][1] += size + len(serialization.dumps(es_mapping))
+            stack[-1][2] += 1
+        else:
+            # '{...,' without its closing brace
+            size += len(serialization.dumps(es_mapping)) - 1
+            if es_mapping:
+                size += 1
+            stack.append([0, size, 0])
+
+    limits_values = dict(DEFAULT_LIMITS)
+    limits_values.update(limits or {})
+    for limit, value in (('total_fields', analysis.total_fields),
+                         ('depth', analysis.max_depth),
+                         ('nested_fields', analysis.nested_fields),
+                         ('size', analysis.size)):
+        maximum = limits_values[limit]
+        if maximum is not None and value > maximum:
+            analysis.violations.append({
+                'limit': limit,
+                'value': value,
+                'max': maximum,
+            })
+    return analysis
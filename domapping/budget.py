@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of DoMapping.
+# Copyright (C) 2015, 2016 CERN.
+#
+# DoMapping is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# DoMapping is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DoMapping; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Field budget of compiled schemas.
+
+Elasticsearch rejects mappings having more fields than
+``index.mapping.total_fields.limit``. :py:func:`apply_field_budget` reduces
+the number of fields of a compiled schema by disabling object fields: a
+disabled object is mapped as ``{"type": "object", "enabled": false}``, its
+content is kept in ``_source`` but not indexed, and it counts as a single
+field.
+
+Fields are counted as elasticsearch does: objects, leaf fields and their
+subfields, e.g. the configured multi-fields, and the catch-all field. Fields
+matching the dynamic templates are only added when documents are indexed and
+are not counted.
+
+Objects are expanded from the root, the most important first, as long as
+their properties fit in the budget. The importance of an object is given by
+the priority policy:
+
+* "depth": objects closer to the root first.
+* "annotation": objects containing the fields with the highest
+  ``"x-domapping": {"priority": ...}`` annotation first, the default priority
+  being 0. Ties are broken by depth.
+
+Objects containing a field matching one of the ``keep`` path patterns, see
+:py:mod:`domapping.projection`, are expanded before any other.
+"""
+
+import heapq
+import itertools
+
+from six import iteritems
+
+from .errors import JsonSchemaSupportError
+from .mapping import ElasticMappingGeneratorConfig, _gen_field
+from .projection import SKIP, Projection
+
+BUDGET_PRIORITIES = ('depth', 'annotation')
+"""Priority policies of :py:func:`apply_field_budget`."""
+
+
+def apply_field_budget(compiled_schema, max_fields, priority='depth',
+                       keep=None, config=None):
+    """Disable the least important objects of a schema exceeding a budget.
+
+    Fields are counted as elasticsearch does in the mapping generated with
+    the given configuration, see the module documentation.
+
+    :param compiled_schema: schema returned by
+        :py:func:`domapping.compiler.compile_schema`. It is not modified.
+    :param max_fields: maximum number of fields.
+    :param priority: one of :py:data:`BUDGET_PRIORITIES`.
+    :param keep: list of path patterns of fields which are kept first.
+    :param config: configuration used to generate the elasticsearch mapping.
+        The default configuration is used when ``None``.
+    :return: a tuple (compiled schema, list of the dotted paths of the
+        disabled objects).
+    """
+    if priority not in BUDGET_PRIORITIES:
+        raise ValueError('Unknown budget priority "{}".'.format(priority))
+    if config is None:
+        config = ElasticMappingGeneratorConfig()
+    path = compiled_schema.get('id', '#')
+    projection = Projection(keep) if keep else None
+    priorities = {}
+    if priority == 'annotation':
+        _subtree_priority(compiled_schema, (), priorities)
+
+    root_object = _object_definition(compiled_schema)
+    if root_object is None:
+        # not an object, it is reported when mapping it
+        return compiled_schema, []
+
+    def count(object_definition, names):
+        """Count the fields of the properties of an object."""
+        result = 0
+        for prop, prop_schema in iteritems(object_definition['properties']):
+            result += 1
+            if _object_definition(prop_schema) is None:
+                result += _count_subfields(prop_schema, path, config,
+                                           names + (prop,))
+        return result
+
+    total = count(root_object, ())
+    if config.catch_all_field is not None:
+        total += 1 + len(config.get_catch_all_mapping().get('fields', ()))
+    if total > max_fields:
+        raise JsonSchemaSupportError(
+            'The field budget of {} fields is lower than the {} root '
+            'fields.'.format(max_fields, total), path)
+
+    # objects which can be expanded, by importance
+    candidates = []
+    counter = itertools.count()
+
+    def expand(node, object_definition, names, state):
+        """Copy an object node, replacing its object properties by stubs."""
+        expanded_object = dict(object_definition)
+        expanded_object['properties'] = {}
+        for prop, prop_schema in iteritems(object_definition['properties']):
+            prop_names = names + (prop,)
+            prop_object = _object_definition(prop_schema)
+            if prop_object is None:
+                expanded_object['properties'][prop] = prop_schema
+                continue
+            expanded_object['properties'][prop] = {
+                'type': 'object', 'properties': {}, 'enabled': False}
+            prop_state = None
+            if projection is not None:
+                prop_state = projection.child(state, prop)
+            key = (
+                1 if projection is None or prop_state is SKIP else 0,
+                -priorities.get(prop_names, 0),
+                len(prop_names),
+                next(counter),
+            )
+            heapq.heappush(candidates, (key, prop_schema, prop_object,
+                                        prop_names,
+                                        expanded_object['properties'],
+                                        prop_state))
+        if 'allOf' not in node:
+            return expanded_object
+        # the object definitions are merged in the first one
+        definitions = []
+        for definition in node['allOf']:
+            if definition.get('type') != 'object':
+                definitions.append(definition)
+            elif expanded_object is not None:
+                definitions.append(expanded_object)
+                expanded_object = None
+        return {'allOf': definitions}
+
+    result = expand(compiled_schema, root_object, (),
+                    projection.root() if projection is not None else None)
+    disabled = []
+    while candidates:
+        _, node, object_definition, names, properties, state = \
+            heapq.heappop(candidates)
+        size = count(object_definition, names)
+        if total + size <= max_fields:
+            total += size
+            properties[names[-1]] = expand(node, object_definition, names,
+                                           state)
+        else:
+            disabled.append('.'.join(names))
+    return result, disabled
+
+
+def _object_definition(node):
+    """Return the object definition of a compiled node, or None.
+
+    Multiple object definitions of a field are merged, as they are merged in
+    the generated mapping.
+    """
+    objects = [definition for definition in node.get('allOf', (node,))
+               if definition.get('type') == 'object']
+    if len(objects) < 2:
+        return objects[0] if objects else None
+    merged = {}
+    properties = {}
+    for definition in objects:
+        for key, value in iteritems(definition):
+            if key != 'enabled' or value is False:
+                merged[key] = value
+        for prop, prop_schema in iteritems(definition['properties']):
+            if prop in properties:
+                previous = properties[prop]
+                prop_schema = {'allOf': (previous.get('allOf', [previous]) +
+                                         prop_schema.get('allOf',
+                                                         [prop_schema]))}
+            properties[prop] = prop_schema
+    merged['properties'] = properties
+    return merged
+
+
+def _count_subfields(node, path, config, names):
+    """Count the subfields of the mapping of a leaf field.
+
+    :param node: compiled node of the leaf field.
+    :param path: json path of the schema. Used for debug.
+    :param config: configuration used to generate the elasticsearch mapping.
+    :param names: tuple of the names of the path to the node.
+    """
+    es_mapping = {}
+    _gen_field(node, path + '/' + '/'.join(names), config, es_mapping, names,
+               [])
+    return len(es_mapping.get('fields', ()))
+
+
+def _subtree_priority(node, names, priorities):
+    """Compute the highest priority annotation of each object subtree.
+
+    :param node: compiled node.
+    :param names: tuple of the names of the path to the node.
+    :param priorities: dict of names -> priority, filled for object nodes.
+    :return: the priority of the node.
+    """
+    result = 0
+    for definition in node.get('allOf', (node,)):
+        annotation = definition.get('x-domapping')
+        if isinstance(annotation, dict) and 'priority' in annotation:
+            result = max(result, annotation['priority'])
+    object_definition = _object_definition(node)
+    if object_definition is not None:
+        for prop, prop_schema in iteritems(object_definition['properties']):
+            result = max(result, _subtree_priority(prop_schema,
+                                                   names + (prop,),
+                                                   priorities))
+        priorities[names] = result
+    return result
@@ -24,64 +24,539 @@
 
 """CLI commands."""
 
-import json
+import fnmatch
+import functools
 import os
 import sys
 
 import click
+from six import string_types
 from six.moves import urllib
 
-from .errors import JsonSchemaSupportError
-from .mapping import ElasticMappingGeneratorConfig, schema_to_mapping
+from . import serialization
+from .analysis import DEFAULT_LIMITS, analyze_mapping
+from .budget import BUDGET_PRIORITIES, apply_field_budget
+from .compiler import RECURSION_POLICIES, compile_schema
+from .errors import JsonSchemaSupportError, error_record
+from .events import dump_events, iter_compiled_mapping_events, \
+    iter_mapping_events
+from .index import compiled_schema_to_index
+from .limits import ResourceLimits
+from .lint import lint_files, load_corpus
+from .mapping import ElasticMappingGeneratorConfig, \
+    compiled_schema_to_mapping, schema_to_mapping
+from .minify import minify_mapping
+from .parallel import parallel_schema_to_mapping
+from .presets import PRESETS
+from .resolver import ResolutionCache
 from .templating import jinja_to_mapping, mapping_to_jinja
 
 
+def _dump_mapping(mapping, output, indent, compact, output_format):
+    """Write a mapping, or any other json document, in the requested format.
+
+    :param mapping: mapping to write.
+    :param output: binary file object.
+    :param indent: JSON indentation step.
+    :param compact: write JSON without any indentation or whitespace.
+    :param output_format: one of :py:data:`domapping.serialization.FORMATS`.
+    """
+    output.write(serialization.encode(mapping, fmt=output_format,
+                                      indent=None if compact else indent))
+
+
+def _ndjson_schemas_to_mappings(lines, output, config, mapping_type,
+                                minify=False, **options):
+    """Generate one mapping per line of a newline delimited json stream.
+
+    Each line is either a JSON Schema or an object of the form
+    ``{"schema": {...}, "id": "...", "mapping_type": "..."}`` where "id" and
+    "mapping_type" are optional. The lines share a resolution cache so that
+    remote schemas are only fetched once, but each line is resolved on its
+    own: a line cannot reference the schema of another line, and the memory
+    used does not grow with the length of the stream.
+
+    Errors do not stop the stream. They are written in place of the
+    corresponding mapping as ``{"error": {...}}`` records.
+
+    :param lines: iterable of json lines.
+    :param output: binary file object receiving one mapping per line.
+    :param config: configuration used to generate the mappings.
+    :param mapping_type: default ElasticSearch mapping type.
+    :param minify: remove the parameters having their default value.
+    :param options: compilation options, see
+        :py:func:`domapping.compiler.compile_schema`.
+    """
+    cache = ResolutionCache()
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        schema_id = None
+        try:
+            record = serialization.loads(line)
+            if not isinstance(record, dict):
+                raise JsonSchemaSupportError('Line is neither a JSON Schema '
+                                             'nor a schema envelope',
+                                             '<INPUT>')
+            line_type = mapping_type
+            if isinstance(record.get('schema'), dict):
+                line_type = record.get('mapping_type', mapping_type)
+                schema_id = record.get('id')
+                record = record['schema']
+            schema_id = schema_id or record.get('id')
+            if not schema_id:
+                raise JsonSchemaSupportError('JSON Schema does not contain '
+                                             'any \'id\' field', '<INPUT>')
+            if not isinstance(schema_id, string_types):
+                raise JsonSchemaSupportError('JSON Schema \'id\' should be '
+                                             'a string', '<INPUT>')
+            result = schema_to_mapping(record, schema_id, {}, config,
+                                       cache=cache, **options)
+            if minify:
+                result = minify_mapping(result, config.es_version)
+            if line_type is not None:
+                result = {'mappings': {line_type: result}}
+        except Exception as e:
+            # a malformed line should not stop the stream
+            record = error_record(e, schema_id or '<INPUT>')
+            record.update(line=line_number, id=schema_id)
+            result = {'error': record}
+        output.write(serialization.encode(result) + b'\n')
+        output.flush()
+
+
 @click.group()
 def cli():
     """CLI group."""
     pass  # pragma: no cover
 
 
-@cli.command('schema_to_mapping')
-@click.argument('schema', type=click.File('r'), default='-')
-@click.argument('output', type=click.File('w'), default='-')
-@click.option('--config', '-c',
-              type=click.Path(exists=True, dir_okay=False, file_okay=True),
-              help='Mapping generation configuration.')
-@click.option('--indent', '-i', default=4, type=click.INT,
-              help='Output json indentation step.')
-@click.option('--mapping-type', '-t',
-              help='ElasticSearch mapping type.')
-def schema_to_mapping_cli(schema, output, config, indent, mapping_type):
-    """Generate Elasticsearch mapping from JSON Schema."""
+_compact_option = click.option(
+    '--compact', is_flag=True,
+    help='Output json without indentation. Overrides --indent.')
+_format_option = click.option(
+    '--format', '-f', 'output_format', default='json',
+    type=click.Choice(serialization.FORMATS),
+    help='Output format. "gzip" is gzip compressed json.')
+
+
+def _recursion_options(command):
+    """Add the options controlling the mapping of recursive schemas."""
+    command = click.option(
+        '--max-recursion', default=0, type=click.IntRange(min=0),
+        help='Number of times a recursive reference is expanded before '
+        'applying the --recursion-policy.')(command)
+    return click.option(
+        '--recursion-policy', default='error',
+        type=click.Choice(RECURSION_POLICIES),
+        help='Handling of schemas referencing themselves: fail, ignore the '
+        'recursive reference, map it as a disabled object or as an object '
+        'without properties.')(command)
+
+
+def _projection_options(command):
+    """Add the options selecting the mapped fields."""
+    command = click.option(
+        '--exclude', multiple=True, metavar='PATH',
+        help='Dotted path pattern of fields which are not mapped, e.g. '
+        '"metadata.*.internal". "**" matches any number of fields.')(command)
+    return click.option(
+        '--include', multiple=True, metavar='PATH',
+        help='Dotted path pattern of the mapped fields. All fields are '
+        'mapped if no pattern is given.')(command)
+
+
+def _limit_options(command):
+    """Add the resource limit options, passed as a ``limits`` parameter."""
+    names = ('max_nodes', 'max_depth', 'max_fields', 'max_fetches',
+             'timeout')
+
+    @functools.wraps(command)
+    def wrapper(*args, **kwargs):
+        kwargs['limits'] = ResourceLimits(**{name: kwargs.pop(name)
+                                             for name in names})
+        return command(*args, **kwargs)
+
+    wrapper = click.option(
+        '--timeout', type=click.FloatRange(min=0),
+        help='Maximum duration of the compilation, in seconds.')(wrapper)
+    wrapper = click.option(
+        '--max-fetches', type=click.IntRange(min=0),
+        help='Maximum number of remote schemas retrieved.')(wrapper)
+    wrapper = click.option(
+        '--max-fields', type=click.IntRange(min=0),
+        help='Maximum number of generated fields.')(wrapper)
+    wrapper = click.option(
+        '--max-depth', type=click.IntRange(min=0),
+        help='Maximum nesting of schemas.')(wrapper)
+    return click.option(
+        '--max-nodes', type=click.IntRange(min=0),
+        help='Maximum number of visited schema nodes.')(wrapper)
+
+
+class _TargetType(click.ParamType):
+    """Target parameter of the form NAME=CONFIG_FILE."""
+
+    name = 'target'
+
+    def convert(self, value, param, ctx):
+        """Convert the parameter to a (name, configuration path) tuple."""
+        name, sep, path = value.partition('=')
+        if not name or not sep:
+            self.fail('"{}" is not of the form NAME=CONFIG'.format(value),
+                      param, ctx)
+        if not os.path.isfile(path):
+            self.fail('Configuration file "{}" does not exist.'.format(path),
+                      param, ctx)
+        return name, path
+
+
+def _load_config(presets, *paths):
+    """Create a mapping generation configuration.
+
+    :param presets: names of the presets loaded first.
+    :param paths: configuration files loaded in order. ``None`` values are
+        ignored.
+    """
+    config_instance = ElasticMappingGeneratorConfig()
+    config_instance.load({'presets': presets})
+    for path in paths:
+        if path:
+            with open(path) as conf:
+                config_instance.load(serialization.load(conf))
+    return config_instance
+
+
+def _load_schema(schema):
+    """Parse a JSON Schema and find its id.
+
+    :param schema: binary file object containing a json, or gzip compressed
+        json, schema.
+    :return: a tuple (parsed schema, schema id). The id defaults to the url
+        of the file.
+    """
     file_url = None
     if schema != sys.stdin and hasattr(schema, 'name'):
         assert os.path.isfile(schema.name)
         file_url = ('file://' +
                     urllib.request.pathname2url(os.path.abspath(schema.name)))
 
-    parsed_schema = json.load(schema)
+    parsed_schema = serialization.decode(schema.read())
 
     if 'id' not in parsed_schema and not file_url:
         raise JsonSchemaSupportError('JSON Schema does not contain any '
                                      '\'id\' field and input is not a file',
                                      '<INPUT>')
-    id = parsed_schema.get('id',
-                           file_url)
+    return parsed_schema, parsed_schema.get('id', file_url)
 
-    config_instance = ElasticMappingGeneratorConfig()
-    if config:
-        with open(config) as conf:
-            config_instance.load(json.load(conf))
 
-    mapping = schema_to_mapping(parsed_schema, id, {}, config_instance)
+@cli.command('schema_to_mapping')
+@click.argument('schema', type=click.File('rb'), default='-')
+@click.argument('output', type=click.File('wb'), default='-')
+@click.option('--config', '-c',
+              type=click.Path(exists=True, dir_okay=False, file_okay=True),
+              help='Mapping generation configuration.')
+@click.option('--indent', '-i', default=4, type=click.INT,
+              help='Output json indentation step.')
+@_compact_option
+@_format_option
+@click.option('--preset', 'presets', multiple=True,
+              type=click.Choice(sorted(PRESETS)),
+              help='Configuration preset loaded before the --config file. '
+              'Multiple presets are loaded in order.')
+@click.option('--mapping-type', '-t',
+              help='ElasticSearch mapping type.')
+@click.option('--ndjson', is_flag=True,
+              help='Read one JSON Schema, or one {"schema", "id", '
+              '"mapping_type"} object, per line and write one compact '
+              'mapping or error record per line.')
+@click.option('--processes', '-j', type=click.IntRange(min=0),
+              help='Map the top-level properties of the schema with a pool '
+              'of processes. 0 uses one process per CPU.')
+@click.option('--compiled', is_flag=True,
+              help='The input is a schema generated by compile_schema.')
+@click.option('--target', 'targets', multiple=True, type=_TargetType(),
+              help='NAME=CONFIG. Generate the mapping of each target, '
+              'configured by the --config file overridden by the CONFIG file, '
+              'in a {"NAME": mapping} object. The schema is compiled once '
+              'for all targets.')
+@click.option('--stream', is_flag=True,
+              help='Write the mapping while generating it instead of '
+              'building it in memory first. Only the json format is '
+              'supported.')
+@click.option('--field-budget', type=click.IntRange(min=0),
+              help='Maximum number of fields of the mapping. The least '
+              'important objects are mapped as disabled objects, which are '
+              'stored but not indexed, and reported on stderr.')
+@click.option('--budget-priority', default='depth',
+              type=click.Choice(BUDGET_PRIORITIES),
+              help='Importance of the objects kept in the --field-budget: '
+              'closest to the root, or highest "x-domapping" "priority" '
+              'annotation.')
+@click.option('--keep', multiple=True, metavar='PATH',
+              help='Dotted path pattern of fields kept first in the '
+              '--field-budget.')
+@click.option('--index', 'index_body', is_flag=True,
+              help='Write the index body, "settings" and "mappings", with '
+              'the sort and routing settings of the root schema\'s '
+              '"x-domapping" "index" annotation.')
+@click.option('--settings',
+              type=click.Path(exists=True, dir_okay=False, file_okay=True),
+              help='Index settings completed by the annotated ones. Implies '
+              '--index.')
+@click.option('--minify', is_flag=True,
+              help='Remove the parameters having the default value of the '
+              'configured elasticsearch version.')
+@_recursion_options
+@_limit_options
+@_projection_options
+def schema_to_mapping_cli(schema, output, config, indent, compact,
+                          output_format, presets, mapping_type, ndjson,
+                          processes, compiled, targets, stream,
+                          field_budget, budget_priority, keep, index_body,
+                          settings, minify, recursion_policy, max_recursion,
+                          limits, include, exclude):
+    """Generate Elasticsearch mapping from JSON Schema."""
+    options = dict(recursion_policy=recursion_policy,
+                   max_recursion=max_recursion, limits=limits,
+                   include=include, exclude=exclude)
+    config_instance = _load_config(presets, config)
+
+    if ndjson:
+        if output_format != 'json':
+            raise click.UsageError('--ndjson only supports the json format.')
+        if (field_budget is not None or index_body or settings or
+                targets or stream or processes is not None or compiled):
+            raise click.UsageError('--field-budget, --index, --settings, '
+                                   '--target, --stream, --processes and '
+                                   '--compiled cannot be used with '
+                                   '--ndjson.')
+        _ndjson_schemas_to_mappings(schema, output, config_instance,
+                                    mapping_type, minify, **options)
+        return
+
+    if compiled and processes is not None:
+        raise click.UsageError('--compiled cannot be used with --processes.')
+    parsed_schema, id = _load_schema(schema)
+    if compiled and (include or exclude):
+        # select the fields of the compiled schema
+        parsed_schema = compile_schema(parsed_schema, id, {}, include=include,
+                                       exclude=exclude)
+    if field_budget is not None:
+        if processes is not None:
+            raise click.UsageError('--field-budget cannot be used with '
+                                   '--processes.')
+        if not compiled:
+            parsed_schema = compile_schema(parsed_schema, id, {}, **options)
+            compiled = True
+        parsed_schema, disabled = apply_field_budget(
+            parsed_schema, field_budget, priority=budget_priority, keep=keep,
+            config=config_instance)
+        for path in disabled:
+            click.echo('Disabled object field "{}".'.format(path), err=True)
+
+    if index_body or settings:
+        if stream or processes is not None or targets:
+            raise click.UsageError('--index cannot be used with --stream, '
+                                   '--processes or --target.')
+        if not compiled:
+            parsed_schema = compile_schema(parsed_schema, id, {}, **options)
+        index_settings = None
+        if settings:
+            with open(settings) as settings_file:
+                index_settings = serialization.load(settings_file)
+        body = compiled_schema_to_index(parsed_schema, config_instance,
+                                        index_settings)
+        if minify:
+            body['mappings'] = minify_mapping(body['mappings'],
+                                              config_instance.es_version)
+        if mapping_type is not None:
+            body['mappings'] = {mapping_type: body['mappings']}
+        _dump_mapping(body, output, indent, compact, output_format)
+        return
+
+    if stream:
+        if (output_format != 'json' or processes is not None or targets or
+                minify):
+            raise click.UsageError('--stream only supports the json format '
+                                   'and cannot be used with --processes, '
+                                   '--target or --minify.')
+        if compiled:
+            events = iter_compiled_mapping_events(parsed_schema,
+                                                  config_instance)
+        else:
+            events = iter_mapping_events(parsed_schema, id, {},
+                                         config_instance, **options)
+        wrappers = ()
+        if mapping_type is not None:
+            wrappers = ('mappings', mapping_type)
+        dump_events(events, output, indent=None if compact else indent,
+                    wrappers=wrappers)
+        return
+
+    if targets:
+        if processes is not None:
+            raise click.UsageError('--target cannot be used with '
+                                   '--processes.')
+        if not compiled:
+            parsed_schema = compile_schema(parsed_schema, id, {}, **options)
+        mappings = {}
+        for name, target_config in targets:
+            target_instance = _load_config(presets, config, target_config)
+            mappings[name] = compiled_schema_to_mapping(parsed_schema,
+                                                        target_instance)
+            if minify:
+                mappings[name] = minify_mapping(mappings[name],
+                                                target_instance.es_version)
+            if mapping_type is not None:
+                mappings[name] = {'mappings': {mapping_type: mappings[name]}}
+        _dump_mapping(mappings, output, indent, compact, output_format)
+        return
+
+    if compiled:
+        mapping = compiled_schema_to_mapping(parsed_schema, config_instance)
+    elif processes is not None:
+        mapping = parallel_schema_to_mapping(parsed_schema, id, {},
+                                             config_instance,
+                                             processes=processes or None,
+                                             **options)
+    else:
+        mapping = schema_to_mapping(parsed_schema, id, {}, config_instance,
+                                    **options)
+    if minify:
+        mapping = minify_mapping(mapping, config_instance.es_version)
     if mapping_type is not None:
         mapping = {
             'mappings': {
                 mapping_type: mapping
             }
         }
-    json.dump(mapping, output, indent=indent)
+    _dump_mapping(mapping, output, indent, compact, output_format)
+
+
+@cli.command('compile_schema')
+@click.argument('schema', type=click.File('rb'), default='-')
+@click.argument('output', type=click.File('wb'), default='-')
+@click.option('--indent', '-i', default=4, type=click.INT,
+              help='Output json indentation step.')
+@_compact_option
+@_format_option
+@_recursion_options
+@_limit_options
+@_projection_options
+def compile_schema_cli(schema, output, indent, compact, output_format,
+                       recursion_policy, max_recursion, limits, include,
+                       exclude):
+    """Compile a JSON Schema for schema_to_mapping --compiled."""
+    parsed_schema, id = _load_schema(schema)
+    compiled = compile_schema(parsed_schema, id, {},
+                              recursion_policy=recursion_policy,
+                              max_recursion=max_recursion, limits=limits,
+                              include=include, exclude=exclude)
+    _dump_mapping(compiled, output, indent, compact, output_format)
+
+
+@cli.command('analyze')
+@click.argument('mapping', type=click.File('rb'), default='-')
+@click.argument('output', type=click.File('wb'), default='-')
+@click.option('--indent', '-i', default=4, type=click.INT,
+              help='Output json indentation step.')
+@click.option('--total-fields-limit', type=click.IntRange(min=0),
+              default=DEFAULT_LIMITS['total_fields'],
+              help='Maximum number of fields, objects and multi-fields '
+              'included.')
+@click.option('--depth-limit', type=click.IntRange(min=0),
+              default=DEFAULT_LIMITS['depth'],
+              help='Maximum depth of the fields.')
+@click.option('--nested-fields-limit', type=click.IntRange(min=0),
+              default=DEFAULT_LIMITS['nested_fields'],
+              help='Maximum number of "nested" fields.')
+@click.option('--size-limit', type=click.IntRange(min=0),
+              help='Maximum size of the compact json mapping, in bytes.')
+@click.option('--subtrees', default=10, type=click.IntRange(min=0),
+              help='Number of reported largest objects.')
+@click.pass_context
+def analyze_cli(ctx, mapping, output, indent, total_fields_limit, depth_limit,
+                nested_fields_limit, size_limit, subtrees):
+    """Report the size of Elasticsearch mappings and check their limits.
+
+    The exit status is 1 if a mapping exceeds a limit.
+    """
+    limits = {
+        'total_fields': total_fields_limit,
+        'depth': depth_limit,
+        'nested_fields': nested_fields_limit,
+        'size': size_limit,
+    }
+    document = serialization.decode(mapping.read())
+    type_mappings = document.get('mappings', document)
+    if 'properties' in type_mappings:
+        analysis = analyze_mapping(type_mappings, limits)
+        report = analysis.to_dict(subtrees)
+        exceeded = bool(analysis.violations)
+    else:
+        # one mapping per type
+        report = {}
+        exceeded = False
+        for mapping_type, type_mapping in type_mappings.items():
+            analysis = analyze_mapping(type_mapping, limits)
+            report[mapping_type] = analysis.to_dict(subtrees)
+            exceeded = exceeded or bool(analysis.violations)
+    _dump_mapping(report, output, indent, False, 'json')
+    if exceeded:
+        ctx.exit(1)
+
+
+@cli.command('lint')
+@click.argument('directory',
+                type=click.Path(exists=True, dir_okay=True, file_okay=False))
+@click.argument('output', type=click.File('wb'), default='-')
+@click.option('--config', '-c',
+              type=click.Path(exists=True, dir_okay=False, file_okay=True),
+              help='Mapping generation configuration.')
+@click.option('--preset', 'presets', multiple=True,
+              type=click.Choice(sorted(PRESETS)),
+              help='Configuration preset loaded before the --config file.')
+@click.option('--pattern', default='*.json',
+              help='File name pattern of the schemas.')
+@click.option('--processes', '-j', default=0, type=click.IntRange(min=0),
+              help='Number of worker processes. 0 uses one process per CPU.')
+@click.option('--indent', '-i', default=4, type=click.INT,
+              help='Output json indentation step.')
+@_recursion_options
+@_limit_options
+@click.pass_context
+def lint_cli(ctx, directory, output, config, presets, pattern, processes,
+             indent, recursion_policy, max_recursion, limits):
+    """Report every unsupported field of a directory of JSON Schemas.
+
+    Schemas of the directory can reference each other by id. The report
+    contains the errors of each failing schema, relative to the directory.
+    The exit status is 1 if a schema has errors.
+    """
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        paths.extend(os.path.join(root, name)
+                     for name in sorted(fnmatch.filter(files, pattern)))
+    results = lint_files(paths, _load_config(presets, config),
+                         context_schemas=load_corpus(paths),
+                         processes=processes or None,
+                         recursion_policy=recursion_policy,
+                         max_recursion=max_recursion, limits=limits)
+    failures = {}
+    for path, errors in results.items():
+        if errors:
+            name = os.path.relpath(path, directory).replace(os.sep, '/')
+            failures[name] = errors
+    report = {
+        'schemas': len(paths),
+        'errors': sum(len(errors) for errors in failures.values()),
+        'failures': failures,
+    }
+    _dump_mapping(report, output, indent, False, 'json')
+    if failures:
+        ctx.exit(1)
 
 
 @cli.command('mapping_to_jinja')
@@ -94,7 +569,7 @@ def schema_to_mapping_cli(schema, output, config, indent, mapping_type):
 def mapping_to_jinja_cli(mapping, output, indent, mapping_type):
     """Generate jinja template from Elasticsearch mapping."""
     default_type = 'type'
-    parsed_mapping = json.load(mapping)
+    parsed_mapping = serialization.load(mapping)
 
     if 'mappings' in parsed_mapping:
         n_mappings = len(parsed_mapping['mappings'])
@@ -124,7 +599,7 @@ def mapping_to_jinja_cli(mapping, output, indent, mapping_type):
 
 @cli.command('jinja_to_mapping')
 @click.argument('template', type=click.File('r'), default='-')
-@click.argument('output', type=click.File('w'), default='-')
+@click.argument('output', type=click.File('wb'), default='-')
 @click.option('--context_path', multiple=True,
               help='Context templates. It can either be a directory ' +
               'containing jinja files or a jinja file.',
@@ -135,9 +610,11 @@ def mapping_to_jinja_cli(mapping, output, indent, mapping_type):
               type=click.Tuple([click.STRING, click.STRING]))
 @click.option('--indent', '-i', default=4, type=click.INT,
               help='Output template indentation step.')
+@_compact_option
+@_format_option
 def jinja_to_mapping_cli(template, output, context_path, context_package,
-                         indent):
+                         indent, compact, output_format):
     """Generate Elasticsearch mapping from jinja import templates."""
     result = jinja_to_mapping(template.read(), context_path, context_package)
     # dump the mapping to the output
-    json.dump(result, output, indent=indent)
+    _dump_mapping(result, output, indent, compact, output_format)
@@ -0,0 +1,748 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of DoMapping.
+# Copyright (C) 2015, 2016 CERN.
+#
+# DoMapping is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# DoMapping is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DoMapping; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Compilation of JSON Schemas into configuration independent schemas."""
+
+import jsonschema
+from six import integer_types, iteritems, string_types
+from six.moves.urllib.parse import urldefrag
+
+from .errors import JsonSchemaSupportError, ResourceLimitError, \
+    SchemaRecursionError, UnknownFieldTypeError
+from .limits import ResourceLimits, clock
+from .projection import SKIP, Projection
+from .resolver import SchemaResolver
+
+_collection_keys = frozenset(['allOf', 'anyOf', 'oneOf'])
+
+# keyword -> (accepted types, error message) of the keywords checked before
+# compiling a schema
+_checked_keywords = {
+    'properties': (dict, '"properties" should be an object.'),
+    'dependencies': (dict, '"dependencies" should be an object.'),
+    'patternProperties': (dict, '"patternProperties" should be an object.'),
+    'additionalProperties': (
+        (bool, dict),
+        '"additionalProperties" should be a boolean or a schema.'),
+    'allOf': (list, '"allOf" should be an array.'),
+    'anyOf': (list, '"anyOf" should be an array.'),
+    'oneOf': (list, '"oneOf" should be an array.'),
+    'enum': (list, '"enum" should be an array.'),
+    'items': ((dict, list), '"items" should be a schema or an array of '
+              'schemas.'),
+}
+
+# json types mapped to elasticsearch types
+_json_types = frozenset(['object', 'array', 'string', 'number', 'integer',
+                         'boolean'])
+
+# vendor keywords merged in compiled objects
+_object_annotations = ('x-domapping', 'x-elasticsearch')
+
+# errors of a property collected when compiling with an errors list
+_collected_errors = (JsonSchemaSupportError, UnknownFieldTypeError,
+                     jsonschema.RefResolutionError)
+
+RECURSION_POLICIES = ('error', 'truncate', 'disable', 'object')
+"""What to do when a schema references itself, see :py:func:`compile_schema`.
+"""
+
+# keywords which are not copied in compiled fields
+_structural_keys = frozenset([
+    '$ref', '$schema', 'id', 'definitions', 'title', 'description',
+    'default', 'allOf', 'anyOf', 'oneOf', 'not', 'items', 'additionalItems',
+    'minItems', 'maxItems', 'uniqueItems', 'properties', 'patternProperties',
+    'additionalProperties', 'dependencies', 'required', 'minProperties',
+    'maxProperties',
+])
+
+
+def compile_schema(json_schema, base_uri, context_schemas, resolver=None,
+                   cache=None, recursion_policy='error', max_recursion=0,
+                   limits=None, include=None, exclude=None, errors=None):
+    """Compile a json schema into a normalized schema.
+
+    The compiled schema is the part of the mapping generation which does not
+    depend on the :py:class:`domapping.mapping.ElasticMappingGeneratorConfig`:
+    references are resolved, "allOf", "anyOf" and "oneOf" collections and
+    schema dependencies are merged, field types are guessed from enums and
+    arrays are replaced by their items.
+
+    The result is a plain JSON Schema, which can be serialized and cached,
+    with the "id" of the root schema and only three kinds of nodes:
+
+    * objects: ``{"type": "object", "properties": {...}}``.
+    * fields: ``{"type": "string", ...}`` with the other keywords of the
+      field schema, for example "format" or "enum".
+    * ``{"allOf": [...]}`` for fields defined multiple times with different
+      schemas. Their compatibility depends on the configuration and is
+      checked when generating the mapping. Each definition keeps the json
+      path of its schema in an ``"x-domapping": {"path": ...}`` annotation,
+      reported by the errors of the mapping generation.
+
+    Objects whose content is stored but not indexed have an additional
+    ``"enabled": false`` keyword. Objects accepting other properties than
+    their "properties" keep their "patternProperties", whose schemas are
+    compiled, and their "additionalProperties", either a boolean or a
+    compiled schema. The "x-domapping" and "x-elasticsearch"
+    annotations of the definitions of an object are merged in the compiled
+    object. Fields with a string or integer enum have an
+    ``"x-domapping": {"enum": {...}}`` summary of its values, see
+    :py:func:`_analyze_enum`.
+
+    Compiling a compiled schema gives the same schema.
+
+    Recursive schemas, i.e. schemas whose references lead back to
+    themselves, are detected on the path of resolved references. Once a
+    reference is being expanded ``max_recursion`` times inside itself, the
+    ``recursion_policy`` applies:
+
+    * "error": raise a :py:class:`domapping.errors.SchemaRecursionError`.
+    * "truncate": ignore the reference.
+    * "disable": map the field as an object which is not indexed.
+    * "object": map the field as an object without any property.
+
+    The work done is bounded by the optional ``limits``. Exceeding one of
+    them raises a :py:class:`domapping.errors.ResourceLimitError`.
+
+    The ``include`` and ``exclude`` patterns select the compiled fields, see
+    :py:mod:`domapping.projection`. Subtrees which do not contain any
+    selected field are not compiled at all.
+
+    :param json_schema: json schema to compile.
+    :param base_uri: json path pointing to the given json_schema.
+    :param context_schemas: dict of schema_id -> schema used to resolve
+        references.
+    :param resolver: see :py:func:`domapping.mapping.schema_to_mapping`.
+    :param cache: see :py:func:`domapping.mapping.schema_to_mapping`.
+    :param recursion_policy: one of :py:data:`RECURSION_POLICIES`.
+    :param max_recursion: number of times a recursive reference is expanded
+        before applying the ``recursion_policy``.
+    :param limits: :py:class:`domapping.limits.ResourceLimits`.
+    :param include: list of path patterns of the selected fields. Every
+        field is selected when it is empty or ``None``.
+    :param exclude: list of path patterns of the fields which are not
+        selected.
+    :param errors: list collecting the (property path, error) tuples of
+        the properties which cannot be compiled, which are then skipped,
+        instead of raising the first error. Resource limits and errors of
+        the root schema are still raised.
+    :return: the compiled schema.
+    """
+    if resolver is None:
+        resolver = SchemaResolver(referrer=json_schema, store=context_schemas,
+                                  base_uri=base_uri, cache=cache)
+    else:
+        resolver.store.update(context_schemas)
+        resolver.store[urldefrag(base_uri)[0]] = json_schema
+    context = _CompilationContext(resolver, recursion_policy, max_recursion,
+                                  limits, include, exclude, errors)
+    # the root document is being expanded, as referenced schemas are
+    root_url = urldefrag(base_uri)[0]
+    context.ref_counts[root_url] = 1
+    context.ref_stack.append(root_url)
+    resolver.push_scope(base_uri)
+    try:
+        compiled = {'id': base_uri}
+        compiled.update(_compile_node(json_schema, base_uri, context, {}))
+        return compiled
+    finally:
+        resolver.pop_scope()
+
+
+class _CompilationContext(object):
+    """State of a schema compilation."""
+
+    # number of visited nodes between two checks of the timeout
+    timeout_check_interval = 256
+
+    def __init__(self, resolver, recursion_policy='error', max_recursion=0,
+                 limits=None, include=None, exclude=None, errors=None):
+        """Constructor.
+
+        :param resolver: jsonschema resolver used to retrieve referenced
+            schemas.
+        :param recursion_policy: see :py:func:`compile_schema`.
+        :param max_recursion: see :py:func:`compile_schema`.
+        :param limits: see :py:func:`compile_schema`.
+        :param include: see :py:func:`compile_schema`.
+        :param exclude: see :py:func:`compile_schema`.
+        :param errors: see :py:func:`compile_schema`.
+        """
+        if recursion_policy not in RECURSION_POLICIES:
+            raise ValueError('Unknown recursion policy "{}".'.format(
+                recursion_policy))
+        self.resolver = resolver
+        self.errors = errors
+        self.recursion_policy = recursion_policy
+        self.max_recursion = max_recursion
+        # references being expanded, from the root to the current schema
+        self.ref_stack = []
+        # reference url -> number of times it is in ref_stack
+        self.ref_counts = {}
+        # id(enum) -> (enum, enum summary) of the analyzed enums. Huge enums
+        # are often shared by many fields through references.
+        self.enums = {}
+        # id(node) -> json path of the first definition of a compiled node,
+        # annotated when the node gets other definitions
+        self.paths = {}
+        # selected fields and projection state of the current field
+        self.projection = None
+        self.selection = None
+        if include or exclude:
+            self.projection = Projection(include, exclude)
+            self.selection = self.projection.root()
+
+        # resource usage
+        self.nodes = 0
+        self.depth = 0
+        self.fields = 0
+        self.start = clock()
+        self.start_fetches = getattr(resolver, 'remote_fetches', 0)
+        # unset limits are infinite so that checking them is a comparison
+        self.limits = limits or ResourceLimits()
+        self.max_nodes = _limit(self.limits.max_nodes)
+        self.max_depth = _limit(self.limits.max_depth)
+        self.max_fields = _limit(self.limits.max_fields)
+        self.max_fetches = _limit(self.limits.max_fetches)
+        self.deadline = _UNLIMITED
+        if self.limits.timeout is not None:
+            self.deadline = self.start + self.limits.timeout
+        # number of visited nodes at which check_nodes must be called
+        self.next_check = 0
+        self.check_nodes('#')
+
+    def check_nodes(self, path):
+        """Check the number of visited nodes and the timeout.
+
+        :param path: json path of the current schema. Used for debug.
+        """
+        if self.nodes > self.max_nodes:
+            self.limit_exceeded('max_nodes', path)
+        self.next_check = self.max_nodes + 1
+        if self.deadline != _UNLIMITED:
+            if clock() > self.deadline:
+                self.limit_exceeded('timeout', path)
+            self.next_check = min(self.next_check,
+                                  self.nodes + self.timeout_check_interval)
+
+    def check_fetches(self, path):
+        """Check the number of remote documents retrieved by the resolver.
+
+        :param path: json path of the current reference. Used for debug.
+        """
+        if (getattr(self.resolver, 'remote_fetches', 0) - self.start_fetches >
+                self.max_fetches):
+            self.limit_exceeded('max_fetches', path)
+
+    def limit_exceeded(self, limit, path):
+        """Raise a :py:class:`domapping.errors.ResourceLimitError`.
+
+        :param limit: name of the exceeded limit.
+        :param path: json path of the current schema. Used for debug.
+        """
+        counters = {
+            'nodes': self.nodes,
+            'depth': self.depth,
+            'fields': self.fields,
+            'fetches': (getattr(self.resolver, 'remote_fetches', 0) -
+                        self.start_fetches),
+            'seconds': clock() - self.start,
+        }
+        raise ResourceLimitError('Resource limit {}={} exceeded.'.format(
+            limit, getattr(self.limits, limit)), path, limit, counters)
+
+
+_UNLIMITED = float('inf')
+
+
+def _limit(value):
+    """Return a limit value, infinite if it is None."""
+    return _UNLIMITED if value is None else value
+
+
+def _compile_node(json_schema, path, context, node):
+    """Compile a json schema into a node of a compiled schema.
+
+    The compilation is recursive.
+
+    :param json_schema: json schema to compile.
+    :param path: json path pointing to the given json_schema. Used for debug.
+    :param context: :py:class:`_CompilationContext`.
+    :param node: compiled node corresponding to the given schema. It is
+        necessary as multiple paths in the json schema may point to the same
+        field.
+    :return: the compiled node.
+    """
+    if not isinstance(json_schema, dict):
+        raise JsonSchemaSupportError('Schema should be an object.', path)
+    if not isinstance(json_schema.get('id', ''), string_types):
+        raise JsonSchemaSupportError('"id" should be a string.', path)
+    resolver = context.resolver
+    has_scope = 'id' in json_schema
+    # update the current scope if the schema has an id
+    if has_scope:
+        resolver.push_scope(json_schema.get('id'))
+    refs = []
+    context.nodes += 1
+    context.depth += 1
+    try:
+        if context.nodes >= context.next_check:
+            context.check_nodes(path)
+        if context.depth > context.max_depth:
+            context.limit_exceeded('max_depth', path)
+        # resolve reference if there are any, checking for recursion
+        while '$ref' in json_schema:
+            if not isinstance(json_schema['$ref'], string_types):
+                raise JsonSchemaSupportError('"$ref" should be a string.',
+                                             path)
+            path = json_schema['$ref']
+            url, json_schema = resolver.resolve(path)
+            if not isinstance(json_schema, dict):
+                raise JsonSchemaSupportError('Schema should be an object.',
+                                             path)
+            if context.max_fetches != _UNLIMITED:
+                context.check_fetches(path)
+            count = context.ref_counts.get(url, 0)
+            if count > context.max_recursion:
+                return _compile_recursion(url, path, context, node)
+            context.ref_counts[url] = count + 1
+            context.ref_stack.append(url)
+            refs.append(url)
+            # references of the resolved schema are relative to its url
+            resolver.push_scope(url)
+        return _compile_scoped_node(json_schema, path, context, node)
+    finally:
+        context.depth -= 1
+        for url in refs:
+            resolver.pop_scope()
+            context.ref_stack.pop()
+            context.ref_counts[url] -= 1
+        # pop the current jsonschema context
+        if has_scope:
+            resolver.pop_scope()
+
+
+def _compile_recursion(url, path, context, node):
+    """Apply the recursion policy to a recursive reference.
+
+    :param url: resolved url of the recursive reference.
+    :param path: json path of the reference. Used for debug.
+    :param context: :py:class:`_CompilationContext`.
+    :param node: compiled node corresponding to the reference.
+    :return: the compiled node.
+    """
+    if context.recursion_policy == 'error':
+        start = context.ref_stack.index(url)
+        cycle = context.ref_stack[start:] + [url]
+        raise SchemaRecursionError('Recursive schema reference cycle ' +
+                                   ' -> '.join(cycle) + ' is not supported.',
+                                   path, cycle)
+    elif context.recursion_policy == 'disable':
+        _object_node(node, path, context)['enabled'] = False
+    elif context.recursion_policy == 'object':
+        _object_node(node, path, context)
+    return node
+
+
+def _compile_scoped_node(json_schema, path, context, node):
+    """Compile a resolved schema once its resolution scope is set.
+
+    See :py:func:`_compile_node` for the parameters.
+    """
+    collection_key = _check_schema(json_schema, path)
+
+    # if the schema is in fact a collection of schemas, merge them
+    if collection_key is not None:
+        # we suppose the schema is valid and only one of the collection keys
+        # is present. Visit each schema and use it to extend the current node
+        path += '/' + collection_key
+        index = 0
+        for sub_schema in json_schema.get(collection_key):
+            _compile_node(sub_schema, path + '[' + str(index) + ']',
+                          context, node)
+            index += 1
+        return node
+
+    enum = json_schema.get('enum')
+    enum_summary = None
+    if enum:
+        enum_summary = _analyze_enum(enum, path, context)
+
+    # get json schema type
+    json_type = json_schema.get('type')
+
+    if not json_type:
+        if 'properties' in json_schema:
+            json_type = 'object'
+        elif 'enum' in json_schema:
+            json_type = _guess_enum_type(json_schema['enum'], path,
+                                         enum_summary)
+        else:
+            raise UnknownFieldTypeError(
+                'Schema field type cannot be guessed. Only fields with "type"'
+                ' defined or with an "enum" array of strings are supported',
+                path)
+
+    if isinstance(json_type, list):
+        raise JsonSchemaSupportError('Schema with array of types are ' +
+                                     'not supported', path)
+    if json_type not in _json_types:
+        raise JsonSchemaSupportError('Schema type "{}" is not '
+                                     'supported.'.format(json_type), path)
+
+    if json_type == 'array':
+        items = json_schema.get('items')
+        # array items type is mandatory
+        if not items:
+            raise JsonSchemaSupportError('Cannot have schema with ' +
+                                         '"array" type without ' +
+                                         'specifying the items type',
+                                         path)
+        # visit each item schema and use it to extend the current node
+        path += '/items'
+        if isinstance(items, list):
+            index = 0
+            for item in items:
+                _compile_node(item, path + '[' + str(index) + ']',
+                              context, node)
+                index += 1
+            return node
+        else:
+            return _compile_node(items, path, context, node)
+
+    if json_type == 'object':
+        object_node = _object_node(node, path, context)
+        if json_schema.get('enabled') is False:
+            object_node['enabled'] = False
+        for key in _object_annotations:
+            if isinstance(json_schema.get(key), dict):
+                annotation = dict(object_node.get(key, {}))
+                annotation.update(json_schema[key])
+                object_node[key] = annotation
+        properties = object_node['properties']
+        for prop, prop_schema in iteritems(json_schema.get('properties',
+                                                           {})):
+            _compile_property(prop, prop_schema, path + '/' + prop, context,
+                              properties)
+        for pattern, pattern_schema in iteritems(
+                json_schema.get('patternProperties', {})):
+            patterns = object_node.setdefault('patternProperties', {})
+            pattern_node = _compile_node(
+                pattern_schema, path + '/patternProperties[' + pattern + ']',
+                context, patterns.get(pattern, {}))
+            if pattern_node:
+                patterns[pattern] = pattern_node
+        if 'additionalProperties' in json_schema:
+            _compile_additional(json_schema['additionalProperties'],
+                                path + '/additionalProperties', context,
+                                object_node)
+        # visit the dependencies defining additional properties
+        if 'dependencies' in json_schema:
+            deps_path = path + '/dependencies'
+            for prop, deps in iteritems(json_schema['dependencies']):
+                # if this is a "schema dependency", extend the current node
+                # with it
+                if isinstance(deps, dict):
+                    _compile_node(deps, deps_path + '[' + prop + ']',
+                                  context, node)
+    else:
+        field = {'type': json_type}
+        for key in json_schema:
+            if key not in _structural_keys and key != 'type':
+                field[key] = json_schema[key]
+        if enum_summary is not None and enum_summary['type'] is not None:
+            annotation = dict(field.get('x-domapping') or {})
+            annotation['enum'] = enum_summary
+            field['x-domapping'] = annotation
+        _add_field(node, field, path, context)
+    return node
+
+
+def _compile_additional(additional, path, context, object_node):
+    """Compile the "additionalProperties" of an object.
+
+    The definitions of an object are merged, the most permissive one
+    winning: ``true``, then schemas, then ``false``.
+
+    :param additional: "additionalProperties" value.
+    :param path: json path pointing to the given value.
+    :param context: :py:class:`_CompilationContext`.
+    :param object_node: compiled object.
+    """
+    current = object_node.get('additionalProperties')
+    if additional == {}:
+        # any value is accepted
+        additional = True
+    if additional is True or current is True:
+        object_node['additionalProperties'] = True
+    elif additional is False:
+        if current is None:
+            object_node['additionalProperties'] = False
+    else:
+        additional_node = _compile_node(
+            additional, path, context,
+            current if isinstance(current, dict) else {})
+        # truncated recursive schemas have no definition
+        if additional_node:
+            object_node['additionalProperties'] = additional_node
+
+
+def _compile_property(prop, prop_schema, path, context, properties):
+    """Compile the schema of a property into the properties of an object.
+
+    :param prop: name of the property.
+    :param prop_schema: json schema of the property.
+    :param path: json path pointing to the given prop_schema.
+    :param context: :py:class:`_CompilationContext`.
+    :param properties: compiled properties of the object.
+    """
+    selection = context.selection
+    if context.projection is not None:
+        context.selection = context.projection.child(selection, prop)
+        if context.selection is SKIP:
+            context.selection = selection
+            return
+    try:
+        is_new = prop not in properties
+        if is_new:
+            context.fields += 1
+            if context.fields > context.max_fields:
+                context.limit_exceeded('max_fields', path)
+        try:
+            prop_node = _compile_node(prop_schema, path, context,
+                                      properties.get(prop, {}))
+        except _collected_errors as e:
+            if context.errors is None:
+                raise
+            context.errors.append((path, e))
+            if is_new:
+                context.fields -= 1
+            return
+        if (context.projection is not None and
+                context.projection.is_partial(context.selection)):
+            _prune_partial(prop_node)
+        # truncated recursive properties have no definition
+        if prop_node:
+            properties[prop] = prop_node
+        elif is_new:
+            context.fields -= 1
+    finally:
+        context.selection = selection
+
+
+def _prune_partial(node):
+    """Remove the definitions of a partially selected field without content.
+
+    Only objects containing selected properties are kept.
+    """
+    def has_content(definition):
+        return (definition.get('type') == 'object' and
+                bool(definition['properties']))
+
+    definitions = [definition for definition in node.get('allOf', [node])
+                   if has_content(definition)]
+    if len(definitions) == 1:
+        definitions = definitions[0]
+    elif definitions:
+        definitions = {'allOf': definitions}
+    else:
+        definitions = {}
+    if definitions is not node:
+        node.clear()
+        node.update(definitions)
+
+
+def _alternatives(node, context):
+    """Return the list of definitions of a field defined multiple times.
+
+    The node is converted to an "allOf" node if needed.
+    """
+    if 'allOf' not in node:
+        definition = _with_path(dict(node), context.paths.get(id(node)))
+        node.clear()
+        node['allOf'] = [definition]
+    return node['allOf']
+
+
+def _with_path(definition, path):
+    """Annotate a definition with the json path of its schema.
+
+    Definitions compiled before keep their path.
+
+    :return: the given definition.
+    """
+    annotation = definition.get('x-domapping')
+    if not isinstance(annotation, dict):
+        annotation = {}
+    if path is not None and 'path' not in annotation:
+        definition['x-domapping'] = dict(annotation, path=path)
+    return definition
+
+
+def _without_path(definition):
+    """Return a definition without its json path annotation."""
+    annotation = definition.get('x-domapping')
+    if not isinstance(annotation, dict) or 'path' not in annotation:
+        return definition
+    definition = dict(definition)
+    annotation = dict(annotation)
+    del annotation['path']
+    if annotation:
+        definition['x-domapping'] = annotation
+    else:
+        del definition['x-domapping']
+    return definition
+
+
+def _object_node(node, path, context):
+    """Return the object definition of a node, creating it if needed.
+
+    :param node: compiled node.
+    :param path: json path of the object schema.
+    :param context: :py:class:`_CompilationContext`.
+    """
+    if not node:
+        node['type'] = 'object'
+        node['properties'] = {}
+        context.paths[id(node)] = path
+        return node
+    if node.get('type') == 'object':
+        return node
+    alternatives = _alternatives(node, context)
+    for alternative in alternatives:
+        if alternative.get('type') == 'object':
+            return alternative
+    alternative = _with_path({'type': 'object', 'properties': {}}, path)
+    alternatives.append(alternative)
+    return alternative
+
+
+def _add_field(node, field, path, context):
+    """Add the definition of a field to a node.
+
+    :param node: compiled node.
+    :param field: compiled definition of the field.
+    :param path: json path of the field schema.
+    :param context: :py:class:`_CompilationContext`.
+    """
+    if not node:
+        node.update(field)
+        context.paths[id(node)] = path
+    elif 'allOf' in node or _without_path(node) != _without_path(field):
+        alternatives = _alternatives(node, context)
+        if _without_path(alternatives[-1]) != _without_path(field):
+            alternatives.append(_with_path(field, path))
+
+
+def _check_schema(json_schema, path):
+    """Check that a resolved schema is supported.
+
+    Only the keywords of the schema itself are checked, its subschemas are
+    checked when they are compiled. The keywords are visited once, as this
+    is done for every node of the schema.
+
+    :param json_schema: json schema.
+    :param path: json path pointing to the given json_schema.
+    :return: the collection keyword of the schema, "allOf", "anyOf" or
+        "oneOf", or ``None``.
+    """
+    collection_key = None
+    for key in json_schema:
+        checked = _checked_keywords.get(key)
+        if checked is not None:
+            if not isinstance(json_schema[key], checked[0]):
+                raise JsonSchemaSupportError(checked[1], path)
+            if key in _collection_keys:
+                collection_key = key
+    return collection_key
+
+
+def _analyze_enum(enum_array, path, context):
+    """Summarize the values of an enum.
+
+    Each enum array is analyzed once per compilation.
+
+    :param enum_array: values of the enum.
+    :param path: json path of the enum. Used for debug.
+    :param context: :py:class:`_CompilationContext` of the compilation.
+    :return: a dict with the "type" of the values, "string", "integer" or
+        ``None`` if the values have mixed types, and their "count". Integer
+        enums also have a "minimum" and a "maximum".
+    """
+    cached = context.enums.get(id(enum_array))
+    if cached is not None:
+        return cached[1]
+    # enum values are visited to guess the type and to check them
+    context.nodes += len(enum_array)
+    if context.nodes >= context.next_check:
+        context.check_nodes(path)
+
+    first = enum_array[0]
+    if isinstance(first, string_types):
+        value_types = string_types
+    elif isinstance(first, integer_types):
+        value_types = integer_types
+    else:
+        value_types = None
+    if value_types is not None:
+        for value in enum_array:
+            if not isinstance(value, value_types):
+                # stop at the first mismatch
+                value_types = None
+                break
+    summary = {'type': None, 'count': len(enum_array)}
+    if value_types is string_types:
+        summary['type'] = 'string'
+    elif value_types is integer_types:
+        summary['type'] = 'integer'
+        summary['minimum'] = min(enum_array)
+        summary['maximum'] = max(enum_array)
+    # keep a reference to the enum so that its id is not reused
+    context.enums[id(enum_array)] = (enum_array, summary)
+    return summary
+
+
+def _guess_enum_type(enum_array, path, summary):
+    """Try to guess what a field's type is from the provided enum array.
+
+    Only string and integer values are supported for the time being.
+
+    :param enum_array: values of the enum.
+    :param path: json path of the enum. Used for debug.
+    :param summary: summary of the enum returned by :py:func:`_analyze_enum`,
+        ``None`` if the enum is empty.
+    """
+    if summary is None or summary['type'] == 'string':
+        # an empty enum
+        return 'string'
+    elif summary['type'] == 'integer':
+        return 'number'
+    else:
+        raise UnknownFieldTypeError(
+            'Mixed types in "{}" enum are not supported. Schema field type'
+            ' cannot be guessed from enum. Only "string" or "integer"'
+            ' values are accepted when "type" is not defined.'.format(
+                enum_array
+            ), path)
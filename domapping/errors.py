@@ -24,6 +24,8 @@
 
 """Exceptions used in this package."""
 
+import jsonschema
+
 
 class JsonSchemaSupportError(Exception):
     """Exception raised when a json schema is not supported by a function."""
@@ -34,7 +36,8 @@ class JsonSchemaSupportError(Exception):
         :param message: error message
         :param path: path of the failing file
         """
-        super(JsonSchemaSupportError, self).__init__(*args, **kwargs)
+        super(JsonSchemaSupportError, self).__init__(message, path, *args,
+                                                     **kwargs)
         self.message = message
         self.path = path
 
@@ -52,10 +55,72 @@ class UnknownFieldTypeError(Exception):
         :param message: error message
         :param path: path of the failing file
         """
-        super(UnknownFieldTypeError, self).__init__(*args, **kwargs)
+        super(UnknownFieldTypeError, self).__init__(message, path, *args,
+                                                    **kwargs)
+        self.message = message
+        self.path = path
+
+    def __str__(self):
+        """Return the formatted error message string."""
+        return 'ERROR {0} IN {1}'.format(self.message, self.path)
+
+
+class SchemaRecursionError(JsonSchemaSupportError):
+    """Exception raised when a json schema references itself."""
+
+    def __init__(self, message, path, cycle, *args, **kwargs):
+        """Constructor.
+
+        :param message: error message
+        :param path: path of the failing file
+        :param cycle: list of the reference urls forming the cycle. The
+            first and the last urls are the same.
+        """
+        super(SchemaRecursionError, self).__init__(message, path, cycle,
+                                                   *args, **kwargs)
+        self.cycle = cycle
+
+
+class ResourceLimitError(Exception):
+    """Exception raised when mapping a schema exceeds a resource limit."""
+
+    def __init__(self, message, path, limit, counters, *args, **kwargs):
+        """Constructor.
+
+        :param message: error message
+        :param path: path of the failing file
+        :param limit: name of the exceeded
+            :py:class:`domapping.limits.ResourceLimits` attribute.
+        :param counters: dict of the resources used when the limit was
+            exceeded: "nodes", "depth", "fields", "fetches" and "seconds".
+        """
+        super(ResourceLimitError, self).__init__(message, path, limit,
+                                                 counters, *args, **kwargs)
         self.message = message
         self.path = path
+        self.limit = limit
+        self.counters = counters
 
     def __str__(self):
         """Return the formatted error message string."""
         return 'ERROR {0} IN {1}'.format(self.message, self.path)
+
+
+def error_record(error, path=None):
+    """Convert an exception to a json serializable error record.
+
+    :param error: exception raised when mapping a schema.
+    :param path: json path of the failing schema, used when the exception
+        has no path, e.g. for unresolvable references.
+    :return: a ``{"type", "message", "path"}`` dict, "type" being the name
+        of the exception class.
+    """
+    error_type = error.__class__.__name__
+    if isinstance(error, jsonschema.RefResolutionError):
+        # recent jsonschema versions raise a private subclass
+        error_type = 'RefResolutionError'
+    return {
+        'type': error_type,
+        'message': getattr(error, 'message', None) or str(error),
+        'path': getattr(error, 'path', None) or path,
+    }
@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of DoMapping.
+# Copyright (C) 2015, 2016 CERN.
+#
+# DoMapping is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# DoMapping is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DoMapping; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Streaming generation of mappings.
+
+:py:func:`iter_mapping_events` generates a mapping as a stream of events
+instead of a dict:
+
+* ``('start_object', path, mapping)`` when entering an object field, or the
+  root type. ``mapping`` is the mapping of the field without its
+  "properties".
+* ``('field', path, mapping)`` for each field without properties.
+* ``('end_object', path, members)`` when leaving an object field.
+  ``members`` is ``None`` or the members of the mapping which follow its
+  "properties", for example the "dynamic_templates" of the root type.
+
+:py:func:`iter_dict_events` generates the same events from an existing
+mapping.
+
+``path`` is the tuple of the field names leading to the field, the root
+path being ``()``. Consumers can stream the events to a JSON file with
+:py:func:`dump_events`, or build the mapping with :py:func:`build_mapping`.
+
+The compiled schema is still materialized as the definitions of a field can
+come from anywhere in the schema, but at most one copy of the mapping of a
+field is alive at a time.
+"""
+
+from six import iteritems
+
+from . import serialization
+from .compiler import compile_schema
+from .mapping import _add_catch_all, _add_source, _collect_source_filters, \
+    _gen_field, _new_root_mapping
+
+
+def iter_mapping_events(json_schema, base_uri, context_schemas, config,
+                        **kwargs):
+    """Generate the mapping of a json schema as a stream of events.
+
+    :param json_schema: json schema used to generate the elasticsearch mapping
+    :param base_uri: json path pointing to the given json_schema.
+    :param context_schemas: dict of schema_id -> schema used to resolve
+        references.
+    :param config: configuration used to generate the elasticsearch mapping.
+    :param kwargs: see :py:func:`domapping.mapping.schema_to_mapping`.
+    :return: an iterator of events.
+    """
+    compiled_schema = compile_schema(json_schema, base_uri, context_schemas,
+                                     **kwargs)
+    return iter_compiled_mapping_events(compiled_schema, config)
+
+
+def iter_compiled_mapping_events(compiled_schema, config):
+    """Generate the mapping of a compiled schema as a stream of events.
+
+    Errors are raised when the generation reaches the failing field.
+
+    :param compiled_schema: schema returned by
+        :py:func:`domapping.compiler.compile_schema`.
+    :param config: configuration used to generate the elasticsearch mapping.
+    """
+    path = compiled_schema.get('id', '#')
+    root_mapping = _new_root_mapping(config)
+    _add_source(root_mapping, config,
+                *_collect_source_filters(compiled_schema))
+    # dynamic templates are only known once all the fields are generated
+    templates = []
+    root_schema = _gen_field(compiled_schema, path, config, root_mapping, (),
+                             templates)
+    root_mapping, root_members = _split_members(root_mapping)
+    yield 'start_object', (), root_mapping
+    # names of the root fields, checked by the catch-all field
+    root_fields = {}
+    # stack of (properties iterator, field path, json path) of the objects
+    stack = [(iteritems(root_schema['properties']), (), path)]
+    while stack:
+        properties, names, path = stack[-1]
+        for prop, prop_schema in properties:
+            prop_names = names + (prop,)
+            prop_path = path + '/' + prop
+            es_mapping = {}
+            object_schema = _gen_field(prop_schema, prop_path, config,
+                                       es_mapping, prop_names, templates)
+            if not names:
+                root_fields[prop] = None
+            if object_schema is None:
+                yield 'field', prop_names, es_mapping
+            else:
+                yield 'start_object', prop_names, es_mapping
+                stack.append((iteritems(object_schema['properties']),
+                              prop_names, prop_path))
+                break
+        else:
+            stack.pop()
+            members = None
+            if not names:
+                _add_catch_all(root_fields, path, config)
+                if config.catch_all_field is not None:
+                    yield ('field', (config.catch_all_field,),
+                           root_fields[config.catch_all_field])
+                if templates:
+                    root_members['dynamic_templates'] = templates
+                members = root_members or None
+            yield 'end_object', names, members
+
+
+def iter_dict_events(mapping):
+    """Generate the events describing an existing mapping.
+
+    :param mapping: type mapping, e.g. produced by
+        :py:func:`domapping.mapping.schema_to_mapping` or
+        :py:func:`domapping.templating.jinja_to_mapping`.
+    :return: an iterator of events.
+    """
+    members, trailer = _split_members(mapping)
+    yield 'start_object', (), members
+    stack = [(iteritems(mapping.get('properties', {})), (), trailer)]
+    while stack:
+        properties, names, trailer = stack[-1]
+        for prop, es_mapping in properties:
+            prop_names = names + (prop,)
+            if 'properties' in es_mapping:
+                members, prop_trailer = _split_members(es_mapping)
+                yield 'start_object', prop_names, members
+                stack.append((iteritems(es_mapping['properties']),
+                              prop_names, prop_trailer))
+                break
+            yield 'field', prop_names, es_mapping
+        else:
+            stack.pop()
+            yield 'end_object', names, trailer or None
+
+
+def _split_members(es_mapping):
+    """Split the members of a mapping around its "properties".
+
+    :return: a tuple (dict of the members preceding the "properties", dict
+        of the members following them).
+    """
+    before = {}
+    after = {}
+    members = before
+    for key, value in iteritems(es_mapping):
+        if key == 'properties':
+            members = after
+        else:
+            members[key] = value
+    return before, after
+
+
+def build_mapping(events):
+    """Build the mapping described by a stream of events.
+
+    :param events: iterable of events.
+    :return: the mapping.
+    """
+    # mappings of the open objects
+    stack = []
+    root = None
+    for event, path, es_mapping in events:
+        if event == 'end_object':
+            if es_mapping:
+                stack[-1].update(es_mapping)
+            stack.pop()
+            continue
+        es_mapping = dict(es_mapping)
+        if stack:
+            stack[-1]['properties'][path[-1]] = es_mapping
+        else:
+            root = es_mapping
+        if event == 'start_object':
+            es_mapping['properties'] = {}
+            stack.append(es_mapping)
+    return root
+
+
+def dump_events(events, fp, indent=None, wrappers=()):
+    """Write the mapping described by a stream of events as JSON.
+
+    The output is the same as the one of
+    :py:func:`domapping.serialization.dumps` applied to the mapping.
+
+    :param events: iterable of events.
+    :param fp: binary file object.
+    :param indent: indentation step. ``None`` produces compact output.
+    :param wrappers: keys of the objects enclosing the mapping, e.g.
+        ``('mappings', 'record')``.
+    """
+    writer = _JsonWriter(fp, indent)
+    if wrappers:
+        writer.open(None)
+        for key in wrappers[:-1]:
+            writer.open(key)
+    for event, path, es_mapping in events:
+        if event == 'end_object':
+            # close the "properties", write the following members and close
+            # the field
+            writer.close()
+            for name, value in iteritems(es_mapping or {}):
+                writer.member(name, value)
+            writer.close()
+        elif event == 'field':
+            writer.member(path[-1], es_mapping)
+        else:
+            if path:
+                writer.open(path[-1])
+            else:
+                writer.open(wrappers[-1] if wrappers else None)
+            for name, value in iteritems(es_mapping):
+                writer.member(name, value)
+            writer.open('properties')
+    for _ in wrappers:
+        writer.close()
+    writer.flush()
+
+
+class _JsonWriter(object):
+    """Incremental writer of nested JSON objects."""
+
+    # number of written pieces buffered before writing them to the file
+    buffer_size = 1024
+
+    def __init__(self, fp, indent):
+        """Constructor.
+
+        :param fp: binary file object.
+        :param indent: indentation step. ``None`` produces compact output.
+        """
+        self.fp = fp
+        self.indent = indent
+        self.key_separator = ':' if indent is None else ': '
+        # one flag per open object, True until the object has a member
+        self.empty = []
+        self.buffer = []
+
+    def open(self, key):
+        """Open an object, as a member of the current object if any."""
+        if self.empty:
+            self._start_member(key)
+        self.buffer.append('{')
+        self.empty.append(True)
+
+    def close(self):
+        """Close the current object."""
+        empty = self.empty.pop()
+        if not empty and self.indent is not None:
+            self.buffer.append('\n' + ' ' * (self.indent * len(self.empty)))
+        self.buffer.append('}')
+
+    def member(self, key, value):
+        """Write a member of the current object."""
+        self._start_member(key)
+        text = serialization.dumps(value, indent=self.indent)
+        if self.indent is not None:
+            text = text.replace('\n',
+                                '\n' + ' ' * (self.indent * len(self.empty)))
+        self.buffer.append(text)
+
+    def _start_member(self, key):
+        """Write the separator, the indentation and the key of a member."""
+        if not self.empty[-1]:
+            self.buffer.append(',')
+        self.empty[-1] = False
+        if self.indent is not None:
+            self.buffer.append('\n' + ' ' * (self.indent * len(self.empty)))
+        self.buffer.append(serialization.dumps(key) + self.key_separator)
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered pieces to the file."""
+        if self.buffer:
+            self.fp.write(''.join(self.buffer).encode('utf-8'))
+            del self.buffer[:]
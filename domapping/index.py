@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of DoMapping.
+# Copyright (C) 2015, 2016 CERN.
+#
+# DoMapping is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# DoMapping is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DoMapping; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Index bodies of json schemas.
+
+:py:func:`schema_to_index` generates the body of an elasticsearch "create
+index" request, its "settings" and "mappings", so that index sorting and
+routing stay in the schema instead of in separately maintained settings
+files.
+
+The root schema declares them in an ``"x-domapping": {"index": {...}}``
+annotation:
+
+.. code-block:: python
+
+    {
+        'x-domapping': {
+            'index': {
+                # "index.sort.*" settings, in order of priority
+                'sort': [
+                    {'field': 'publication_date', 'order': 'desc'},
+                    {'field': 'title.raw', 'missing': '_last'},
+                ],
+                # "_routing" of the type and "index.routing_partition_size"
+                'routing': {'required': True, 'partition_size': 2},
+            },
+        },
+    }
+
+Sort fields are dotted paths of the generated mapping, subfields included.
+They must be leaf fields, outside of nested objects, of a type sortable
+with doc_values: keyword, numeric, date or boolean.
+"""
+
+import copy
+
+from six import integer_types, iteritems, string_types
+
+from .compiler import compile_schema
+from .errors import JsonSchemaSupportError
+from .mapping import compiled_schema_to_mapping
+
+# elasticsearch types having doc values which can sort an index
+_sortable_types = frozenset([
+    'keyword', 'boolean', 'date', 'long', 'integer', 'short', 'byte',
+    'double', 'float', 'half_float', 'scaled_float',
+])
+# sort key -> accepted values
+_sort_values = {
+    'order': ('asc', 'desc'),
+    'mode': ('min', 'max'),
+    'missing': ('_first', '_last'),
+}
+
+
+def schema_to_index(json_schema, base_uri, context_schemas, config,
+                    settings=None, mapping_type=None, **kwargs):
+    """Generate an elasticsearch index body from a json schema.
+
+    :param json_schema: json schema used to generate the elasticsearch mapping
+    :param base_uri: json path pointing to the given json_schema.
+    :param context_schemas: dict of schema_id -> schema used to resolve
+        references.
+    :param config: configuration used to generate the elasticsearch mapping.
+    :param settings: index settings completed by the annotated ones, see
+        :py:func:`compiled_schema_to_index`.
+    :param mapping_type: elasticsearch mapping type, see
+        :py:func:`compiled_schema_to_index`.
+    :param kwargs: see :py:func:`domapping.mapping.schema_to_mapping`.
+    """
+    compiled_schema = compile_schema(json_schema, base_uri, context_schemas,
+                                     **kwargs)
+    return compiled_schema_to_index(compiled_schema, config, settings,
+                                    mapping_type)
+
+
+def compiled_schema_to_index(compiled_schema, config, settings=None,
+                             mapping_type=None):
+    """Generate an elasticsearch index body from a compiled schema.
+
+    :param compiled_schema: schema returned by
+        :py:func:`domapping.compiler.compile_schema`.
+    :param config: configuration used to generate the elasticsearch mapping.
+    :param settings: index settings, e.g. the number of shards, completed by
+        the annotated sort and routing settings. Settings are given with
+        dotted keys, the annotated ones override them.
+    :param mapping_type: elasticsearch mapping type. The "mappings" are the
+        type mapping when ``None``, and ``{mapping_type: type mapping}``
+        otherwise.
+    :return: the ``{"settings": {...}, "mappings": {...}}`` index body.
+    """
+    path = compiled_schema.get('id', '#') + '/x-domapping/index'
+    annotation = _index_annotation(compiled_schema, path)
+    mapping = compiled_schema_to_mapping(compiled_schema, config)
+    settings = copy.deepcopy(settings or {})
+
+    unknown = set(annotation).difference(['sort', 'routing'])
+    if unknown:
+        raise JsonSchemaSupportError('Unsupported index annotation "{}".'
+                                     .format(sorted(unknown)[0]), path)
+    if annotation.get('sort'):
+        if config.es_version < 6:
+            raise JsonSchemaSupportError('Index sorting requires '
+                                         'elasticsearch 6.', path)
+        settings.update(_sort_settings(annotation['sort'], mapping,
+                                       path + '/sort'))
+    routing = annotation.get('routing')
+    if routing:
+        _gen_routing(routing, mapping, settings, path + '/routing')
+
+    if mapping_type is not None:
+        mapping = {mapping_type: mapping}
+    return {'settings': settings, 'mappings': mapping}
+
+
+def _index_annotation(compiled_schema, path):
+    """Return the merged index annotation of the root definitions."""
+    annotation = {}
+    for definition in compiled_schema.get('allOf', [compiled_schema]):
+        index = (definition.get('x-domapping') or {}).get('index')
+        if index is None:
+            continue
+        if not isinstance(index, dict):
+            raise JsonSchemaSupportError('Index annotation should be an '
+                                         'object.', path)
+        annotation.update(index)
+    return annotation
+
+
+def _sort_settings(sort, mapping, path):
+    """Generate the "index.sort.*" settings of a sort annotation.
+
+    :param sort: list of sort fields, either dotted paths or dicts with a
+        "field" and optional "order", "mode" and "missing" keys.
+    :param mapping: generated type mapping, used to check the sort fields.
+    :param path: json path of the annotation. Used for debug.
+    """
+    if not isinstance(sort, list):
+        sort = [sort]
+    sort = [{'field': item} if isinstance(item, string_types) else item
+            for item in sort]
+    settings = {}
+    for index, item in enumerate(sort):
+        item_path = path + '[' + str(index) + ']'
+        if not isinstance(item, dict) or \
+                not isinstance(item.get('field'), string_types):
+            raise JsonSchemaSupportError('Sort fields should be dotted paths '
+                                         'or objects with a "field".',
+                                         item_path)
+        for key, value in iteritems(item):
+            if key != 'field' and value not in _sort_values.get(key, ()):
+                raise JsonSchemaSupportError(
+                    'Unsupported sort parameter "{}": {}.'.format(
+                        key, value), item_path)
+        _check_sortable(item['field'], mapping, item_path)
+    settings['index.sort.field'] = [item['field'] for item in sort]
+    for key in sorted(_sort_values):
+        if any(key in item for item in sort):
+            # unspecified values default to the ones of elasticsearch
+            settings['index.sort.' + key] = [
+                item.get(key, _sort_default(key, item)) for item in sort]
+    return settings
+
+
+def _sort_default(key, item):
+    """Return elasticsearch's default value of a sort parameter."""
+    descending = item.get('order') == 'desc'
+    if key == 'order':
+        return 'asc'
+    if key == 'mode':
+        return 'max' if descending else 'min'
+    return '_first' if descending else '_last'
+
+
+def _check_sortable(field, mapping, path):
+    """Check that a dotted path is a sortable field of a type mapping.
+
+    :raises JsonSchemaSupportError: if the field is not found, is in a
+        nested object, or has no sortable doc values.
+    """
+    es_mapping = mapping
+    for name in field.split('.'):
+        if es_mapping.get('type') == 'nested':
+            raise JsonSchemaSupportError('Sort field "{}" is in a nested '
+                                         'object.'.format(field), path)
+        children = dict(es_mapping.get('fields', {}))
+        children.update(es_mapping.get('properties', {}))
+        if name not in children:
+            raise JsonSchemaSupportError('Unknown sort field "{}".'.format(
+                field), path)
+        es_mapping = children[name]
+    es_type = es_mapping.get('type', 'object')
+    if (es_type not in _sortable_types or
+            es_mapping.get('doc_values') is False):
+        raise JsonSchemaSupportError(
+            'Sort field "{}" of type "{}" has no sortable doc values.'.format(
+                field, es_type), path)
+
+
+def _gen_routing(routing, mapping, settings, path):
+    """Generate the routing of a routing annotation.
+
+    :param routing: ``True`` or ``{"required": ..., "partition_size": ...}``.
+    :param mapping: type mapping receiving the "_routing" field.
+    :param settings: index settings receiving the partition size.
+    :param path: json path of the annotation. Used for debug.
+    """
+    if routing is True:
+        routing = {'required': True}
+    if not isinstance(routing, dict) or \
+            set(routing).difference(['required', 'partition_size']):
+        raise JsonSchemaSupportError('Routing annotation should be true or '
+                                     'an object with "required" and '
+                                     '"partition_size" keys.', path)
+    partition_size = routing.get('partition_size')
+    if partition_size is not None:
+        if (isinstance(partition_size, bool) or
+                not isinstance(partition_size, integer_types) or
+                partition_size < 1):
+            raise JsonSchemaSupportError('Routing partition size should be '
+                                         'a positive integer.', path)
+        if not routing.get('required'):
+            # elasticsearch rejects partitioned indices with optional
+            # routing
+            raise JsonSchemaSupportError('Routing partition size requires '
+                                         'a required routing.', path)
+        settings['index.routing_partition_size'] = partition_size
+    if routing.get('required'):
+        mapping['_routing'] = {'required': True}
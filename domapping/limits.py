@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of DoMapping.
+# Copyright (C) 2015, 2016 CERN.
+#
+# DoMapping is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# DoMapping is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DoMapping; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Limits of the resources used to map a schema.
+
+Schemas coming from untrusted or generated sources can be pathological: deep
+"allOf" fan-outs, huge enums or reference diamonds which expand
+exponentially. :py:class:`ResourceLimits` bounds the work done when compiling
+them. Exceeding a limit raises a
+:py:class:`domapping.errors.ResourceLimitError`.
+"""
+
+import time
+
+# monotonic clock when available
+clock = getattr(time, 'monotonic', time.time)
+
+
+class ResourceLimits(object):
+    """Limits of a schema compilation. ``None`` means unlimited."""
+
+    def __init__(self, max_nodes=None, max_depth=None, max_fields=None,
+                 max_fetches=None, timeout=None):
+        """Constructor.
+
+        :param max_nodes: maximum number of visited schema nodes. Enum values
+            count as nodes.
+        :param max_depth: maximum nesting of schema nodes, references and
+            collections included.
+        :param max_fields: maximum number of generated fields.
+        :param max_fetches: maximum number of remote documents retrieved by
+            a :py:class:`domapping.resolver.SchemaResolver`.
+        :param timeout: maximum duration of the compilation, in seconds.
+        """
+        self.max_nodes = max_nodes
+        self.max_depth = max_depth
+        self.max_fields = max_fields
+        self.max_fetches = max_fetches
+        self.timeout = timeout
+
+    def __repr__(self):
+        """Return the representation of the limits."""
+        return ('ResourceLimits(max_nodes={!r}, max_depth={!r}, '
+                'max_fields={!r}, max_fetches={!r}, timeout={!r})'.format(
+                    self.max_nodes, self.max_depth, self.max_fields,
+                    self.max_fetches, self.timeout))
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of DoMapping.
+# Copyright (C) 2015, 2016 CERN.
+#
+# DoMapping is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# DoMapping is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DoMapping; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Validation of schema corpora.
+
+The generation stops at the first unsupported field. :py:func:`lint_schema`
+instead skips the failing fields and reports every error of a schema, and
+:py:func:`lint_files` checks many schema files with a pool of processes, so
+that a single run reports all the problems of a corpus.
+
+Errors are reported as json serializable ``{"type", "message", "path"}``
+records, "type" being the name of the exception class. A field whose
+compilation fails is reported once and not mapped; its other definitions
+and its siblings are still checked.
+"""
+
+import multiprocessing
+import os
+
+import jsonschema
+from six import iteritems, string_types
+from six.moves.urllib.request import pathname2url
+
+from . import serialization
+from .compiler import compile_schema
+from .errors import JsonSchemaSupportError, ResourceLimitError, \
+    UnknownFieldTypeError, error_record
+from .mapping import _add_catch_all, _gen_field, _new_root_mapping
+
+# errors reported by the lint, other exceptions are bugs which lint_files
+# reports for the whole file
+_lint_errors = (JsonSchemaSupportError, UnknownFieldTypeError,
+                ResourceLimitError, jsonschema.RefResolutionError,
+                ValueError)
+
+# state of each worker process, set by _init_worker
+_worker_state = {}
+
+
+def lint_schema(json_schema, base_uri, context_schemas, config, **kwargs):
+    """Collect every error of the mapping generation of a json schema.
+
+    :param json_schema: json schema to check.
+    :param base_uri: json path pointing to the given json_schema.
+    :param context_schemas: dict of schema_id -> schema used to resolve
+        references.
+    :param config: configuration used to generate the elasticsearch mapping.
+    :param kwargs: see :py:func:`domapping.mapping.schema_to_mapping`.
+    :return: the list of error records, empty if the schema is supported.
+    """
+    errors = []
+    try:
+        compiled_schema = compile_schema(json_schema, base_uri,
+                                         context_schemas, errors=errors,
+                                         **kwargs)
+        path = compiled_schema.get('id', '#')
+        root_mapping = _new_root_mapping(config)
+        _lint_field(compiled_schema, path, config, root_mapping, (), errors)
+        _add_catch_all(root_mapping['properties'], path, config)
+    except _lint_errors as e:
+        errors.append((base_uri, e))
+    return [error_record(error, path) for path, error in errors]
+
+
+def _lint_field(json_schema, path, config, es_mapping, names, errors):
+    """Generate the mapping of a field, collecting the errors.
+
+    See :py:func:`domapping.mapping._gen_type_properties` for the
+    parameters.
+
+    :param errors: list extended with the (path, error) tuples of the field
+        and of its properties.
+    """
+    try:
+        object_schema = _gen_field(json_schema, path, config, es_mapping,
+                                   names, [])
+    except _lint_errors as e:
+        errors.append((path, e))
+        return
+    if object_schema is not None:
+        es_properties = es_mapping.setdefault('properties', {})
+        for prop, prop_schema in iteritems(object_schema['properties']):
+            _lint_field(prop_schema, path + '/' + prop, config,
+                        es_properties.setdefault(prop, {}), names + (prop,),
+                        errors)
+
+
+def lint_files(paths, config, context_schemas=None, processes=None,
+               **kwargs):
+    """Collect the errors of many schema files with a pool of processes.
+
+    Schemas without "id" are identified by their file url.
+
+    :param paths: list of the paths of the schema files.
+    :param config: configuration used to generate the elasticsearch mappings.
+    :param context_schemas: dict of schema_id -> schema used to resolve
+        references, e.g. the schemas of the corpus.
+    :param processes: number of worker processes. Defaults to the number of
+        CPUs. The files are checked in the current process when it is 1.
+    :param kwargs: see :py:func:`domapping.mapping.schema_to_mapping`.
+    :return: dict of path -> list of error records.
+    """
+    initargs = (context_schemas or {}, config, kwargs)
+    if processes == 1:
+        _init_worker(*initargs)
+        results = [_lint_file(path) for path in paths]
+    else:
+        pool = multiprocessing.Pool(processes, initializer=_init_worker,
+                                    initargs=initargs)
+        try:
+            results = pool.map(_lint_file, paths)
+            pool.close()
+        except BaseException:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+    return dict(zip(paths, results))
+
+
+def load_corpus(paths):
+    """Load schema files, keyed by their id, as lint context schemas.
+
+    Files which cannot be parsed are skipped: :py:func:`lint_files` reports
+    them.
+
+    :param paths: list of the paths of the schema files.
+    :return: dict of schema_id -> schema.
+    """
+    schemas = {}
+    for path in paths:
+        try:
+            json_schema, schema_id = _load_file(path)
+        except ValueError:
+            continue
+        schemas[schema_id] = json_schema
+    return schemas
+
+
+def _load_file(path):
+    """Load a schema file.
+
+    :return: the (schema, id) tuple.
+    """
+    with open(path, 'rb') as schema_file:
+        json_schema = serialization.decode(schema_file.read())
+    if not isinstance(json_schema, dict):
+        raise ValueError('JSON Schema should be an object.')
+    schema_id = json_schema.get('id')
+    if not isinstance(schema_id, (string_types, type(None))):
+        raise ValueError('JSON Schema "id" should be a string.')
+    if not schema_id:
+        schema_id = 'file://' + pathname2url(os.path.abspath(path))
+    return json_schema, schema_id
+
+
+def _init_worker(context_schemas, config, options):
+    """Initialize the state of a worker process."""
+    _worker_state['context'] = context_schemas
+    _worker_state['config'] = config
+    _worker_state['options'] = options
+
+
+def _lint_file(path):
+    """Collect the errors of a schema file.
+
+    :return: the list of error records.
+    """
+    try:
+        json_schema, schema_id = _load_file(path)
+    except ValueError as e:
+        return [error_record(JsonSchemaSupportError(
+            'Invalid schema file: {}'.format(e), path), path)]
+    try:
+        return lint_schema(json_schema, schema_id, _worker_state['context'],
+                           _worker_state['config'],
+                           **_worker_state['options'])
+    except Exception as e:
+        # a single unexpected failure should not abort the whole run
+        return [error_record(e, path)]
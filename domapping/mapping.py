@@ -24,10 +24,76 @@
 
 """Elastic Search integration. mapping funtion."""
 
-import jsonschema
+import math
+
 from six import integer_types, iteritems, string_types
 
-from .errors import JsonSchemaSupportError, UnknownFieldTypeError
+from .compiler import compile_schema
+from .errors import JsonSchemaSupportError
+from .presets import get_preset
+from .projection import Projection
+
+# elasticsearch parameters accepted in "x-elasticsearch" schema annotations
+# parameter -> accepted python types, None if any value is accepted
+_es_parameters = {
+    'analyzer': string_types,
+    'boost': integer_types + (float,),
+    'coerce': (bool,),
+    'copy_to': string_types + (list,),
+    'doc_values': (bool,),
+    'dynamic': (bool,) + string_types,
+    'eager_global_ordinals': (bool,),
+    'enabled': (bool,),
+    'fields': (dict,),
+    'format': string_types,
+    'ignore_above': integer_types,
+    'ignore_malformed': (bool,),
+    'include_in_all': (bool,),
+    'index': (bool,) + string_types,
+    'index_options': string_types,
+    'nested': (bool,),
+    'normalizer': string_types,
+    'norms': (bool, dict),
+    'null_value': None,
+    'position_increment_gap': integer_types,
+    'search_analyzer': string_types,
+    'similarity': string_types,
+    'store': (bool,),
+    'term_vector': string_types,
+    'type': string_types,
+}
+# parameter -> accepted values
+_es_parameter_values = {
+    'dynamic': (True, False, 'strict'),
+    # elasticsearch 2 uses strings
+    'index': (True, False, 'no', 'not_analyzed', 'analyzed'),
+    'index_options': ('docs', 'freqs', 'positions', 'offsets'),
+    'term_vector': ('no', 'yes', 'with_positions', 'with_offsets',
+                    'with_positions_offsets'),
+}
+# parameters of object fields, the other ones are parameters of leaf fields
+_object_es_parameters = frozenset(['dynamic', 'enabled', 'include_in_all',
+                                   'nested'])
+_leaf_es_parameters = frozenset(_es_parameters).difference(
+    ['dynamic', 'enabled', 'nested'])
+
+NUMERIC_NARROWINGS = (None, 'exact', 'float')
+"""Values of :py:attr:`ElasticMappingGeneratorConfig.numeric_narrowing`."""
+
+# elasticsearch integer types, narrowest first, with their ranges
+_integer_types = (
+    ('byte', -2 ** 7, 2 ** 7 - 1),
+    ('short', -2 ** 15, 2 ** 15 - 1),
+    ('integer', -2 ** 31, 2 ** 31 - 1),
+    ('long', -2 ** 63, 2 ** 63 - 1),
+)
+_integer_type_names = [name for name, _, _ in _integer_types]
+# floating point type -> widest integer type of the same size
+_float_integer_limits = {'float': 'integer', 'double': 'long'}
+# largest finite "float" value
+_float_max = 3.4028234663852886e38
+# largest integer stored exactly in a double, bounding scaled floats
+_exact_double_max = 2 ** 53
 
 
 class ElasticMappingGeneratorConfig(object):
@@ -38,12 +104,80 @@ class ElasticMappingGeneratorConfig(object):
         super(ElasticMappingGeneratorConfig, self).__init__(*args, **kwargs)
         self.all_field = True
         """Enable/Disable "all" field generation in elasticsearch mappings."""
+        self.catch_all_field = None
+        """Name of the generated catch-all field, see :py:meth:`set_catch_all`.
+        """
+        # catch-all path projection and mapping
+        self._catch_all_projection = None
+        self._catch_all_mapping = {}
+        self.source_includes = []
+        """Path patterns of the fields kept in the "_source" field."""
+        self.source_excludes = []
+        """Path patterns of the fields removed from the "_source" field."""
+        # projection of the stored leaf fields
+        self._store_projection = None
         self.date_detection = True
         """Enable/Disable date detection in elasticsearch mappings."""
         self.numeric_detection = True
         """Enable/Disable number detection in elasticsearch mappings."""
         self.date_format = None
         """Date format used in elasticsearch mappings."""
+        self.numeric_narrowing = None
+        """Choose the narrowest numeric types allowed by the schema bounds.
+
+        Fields of type "integer", and "number" fields which are multiple of
+        an integer, are mapped as "byte", "short", "integer" or "long"
+        depending on their "minimum" and "maximum". Other "number" fields
+        which are multiple of a number are mapped as "scaled_float" from
+        elasticsearch 5. Narrowing never widens the configured type.
+
+        ``None`` disables the narrowing, "exact" narrows the types without
+        losing any value and "float" also maps the other bounded "number"
+        fields as "float", losing precision beyond 7 significant digits.
+        """
+        self.keyword_max_length = None
+        """Infer the mapping of strings from their "maxLength".
+
+        Strings whose "maxLength" is at most this value are mapped as
+        "keyword" with an "ignore_above" of their "maxLength", and longer
+        strings as text without any keyword subfield. ``None`` disables the
+        inference. Strings whose format is mapped with :py:meth:`map_type`
+        are never inferred.
+        """
+        self.keyword_patterns = False
+        """Map strings having a "pattern" as "keyword".
+
+        Their "ignore_above" is their "maxLength", or
+        :py:attr:`keyword_max_length`.
+        """
+        self.enum_keyword_limit = None
+        """Optimize the string enums having at most this number of values.
+
+        They are mapped as "keyword" with eager global ordinals, which speed
+        up aggregations, and without norms. ``None`` disables the
+        optimization. Integer enums are narrowed from their values by
+        :py:attr:`numeric_narrowing`.
+        """
+        self.closed_objects = None
+        """Mapping of objects whose "additionalProperties" is false.
+
+        Either ``None``, which keeps elasticsearch's default, ``False``,
+        which stores the unknown fields in ``_source`` without indexing
+        them, or "strict", which rejects the documents having unknown
+        fields. Objects inherit the setting of their parent, as in
+        elasticsearch, unless they declare their "additionalProperties".
+
+        Objects whose "additionalProperties" is true, or a schema, and
+        objects with "patternProperties" are always dynamic. Their
+        "patternProperties", then their "additionalProperties" schema, are
+        mapped as dynamic templates scoped to the object.
+        """
+        self.es_version = 2
+        """Major version of the targeted elasticsearch.
+
+        From version 5 "string" types are generated as "text" and from
+        version 6 the "_all" field is not generated anymore.
+        """
         # json type -> elasticsearch type
         # this contains the default string mapping when no format matches
         self._types_map = {
@@ -54,6 +188,8 @@ class ElasticMappingGeneratorConfig(object):
         }
         # json string formats -> elasticsearch type
         self._formats_map = {}
+        # list of (json type, json format, path projection, subfields)
+        self._multi_fields = []
 
     def load(self, config):
         """Load a configuration dict, overriding current configuration.
@@ -61,6 +197,9 @@ class ElasticMappingGeneratorConfig(object):
         The configuration dict should be of the form:
         .. code-block:: python
             {
+                # names of the presets loaded first, see
+                # py:mod:`domapping.presets`
+                'presets': ['ingest'],
                 # type mappings with parameters for py:meth:`map_type`
                 'types': [{
                     'es_type': 'elasticsearch type',
@@ -75,20 +214,74 @@ class ElasticMappingGeneratorConfig(object):
                 'all_field': True,
                 'date_detection': True,
                 'numeric_detection': True,
+                'numeric_narrowing': 'exact',
+                'keyword_max_length': 256,
+                'keyword_patterns': True,
+                'enum_keyword_limit': 100,
+                'closed_objects': 'strict',
+                # parameters for py:meth:`set_catch_all`
+                'catch_all': {
+                    'field': 'catch_all',
+                    'include': ['title', 'metadata.**'],
+                    'exclude': ['metadata.internal'],
+                    'mapping': {'analyzer': 'english'},
+                },
+                # parameters for py:meth:`set_source`
+                'source': {
+                    'includes': ['dotted path pattern'],
+                    'excludes': ['fulltext', 'raw_marc.*'],
+                    'store': ['title', 'control_number'],
+                },
+                'es_version': 6,
+                # subfields with parameters for py:meth:`add_multi_fields`
+                'multi_fields': [{
+                    'fields': {
+                        'raw': {'type': 'keyword', 'ignore_above': 256},
+                    },
+                    'json_type': 'string',
+                    'json_format': 'JSON Schema format',
+                    'path': 'dotted path pattern',
+                }, ...],
             }
 
         :param config: A configuration dict.
         """
-        for type_config in config['types']:
+        for preset in config.get('presets', []):
+            self.load(get_preset(preset))
+        for type_config in config.get('types', []):
             self.map_type(**type_config)
+        for multi_fields_config in config.get('multi_fields', []):
+            self.add_multi_fields(**multi_fields_config)
+        if 'es_version' in config:
+            self.es_version = config['es_version']
         if 'all_field' in config:
             self.all_field = config['all_field']
+        if 'catch_all' in config:
+            self.set_catch_all(**config['catch_all'])
+        if 'source' in config:
+            self.set_source(**config['source'])
         if 'date_format' in config:
             self.date_format = config['date_format']
         if 'date_detection' in config:
             self.date_detection = config['date_detection']
         if 'numeric_detection' in config:
             self.numeric_detection = config['numeric_detection']
+        if 'closed_objects' in config:
+            if config['closed_objects'] not in (None, False, 'strict'):
+                raise ValueError('Unknown closed objects mapping "{}".'.format(
+                    config['closed_objects']))
+            self.closed_objects = config['closed_objects']
+        if 'enum_keyword_limit' in config:
+            self.enum_keyword_limit = config['enum_keyword_limit']
+        if 'keyword_max_length' in config:
+            self.keyword_max_length = config['keyword_max_length']
+        if 'keyword_patterns' in config:
+            self.keyword_patterns = config['keyword_patterns']
+        if 'numeric_narrowing' in config:
+            if config['numeric_narrowing'] not in NUMERIC_NARROWINGS:
+                raise ValueError('Unknown numeric narrowing "{}".'.format(
+                    config['numeric_narrowing']))
+            self.numeric_narrowing = config['numeric_narrowing']
 
     def map_type(self, es_type, json_type, json_format=None, es_props=None):
         """Map a json schema type to an elasticsearch type.
@@ -115,6 +308,233 @@ class ElasticMappingGeneratorConfig(object):
             self._types_map[json_type] = stored_mapping
         return self
 
+    def set_catch_all(self, field, include=None, exclude=None, mapping=None):
+        """Copy the values of some leaf fields to a catch-all text field.
+
+        The catch-all field is added to the root type and replaces the
+        "_all" field, which is disabled: only the searchable fields are
+        indexed twice. Leaf fields are copied when their path is selected
+        by the include and exclude patterns, or when their schema has an
+        ``"x-domapping": {"catch_all": true}`` annotation. A false
+        annotation excludes a field.
+
+        :param field: name of the catch-all field, ``None`` disables it.
+        :param include: list of path patterns of the copied fields, see
+            :py:mod:`domapping.projection`. No field is copied by default.
+        :param exclude: list of path patterns of the fields which are not
+            copied.
+        :param mapping: additional elasticsearch properties of the
+            catch-all field, e.g. its "analyzer".
+        """
+        self.catch_all_field = field
+        self._catch_all_projection = None
+        if include:
+            self._catch_all_projection = Projection(include, exclude)
+        self._catch_all_mapping = dict(mapping or {})
+        return self
+
+    def get_catch_all_mapping(self):
+        """Return the mapping of the catch-all field."""
+        es_type = 'text' if self.es_version >= 5 else 'string'
+        es_mapping = {'type': es_type}
+        es_mapping.update(self._catch_all_mapping)
+        return es_mapping
+
+    def is_copied_to_catch_all(self, names, annotation=None):
+        """Check if a leaf field is copied to the catch-all field.
+
+        :param names: sequence of the names of the path of the field.
+        :param annotation: "catch_all" annotation of the field, if any.
+        """
+        if self.catch_all_field is None or annotation is False:
+            return False
+        if annotation:
+            return True
+        return (self._catch_all_projection is not None and
+                self._catch_all_projection.matches(names))
+
+    def set_source(self, includes=None, excludes=None, store=None):
+        """Filter the "_source" field and store fields individually.
+
+        Fields with an ``"x-domapping": {"source": false}`` annotation are
+        added to the excluded paths and fields with a true annotation to the
+        included paths. Excluded fields can still be searched but are not
+        returned, reindexed or updated from the "_source" field.
+
+        :param includes: list of the elasticsearch path patterns of the
+            fields kept in "_source", e.g. "metadata.*".
+        :param excludes: list of the elasticsearch path patterns of the
+            fields removed from "_source".
+        :param store: list of path patterns of the leaf fields stored
+            separately, see :py:mod:`domapping.projection`. Their values can
+            be retrieved without loading the "_source" field.
+        """
+        self.source_includes = list(includes or [])
+        self.source_excludes = list(excludes or [])
+        self._store_projection = Projection(store) if store else None
+        return self
+
+    def is_stored(self, names):
+        """Check if a leaf field is stored separately from "_source".
+
+        :param names: sequence of the names of the path of the field.
+        """
+        return (self._store_projection is not None and
+                self._store_projection.matches(names))
+
+    def add_multi_fields(self, fields, json_type=None, json_format=None,
+                         path=None):
+        """Add subfields to the mapping of matching leaf fields.
+
+        Subfields index the same value differently, e.g. a "keyword"
+        subfield of a text field for sorting and aggregations. When multiple
+        rules match a field, their subfields are merged, the last added rule
+        overriding the others.
+
+        :param fields: dict of subfield name -> subfield mapping. Subfields of
+            type "string" are generated as "text" from elasticsearch 5 and
+            subfields of type "keyword" as not analyzed strings before
+            elasticsearch 5.
+        :param json_type: json schema type of the fields. Any leaf field
+            matches when ``None``.
+        :param json_format: json schema format of the fields. Any format
+            matches when ``None``.
+        :param path: dotted path pattern of the fields, see
+            :py:mod:`domapping.projection`. Any path matches when ``None``.
+        """
+        assert json_type in [None, 'string', 'boolean', 'number', 'integer']
+        projection = Projection([path]) if path is not None else None
+        self._multi_fields.append((json_type, json_format, projection,
+                                   fields))
+        return self
+
+    def get_multi_fields(self, json_type, json_format=None, names=(),
+                         keywords=True):
+        """Return the subfields of a leaf field.
+
+        :param json_type: json type of the field.
+        :param json_format: json format of the field (optional).
+        :param names: sequence of the names of the path of the field.
+        :param keywords: False if "keyword" subfields are skipped.
+        :return: dict of subfield name -> subfield mapping, empty if no rule
+            matches.
+        """
+        result = {}
+        for rule_type, rule_format, projection, fields in self._multi_fields:
+            if ((rule_type is not None and rule_type != json_type) or
+                    (rule_format is not None and
+                     rule_format != json_format) or
+                    (projection is not None and
+                     not projection.matches(names))):
+                continue
+            for name, field in iteritems(fields):
+                if not keywords and field.get('type') == 'keyword':
+                    continue
+                field = dict(field)
+                if field.get('type') == 'string' and self.es_version >= 5:
+                    field['type'] = 'text'
+                elif field.get('type') == 'keyword' and self.es_version < 5:
+                    field['type'] = 'string'
+                    field['index'] = 'not_analyzed'
+                result[name] = field
+        return result
+
+    def infer_string_type(self, json_format=None, max_length=None,
+                          pattern=False, enum_count=None):
+        """Infer if a string is an exact value or a free text.
+
+        See :py:attr:`enum_keyword_limit`, :py:attr:`keyword_max_length` and
+        :py:attr:`keyword_patterns`.
+
+        :param json_format: json format of the string (optional).
+        :param max_length: "maxLength" of the string, or ``None``.
+        :param pattern: True if the string has a "pattern".
+        :param enum_count: number of values of the string if it is an enum,
+            or ``None``.
+        :return: "enum", "keyword", "text" or ``None`` if nothing can be
+            inferred.
+        """
+        if json_format in self._formats_map:
+            return None
+        if (enum_count is not None and self.enum_keyword_limit is not None
+                and enum_count <= self.enum_keyword_limit):
+            return 'enum'
+        if pattern and self.keyword_patterns:
+            return 'keyword'
+        if max_length is not None and self.keyword_max_length is not None:
+            if max_length <= self.keyword_max_length:
+                return 'keyword'
+            return 'text'
+        return None
+
+    def get_keyword_type(self, max_length=None, enum=False):
+        """Return the elasticsearch type of inferred keyword strings.
+
+        :param max_length: "maxLength" of the string, or ``None``.
+        :param enum: True for optimized enums.
+        :return: a tuple (elasticsearch type, elasticsearch properties).
+        """
+        props = {}
+        if enum:
+            if self.es_version < 5:
+                # not analyzed strings have no norms
+                return 'string', {'index': 'not_analyzed'}
+            return 'keyword', {'eager_global_ordinals': True, 'norms': False}
+        if max_length is None:
+            max_length = self.keyword_max_length
+        if max_length is not None:
+            props['ignore_above'] = max_length
+        if self.es_version < 5:
+            props['index'] = 'not_analyzed'
+            return 'string', props
+        return 'keyword', props
+
+    def narrow_numeric_type(self, json_type, es_type, es_props, minimum,
+                            maximum, multiple_of=None):
+        """Return the narrowest numeric type of a field.
+
+        See :py:attr:`numeric_narrowing`.
+
+        :param json_type: "integer" or "number".
+        :param es_type: configured elasticsearch type of the field.
+        :param es_props: configured elasticsearch properties of the field.
+        :param minimum: inclusive minimum of the field, or ``None``.
+        :param maximum: inclusive maximum of the field, or ``None``.
+        :param multiple_of: "multipleOf" of the field, or ``None``.
+        :return: a tuple (elasticsearch type, elasticsearch properties).
+        """
+        if (not self.numeric_narrowing or minimum is None or
+                maximum is None):
+            return es_type, es_props
+        integral = json_type == 'integer' or (
+            multiple_of is not None and multiple_of >= 1 and
+            multiple_of == int(multiple_of))
+        # widest integer type which is not wider than the configured type
+        limit = _float_integer_limits.get(es_type, es_type)
+        if integral and limit in _integer_type_names:
+            minimum_value = int(math.ceil(minimum))
+            maximum_value = int(math.floor(maximum))
+            for name, lowest, highest in _integer_types:
+                if lowest <= minimum_value and maximum_value <= highest:
+                    return name, es_props
+                if name == limit:
+                    # no integer type can hold the values
+                    break
+        if es_type != 'double':
+            return es_type, es_props
+        if (multiple_of is not None and multiple_of > 0 and
+                self.es_version >= 5):
+            factor = 1 / float(multiple_of)
+            if (factor == round(factor) and
+                    max(-minimum, maximum) * factor <= _exact_double_max):
+                es_props = dict(es_props)
+                es_props['scaling_factor'] = int(round(factor))
+                return 'scaled_float', es_props
+        if (self.numeric_narrowing == 'float' and
+                max(-minimum, maximum) <= _float_max):
+            return 'float', es_props
+        return es_type, es_props
+
     def get_es_type(self, json_type, json_format=None):
         """Return the elasticsearch type matching the given json type.
 
@@ -126,238 +546,570 @@ class ElasticMappingGeneratorConfig(object):
             stored = self._formats_map.get(json_format)
         else:
             stored = self._types_map[json_type]
-        props = stored.get('props') or {}
-        if (stored['type'] == 'date' and 'format' not in props):
+        es_type = stored['type']
+        # "string" was split in "text" and "keyword" in elasticsearch 5
+        if es_type == 'string' and self.es_version >= 5:
+            es_type = 'text'
+        # copy the stored properties so that concurrent generations never
+        # modify the configuration
+        props = dict(stored.get('props') or {})
+        if (es_type == 'date' and 'format' not in props):
             props['format'] = self.date_format
-        return (stored['type'], props)
+        # norms were an object before elasticsearch 5
+        if isinstance(props.get('norms'), bool) and self.es_version < 5:
+            props['norms'] = {'enabled': props['norms']}
+        return (es_type, props)
 
 
-def schema_to_mapping(json_schema, base_uri, context_schemas, config):
+def schema_to_mapping(json_schema, base_uri, context_schemas, config,
+                      resolver=None, cache=None, **kwargs):
     """Generate an elasticsearch type properties' mapping from a json schema.
 
     It generates only the "type" and "properties" fields.
 
+    The schema is first compiled with
+    :py:func:`domapping.compiler.compile_schema`. Use
+    :py:func:`compiled_schema_to_mapping` directly in order to generate the
+    mappings of the same schema with multiple configurations.
+
+    This function is thread-safe as long as the configuration is not modified
+    while generating and a resolver is not used by multiple threads. Use a
+    shared ``cache`` instead of a shared resolver in order to reuse resolved
+    references between threads.
+
     :param json_schema: json schema used to generate the elasticsearch mapping
     :param base_uri: json path pointing to the given json_schema. Used for
     debug.
     :param context_schemas: dict of schema_id -> schema used to resolve
         references.
     :param config: configuration used to generate the elasticsearch mapping.
+    :param resolver: :py:class:`domapping.resolver.SchemaResolver`, or
+        jsonschema ``RefResolver``, shared by multiple calls, for example
+        when mapping a stream of schemas. The given schema is registered in
+        its store under ``base_uri`` so that documents fetched while mapping
+        previous schemas are reused. A new resolver is created when ``None``.
+    :param cache: :py:class:`domapping.resolver.ResolutionCache` used by the
+        created resolver. It can be shared by concurrent generations.
+    :param kwargs: other compilation options of
+        :py:func:`domapping.compiler.compile_schema`, for example the
+        ``recursion_policy`` of recursive schemas.
     """
-    resolver = jsonschema.RefResolver(referrer=json_schema,
-                                      store=context_schemas,
-                                      base_uri=base_uri)
-    return _gen_type_properties(json_schema, base_uri, resolver, config, {
-        '_all': {'enabled': config.all_field},
+    compiled_schema = compile_schema(json_schema, base_uri, context_schemas,
+                                     resolver=resolver, cache=cache, **kwargs)
+    return compiled_schema_to_mapping(compiled_schema, config)
+
+
+def schema_to_mappings(json_schema, base_uri, context_schemas, configs,
+                       resolver=None, cache=None, **kwargs):
+    """Generate the mappings of multiple targets from a json schema.
+
+    The schema is resolved, validated and compiled once. Only the generation
+    of the fields, which depends on the configuration, is done per target.
+
+    :param json_schema: json schema used to generate the elasticsearch
+        mappings.
+    :param base_uri: json path pointing to the given json_schema.
+    :param context_schemas: dict of schema_id -> schema used to resolve
+        references.
+    :param configs: dict of target name -> configuration, for example one
+        configuration per elasticsearch cluster version.
+    :param resolver: see :py:func:`schema_to_mapping`.
+    :param cache: see :py:func:`schema_to_mapping`.
+    :param kwargs: see :py:func:`schema_to_mapping`.
+    :return: dict of target name -> mapping.
+    """
+    compiled_schema = compile_schema(json_schema, base_uri, context_schemas,
+                                     resolver=resolver, cache=cache, **kwargs)
+    return {name: compiled_schema_to_mapping(compiled_schema, config)
+            for name, config in iteritems(configs)}
+
+
+def compiled_schema_to_mapping(compiled_schema, config):
+    """Generate an elasticsearch type mapping from a compiled schema.
+
+    The generation is a single pass over the compiled schema.
+
+    :param compiled_schema: schema returned by
+        :py:func:`domapping.compiler.compile_schema`.
+    :param config: configuration used to generate the elasticsearch mapping.
+    """
+    templates = []
+    sources = ([], [])
+    path = compiled_schema.get('id', '#')
+    mapping = _gen_type_properties(compiled_schema, path, config,
+                                   _new_root_mapping(config),
+                                   templates=templates, sources=sources)
+    _add_source(mapping, config, *sources)
+    _add_catch_all(mapping['properties'], path, config)
+    if templates:
+        mapping['dynamic_templates'] = templates
+    return mapping
+
+
+def _new_root_mapping(config):
+    """Create the root type mapping, before any property is added to it.
+
+    :param config: configuration used to generate the elasticsearch mapping.
+    """
+    root_mapping = {
+        # the catch-all field replaces the "_all" field
+        '_all': {'enabled': (config.all_field and
+                             config.catch_all_field is None)},
         'numeric_detection': config.numeric_detection,
         'date_detection': config.date_detection,
         # empty type mapping
         'properties': {},
-    })
-
-
-_collection_keys = frozenset(['allOf', 'anyOf', 'oneOf'])
+    }
+    # the "_all" field is deprecated since elasticsearch 6
+    if config.es_version >= 6:
+        del root_mapping['_all']
+    return root_mapping
 
 
-def _gen_type_properties(json_schema, path, resolver, config, es_mapping):
+def _gen_type_properties(json_schema, path, config, es_mapping, names=(),
+                         templates=None, sources=None):
     """Generate an elasticsearch type properties' mapping from a json schema.
 
     The mapping's type generation is recursive.
     It generates only the "type" and "properties" fields.
 
-    :param json_schema: json schema used to generate the elasticsearch mapping
+    :param json_schema: compiled json schema used to generate the
+        elasticsearch mapping.
     :param path: json path pointing to the given json_schema. Used for debug.
-    :param resolver: jsonschema resolver used to retrieve referenced schemas.
     :param config: configuration used to generate the elasticsearch mapping.
     :param es_mapping: elasticsearch mapping corresponding to the given schema.
-        It is necessary as multiple paths in the json schema may point to the
-        same elasticsearch mapping element.
+        It is necessary as multiple definitions of a field in the json schema
+        are merged in the same elasticsearch mapping element.
+    :param names: tuple of the names of the path of the field.
+    :param templates: list extended with the dynamic templates of the
+        field and its subfields.
+    :param sources: (includes, excludes) tuple of lists extended with the
+        dotted paths of the field and its subfields having a "source"
+        annotation, see :py:func:`_collect_source_filters`.
     """
-    has_scope = 'id' in json_schema
-    # update the current scope if the schema has an id
-    if has_scope:
-        resolver.push_scope(json_schema.get('id'))
-
-    def dict_search_and_retrieve(d, key=None):
-        """Get the values associated to a specific key in nested dicts.
-
-        :param d: Dictionnary to explore.
-        :type d: dict
-        :param key: key to look value for. If ``None``, it returns all values.
-        :type key: str
-        :return: A list containing the value associated to key.
-        :rtype: list
-        """
-        for k in d.keys():
-            if isinstance(d[k], dict):
-                for val in dict_search_and_retrieve(d[k], key):
-                    yield val
-            else:
-                if (key and k == key) or not key:
-                    yield d[k]
-
-    # resolve reference if there are any
-    while '$ref' in json_schema:
-        path = json_schema.get('$ref')
-        json_schema = resolver.resolve(path)[1]
-
-    if 'patternProperties' in json_schema:
-        raise JsonSchemaSupportError('Schemas with patternProperties ' +
-                                     'are not supported.', path)
-
-    additionalPropertiesVals = dict_search_and_retrieve(json_schema,
-                                                        'additionalProperties')
-
-    # Check if we have any other value than False.
-    # False means that no additionalProperties are allowed.
-    # https://spacetelescope.github.io/
-    # understanding-json-schema/reference/object.html#properties
-    if any(additionalPropertiesVals):
-        raise JsonSchemaSupportError('Schemas with ' +
-                                     'additionalProperties are not ' +
-                                     'supported.', path)
-
     if es_mapping is None:
         es_mapping = {}
-
-    # if the schema is in fact a collection of schemas, merge them
-    json_schema_keys = set(json_schema.keys())
-    collection_intersect = json_schema_keys.intersection(_collection_keys)
-    if collection_intersect:
-        # we suppose the schema is valid and only one of the collection keys
-        # is present
-        collection_key = collection_intersect.pop()
-        # visit each schema and use it to extend current elasticsearch
-        # mapping
-        path += '/' + collection_key
-        index = 0
-        for sub_schema in json_schema.get(collection_key):
-            _gen_type_properties(sub_schema, path + '[' + str(index) + ']',
-                                 resolver, config, es_mapping)
-            index += 1
-        return es_mapping
-
-    # get json schema type
-    json_type = json_schema.get('type')
-
-    if not json_type:
-        if 'properties' in json_schema:
-            json_type = 'object'
-        elif 'enum' in json_schema:
-            json_type = _guess_enum_type(json_schema['enum'], path)
-        else:
-            raise UnknownFieldTypeError(
-                'Schema field type cannot be guessed. Only fields with "type"'
-                ' defined or with an "enum" array of strings are supported',
-                path)
-
-    if isinstance(json_type, list):
-        raise JsonSchemaSupportError('Schema with array of types are ' +
-                                     'not supported', path)
-
-    if json_type == 'array':
-        items = json_schema.get('items')
-        # array items type is mandatory
-        if not items:
-            raise JsonSchemaSupportError('Cannot have schema with ' +
-                                         '"array" type without ' +
-                                         'specifying the items type',
-                                         path)
-        # visit each item schema and use it to extend current elasticsearch
-        # mapping
-        path += '/items'
-        if isinstance(items, list):
-            index = 0
-            for item in items:
-                _gen_type_properties(item, path + '[' + str(index) + ']',
-                                     resolver, config, es_mapping)
-                index += 1
-            return es_mapping
-        else:
-            # visit items' schema and use it to extend current elasticsearch
-            # mapping
-            return _gen_type_properties(items, path, resolver, config,
-                                        es_mapping)
-
-    # find the corresponding elasticsearch type
-    if json_type == 'object':
-        es_type = 'object'
-    else:
-        es_type, es_type_props = config.get_es_type(json_type,
-                                                    json_schema.get('format'))
-
-    # if current elasticsearch mapping's type is already known, the new one and
-    # the old should match
-    if 'type' in es_mapping or 'properties' in es_mapping:
-        # 'properties' is set either when the elasticsearch type is 'object' or
-        # for root types
-        old_es_type = ('object' if 'properties' in es_mapping
-                       else es_mapping['type'])
-        if old_es_type != es_type:
-            # elasticsearch root type mapping has no "type" property
-            if 'properties' in es_mapping and 'type' not in es_mapping:
-                raise JsonSchemaSupportError('Root schema type can ' +
-                                             'only be "object".', path)
-            else:
-                raise JsonSchemaSupportError('Redefinition of field ' +
-                                             'with another type is not ' +
-                                             'supported.', path)
-
-    # add the type to the elasticsearch mapping if it is not a root type
-    if 'properties' not in es_mapping:
-        es_mapping['type'] = es_type
-
-    if es_type == 'object':
+    object_schema = _gen_field(json_schema, path, config, es_mapping, names,
+                               templates, sources)
+    if object_schema is not None:
         es_properties = es_mapping.get('properties')
         if not es_properties:
             es_properties = {}
             es_mapping['properties'] = es_properties
         # build the elasticsearch mapping corresponding to each json schema
         # property
-        for prop, prop_schema in iteritems(json_schema['properties']):
+        for prop, prop_schema in iteritems(object_schema['properties']):
             es_properties[prop] = _gen_type_properties(
                 prop_schema,
                 path + '/' + prop,
-                resolver, config,
-                es_properties.get(prop))
-        # visit the dependencies defining additional properties
-        if 'dependencies' in json_schema:
-            deps_path = path + '/dependencies'
-            for prop, deps in iteritems(json_schema['dependencies']):
-                # if this is a "schema dependency", extend our current es
-                # mapping with it
-                if isinstance(deps, dict):
-                    _gen_type_properties(deps, deps_path + '[' + prop + ']',
-                                         resolver, config, es_mapping)
+                config,
+                es_properties.get(prop),
+                names + (prop,),
+                templates,
+                sources)
+    return es_mapping
+
+
+def _gen_field(json_schema, path, config, es_mapping, names=(),
+               templates=None, sources=None):
+    """Generate the mapping of a field, except the mapping of its properties.
+
+    :param json_schema: compiled json schema of the field.
+    :param path: json path pointing to the given json_schema. Used for debug.
+    :param config: configuration used to generate the elasticsearch mapping.
+    :param es_mapping: elasticsearch mapping extended with the field mapping.
+    :param names: tuple of the names of the path of the field.
+    :param templates: list extended with the dynamic templates of the
+        field, see :py:func:`_gen_dynamic`.
+    :param sources: see :py:func:`_gen_type_properties`.
+    :return: the compiled object schema whose properties must be mapped, or
+        ``None`` if the field has no properties.
+    """
+    object_schema = None
+    # the field is defined multiple times, merge the definitions
+    definitions = json_schema.get('allOf')
+    if definitions is None:
+        definitions = [json_schema]
     else:
-        es_mapping['type'] = es_type
-        if es_type_props:
+        path += '/allOf'
+
+    for index, definition in enumerate(definitions):
+        annotation = _domapping_annotation(definition)
+        definition_path = path
+        if definition is not json_schema:
+            # report the path of the schema of the definition
+            definition_path = (annotation.get('path') or
+                               path + '[' + str(index) + ']')
+        json_type = definition['type']
+        if sources is not None and names:
+            _add_source_filter(sources, annotation.get('source'), names)
+
+        # find the corresponding elasticsearch type
+        if json_type == 'object':
+            es_type = 'object'
+        else:
+            es_type, es_type_props = config.get_es_type(
+                json_type, definition.get('format'))
+            string_type = None
+            if json_type in ('integer', 'number'):
+                es_type, es_type_props = config.narrow_numeric_type(
+                    json_type, es_type, es_type_props,
+                    *_numeric_bounds(definitions, json_type))
+            elif json_type == 'string':
+                max_length, pattern, enum_count = _string_constraints(
+                    definitions)
+                string_type = config.infer_string_type(
+                    definition.get('format'), max_length, pattern,
+                    enum_count)
+                if string_type in ('enum', 'keyword'):
+                    es_type, es_type_props = config.get_keyword_type(
+                        max_length, enum=string_type == 'enum')
+        es_params = _es_annotation(definition, json_type == 'object',
+                                   definition_path, config.es_version)
+        if 'type' in es_params:
+            annotated_type = es_params.pop('type')
+            if annotated_type != es_type:
+                es_type = annotated_type
+                # the configured, narrowed or inferred parameters are the
+                # ones of the replaced type, e.g. a date "format"
+                es_type_props = {}
+
+        # if current elasticsearch mapping's type is already known, the new
+        # one and the old should match
+        if 'type' in es_mapping or 'properties' in es_mapping:
+            # 'properties' is set either when the elasticsearch type is
+            # 'object' or for root types
+            old_es_type = ('object' if 'properties' in es_mapping
+                           else es_mapping['type'])
+            if old_es_type == 'nested':
+                old_es_type = 'object'
+            if old_es_type != es_type:
+                # elasticsearch root type mapping has no "type" property
+                if 'properties' in es_mapping and 'type' not in es_mapping:
+                    raise JsonSchemaSupportError('Root schema type can ' +
+                                                 'only be "object".',
+                                                 definition_path)
+                else:
+                    raise JsonSchemaSupportError('Redefinition of field ' +
+                                                 'with another type is not ' +
+                                                 'supported.',
+                                                 definition_path)
+
+        # add the type to the elasticsearch mapping if it is not a root type
+        if es_params.pop('nested', False):
+            if 'properties' in es_mapping and 'type' not in es_mapping:
+                raise JsonSchemaSupportError('Root schema cannot be '
+                                             'nested.', definition_path)
+            es_mapping['type'] = 'nested'
+        elif 'properties' not in es_mapping and \
+                es_mapping.get('type') != 'nested':
+            es_mapping['type'] = es_type
+
+        if es_type == 'object':
+            object_schema = definition
+            if definition.get('enabled') is False:
+                # the object is stored in _source but its content is not
+                # indexed
+                es_mapping['enabled'] = False
+                if not definition['properties']:
+                    object_schema = None
+            else:
+                _gen_dynamic(definition, definition_path, config, es_mapping,
+                             names, templates)
+        else:
             for type_prop, type_prop_value in iteritems(es_type_props):
                 es_mapping[type_prop] = type_prop_value
+            multi_fields = config.get_multi_fields(
+                json_type, definition.get('format'), names,
+                keywords=string_type is None)
+            if multi_fields:
+                es_mapping.setdefault('fields', {}).update(multi_fields)
+            if config.is_copied_to_catch_all(names,
+                                             annotation.get('catch_all')):
+                es_mapping['copy_to'] = config.catch_all_field
+            if config.is_stored(names):
+                es_mapping['store'] = True
+        # field level parameters override the configured ones
+        es_mapping.update(es_params)
+    return object_schema
 
-    # pop the current jsonschema context
-    if has_scope:
-        resolver.pop_scope()
 
-    return es_mapping
+def _gen_dynamic(definition, path, config, es_mapping, names, templates):
+    """Generate the mapping of the unknown properties of an object.
+
+    See :py:attr:`ElasticMappingGeneratorConfig.closed_objects`.
+
+    :param definition: compiled object definition.
+    :param path: json path pointing to the definition. Used for debug.
+    :param config: configuration used to generate the elasticsearch mapping.
+    :param es_mapping: elasticsearch mapping of the object.
+    :param names: tuple of the names of the path of the object.
+    :param templates: list extended with the dynamic templates of the object
+        and of the fields of its templates.
+    """
+    patterns = definition.get('patternProperties', {})
+    additional = definition.get('additionalProperties')
+    if not patterns and additional is None:
+        return
+    if patterns or additional is not False:
+        es_mapping['dynamic'] = True
+    elif config.closed_objects is not None:
+        es_mapping['dynamic'] = config.closed_objects
+
+    # the templates match the direct children of the object
+    path_match = '.'.join(names + ('*',))
+    scope = {'path_match': path_match, 'path_unmatch': path_match + '.*'}
+    for pattern in sorted(patterns):
+        template = dict(scope)
+        template['match_pattern'] = 'regex'
+        template['match'] = _es_regex(pattern)
+        template['mapping'] = _gen_type_properties(
+            patterns[pattern], path + '/patternProperties[' + pattern + ']',
+            config, None, names + ('*',), templates)
+        _add_template(templates, '{}[{}]'.format(path_match, pattern),
+                      template)
+    if isinstance(additional, dict):
+        template = dict(scope)
+        template['mapping'] = _gen_type_properties(
+            additional, path + '/additionalProperties', config, None,
+            names + ('*',), templates)
+        _add_template(templates, path_match, template)
+
 
+def _add_template(templates, name, template):
+    """Add a named dynamic template, unless it is already defined."""
+    if templates is None:
+        raise ValueError('Dynamic templates cannot be generated here.')
+    if not any(name in existing for existing in templates):
+        templates.append({name: template})
 
-def _guess_enum_type(enum_array, path):
-    """Try to guess what a field's type is from the provided enum array.
 
-    Only string values are supported for the time being.
+def _es_regex(pattern):
+    """Convert a json schema pattern to an elasticsearch field name regex.
+
+    Json schema patterns match any part of the name while elasticsearch
+    regular expressions match the whole name.
     """
-    if all(isinstance(value, string_types) for value in enum_array):
-        return 'string'
-    elif all(isinstance(value, integer_types) for value in enum_array):
-        return 'number'
-    else:
-        raise UnknownFieldTypeError(
-            'Mixed types in "{}" enum are not supported. Schema field type'
-            ' cannot be guessed from enum. Only "string" or "integer"'
-            ' values are accepted when "type" is not defined.'.format(
-                enum_array
-            ), path)
+    prefix = suffix = '.*'
+    if pattern.startswith('^'):
+        pattern = pattern[1:]
+        prefix = ''
+    if pattern.endswith('$') and not pattern.endswith('\\$'):
+        pattern = pattern[:-1]
+        suffix = ''
+    if '|' in pattern:
+        pattern = '(?:' + pattern + ')'
+    return prefix + pattern + suffix
+
+
+def _numeric_bounds(definitions, json_type):
+    """Compute the bounds of all the definitions of a numeric field.
+
+    :param definitions: compiled definitions of the field.
+    :param json_type: "integer" or "number".
+    :return: a tuple (inclusive minimum, inclusive maximum, multiple of),
+        each one being ``None`` if any definition does not declare it.
+    """
+    minimums = []
+    maximums = []
+    multiples = set()
+    for definition in definitions:
+        if definition.get('type') != json_type:
+            continue
+        summary = _enum_summary(definition)
+        if summary['type'] == 'integer':
+            # the values of the enum are the tightest bounds
+            minimums.append(summary['minimum'])
+            maximums.append(summary['maximum'])
+            multiples.add(1)
+            continue
+        minimum = definition.get('minimum')
+        if definition.get('exclusiveMinimum') is True:
+            if minimum is not None and json_type == 'integer':
+                minimum = math.floor(minimum) + 1
+        elif not isinstance(definition.get('exclusiveMinimum'),
+                            (bool, type(None))):
+            # draft 6 exclusive bound
+            minimum = definition['exclusiveMinimum']
+            if json_type == 'integer':
+                minimum = math.floor(minimum) + 1
+        maximum = definition.get('maximum')
+        if definition.get('exclusiveMaximum') is True:
+            if maximum is not None and json_type == 'integer':
+                maximum = math.ceil(maximum) - 1
+        elif not isinstance(definition.get('exclusiveMaximum'),
+                            (bool, type(None))):
+            maximum = definition['exclusiveMaximum']
+            if json_type == 'integer':
+                maximum = math.ceil(maximum) - 1
+        minimums.append(minimum)
+        maximums.append(maximum)
+        multiples.add(definition.get('multipleOf'))
+    if None in minimums or None in maximums:
+        return None, None, None
+    return (min(minimums), max(maximums),
+            multiples.pop() if len(multiples) == 1 else None)
+
+
+def _string_constraints(definitions):
+    """Merge the constraints of all the definitions of a string field.
+
+    :param definitions: compiled definitions of the field.
+    :return: a tuple (maxLength, True if all the definitions have a
+        pattern, maximum number of values of the enums). maxLength and the
+        number of values are ``None`` if any definition does not declare
+        them.
+    """
+    max_lengths = []
+    pattern = True
+    enum_count = 0
+    for definition in definitions:
+        if definition.get('type') == 'string':
+            max_lengths.append(definition.get('maxLength'))
+            pattern = pattern and 'pattern' in definition
+            summary = _enum_summary(definition)
+            if enum_count is not None and summary['type'] == 'string':
+                enum_count += summary['count']
+            else:
+                enum_count = None
+    if None in max_lengths:
+        return None, pattern, enum_count
+    return max(max_lengths), pattern, enum_count
+
+
+def _enum_summary(definition):
+    """Return the summary of the enum of a compiled definition.
+
+    :return: the summary computed by the compiler, see
+        :py:func:`domapping.compiler._analyze_enum`, or a summary of type
+        ``None``.
+    """
+    return _domapping_annotation(definition).get('enum', {'type': None})
+
+
+def _domapping_annotation(definition):
+    """Return the "x-domapping" annotation of a definition, or {}."""
+    annotation = definition.get('x-domapping')
+    return annotation if isinstance(annotation, dict) else {}
+
+
+def _collect_source_filters(json_schema, names=(), includes=None,
+                            excludes=None):
+    """Collect the "_source" annotations of a compiled schema.
+
+    :param json_schema: compiled json schema of a field or of the root type.
+    :param names: tuple of the names of the path of the field.
+    :param includes: list extended with the dotted paths of the fields
+        annotated with ``"source": true``.
+    :param excludes: list extended with the dotted paths of the fields
+        annotated with ``"source": false``.
+    :return: the (includes, excludes) tuple.
+    """
+    if includes is None:
+        includes = []
+    if excludes is None:
+        excludes = []
+    for definition in json_schema.get('allOf', [json_schema]):
+        if names:
+            _add_source_filter((includes, excludes),
+                               _domapping_annotation(definition).get('source'),
+                               names)
+        for prop, prop_schema in iteritems(definition.get('properties', {})):
+            _collect_source_filters(prop_schema, names + (prop,), includes,
+                                    excludes)
+    return includes, excludes
+
+
+def _add_source_filter(sources, source, names):
+    """Add the dotted path of a field to the "_source" filters.
+
+    :param sources: (includes, excludes) tuple of lists of dotted paths.
+    :param source: "source" annotation of the field, ignored when ``None``.
+    :param names: tuple of the names of the path of the field.
+    """
+    if source is None:
+        return
+    filters = sources[0] if source else sources[1]
+    dotted_path = '.'.join(names)
+    if dotted_path not in filters:
+        filters.append(dotted_path)
+
+
+def _add_source(root_mapping, config, includes, excludes):
+    """Add the "_source" filters to the root mapping, if there are any.
+
+    :param root_mapping: mapping of the root type.
+    :param config: configuration used to generate the elasticsearch mapping.
+    :param includes: annotated paths added to the configured includes.
+    :param excludes: annotated paths added to the configured excludes.
+    """
+    source = {}
+    for key, configured, annotated in (
+            ('includes', config.source_includes, includes),
+            ('excludes', config.source_excludes, excludes)):
+        paths = list(configured)
+        paths.extend(path for path in annotated if path not in configured)
+        if paths:
+            source[key] = paths
+    if source:
+        root_mapping['_source'] = source
+
+
+def _add_catch_all(es_properties, path, config):
+    """Add the catch-all field to the root properties, if configured.
+
+    :param es_properties: "properties" of the root mapping.
+    :param path: json path of the root schema. Used for debug.
+    :param config: configuration used to generate the elasticsearch mapping.
+    """
+    if config.catch_all_field is None:
+        return
+    if config.catch_all_field in es_properties:
+        raise JsonSchemaSupportError(
+            'The catch-all field "{}" is already defined.'.format(
+                config.catch_all_field), path)
+    es_properties[config.catch_all_field] = config.get_catch_all_mapping()
+
+
+def _es_annotation(definition, object_field, path, es_version):
+    """Validate the "x-elasticsearch" annotation of a field definition.
+
+    :param definition: compiled definition of the field.
+    :param object_field: True if the field is an object.
+    :param path: json path pointing to the definition. Used for debug.
+    :param es_version: major version of the targeted elasticsearch.
+    :return: a copy of the elasticsearch parameters of the field.
+    """
+    annotation = definition.get('x-elasticsearch')
+    if annotation is None:
+        return {}
+    if not isinstance(annotation, dict):
+        raise JsonSchemaSupportError('"x-elasticsearch" should be an '
+                                     'object.', path)
+    accepted = _object_es_parameters if object_field else _leaf_es_parameters
+    for key, value in iteritems(annotation):
+        if key not in accepted:
+            raise JsonSchemaSupportError(
+                'Unsupported "x-elasticsearch" parameter "{}" for {} '
+                'fields.'.format(key, 'object' if object_field else 'leaf'),
+                path)
+        types = _es_parameters[key]
+        if types is not None and (
+                not isinstance(value, types) or
+                # booleans are integers
+                (isinstance(value, bool) and bool not in types) or
+                value not in _es_parameter_values.get(key, (value,))):
+            raise JsonSchemaSupportError(
+                'Invalid value {!r} of "x-elasticsearch" parameter '
+                '"{}".'.format(value, key), path)
+        if key == 'type' and value in ('object', 'nested'):
+            raise JsonSchemaSupportError('Leaf fields cannot be mapped as '
+                                         '"{}".'.format(value), path)
+    es_params = dict(annotation)
+    # norms were an object before elasticsearch 5, as in get_es_type
+    if isinstance(es_params.get('norms'), bool) and es_version < 5:
+        es_params['norms'] = {'enabled': es_params['norms']}
+    return es_params
 
 
 def clean_mapping(mapping):
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of DoMapping.
+# Copyright (C) 2015, 2016 CERN.
+#
+# DoMapping is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# DoMapping is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DoMapping; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Removal of the default parameters of mappings.
+
+Generated mappings repeat parameters which have the value elasticsearch
+would use anyway, e.g. ``"index": true`` or ``"format": null`` when no date
+format is configured. :py:func:`minify_mapping` drops them, which shrinks
+the mapping files and the cluster state without changing the effective
+mapping.
+
+The defaults depend on the elasticsearch version. Parameters whose default
+depends on index settings, e.g. "analyzer", are always kept.
+"""
+
+import numbers
+
+from six import iteritems
+
+# parameter -> default value of every field type
+_common_defaults = {
+    'boost': 1.0,
+    'store': False,
+    'ignore_malformed': False,
+    'coerce': True,
+    'eager_global_ordinals': False,
+    'term_vector': 'no',
+    'similarity': 'BM25',
+}
+# elasticsearch type -> parameter -> default value, from elasticsearch 5
+_type_defaults = {
+    'text': {
+        'index': True,
+        'norms': True,
+        'index_options': 'positions',
+        'position_increment_gap': 100,
+        'fielddata': False,
+    },
+    'keyword': {
+        'index': True,
+        'doc_values': True,
+        'norms': False,
+        'index_options': 'docs',
+    },
+    'date': {'format': 'strict_date_optional_time||epoch_millis'},
+    'object': {'enabled': True},
+    'nested': {'enabled': True},
+}
+# types whose fields are indexed with doc values by default
+_doc_values_types = frozenset([
+    'keyword', 'boolean', 'date', 'long', 'integer', 'short', 'byte',
+    'double', 'float', 'half_float', 'scaled_float', 'ip', 'geo_point',
+])
+# parameters inherited from the enclosing object, with their root value
+_inherited_defaults = {'dynamic': True, 'include_in_all': True}
+# elasticsearch 2 "index" default of strings and of other types
+_es2_index_defaults = {'string': 'analyzed', None: 'not_analyzed'}
+
+
+def minify_mapping(mapping, es_version=2):
+    """Remove the parameters equal to their default value from a mapping.
+
+    :param mapping: type mapping, as generated by
+        :py:func:`domapping.mapping.schema_to_mapping`. It is not modified.
+    :param es_version: major version of the elasticsearch cluster, see
+        :py:attr:`domapping.mapping.ElasticMappingGeneratorConfig.es_version`.
+    :return: the minified mapping.
+    """
+    minified = _minify_field(mapping, es_version, _inherited_defaults,
+                             root=True)
+    if minified.get('numeric_detection') is False:
+        del minified['numeric_detection']
+    if minified.get('date_detection') is True:
+        del minified['date_detection']
+    if minified.get('_all') == {'enabled': True}:
+        del minified['_all']
+    if 'dynamic_templates' in minified:
+        minified['dynamic_templates'] = [
+            {name: dict(template, mapping=_minify_field(
+                template['mapping'], es_version, {}))
+             if 'mapping' in template else template
+             for name, template in iteritems(item)}
+            for item in minified['dynamic_templates']]
+    return minified
+
+
+def _minify_field(es_mapping, es_version, inherited, root=False):
+    """Minify the mapping of a field and of its properties and subfields.
+
+    :param es_mapping: mapping of the field.
+    :param es_version: major version of the elasticsearch cluster.
+    :param inherited: dict of the "dynamic" and "include_in_all" parameters
+        inherited from the enclosing object. Missing parameters are unknown
+        and kept.
+    :param root: True if the mapping is the root type mapping.
+    """
+    minified = {key: value for key, value in iteritems(es_mapping)
+                if value is not None}
+    es_type = minified.get('type')
+    for key, value in list(iteritems(inherited)):
+        if key in minified:
+            if _is_default(minified[key], value):
+                del minified[key]
+            else:
+                inherited = dict(inherited)
+                inherited[key] = minified[key]
+    if 'properties' in minified:
+        # fields having properties are objects by default
+        if es_type == 'object':
+            del minified['type']
+        elif root:
+            es_type = 'object'
+        minified['properties'] = {
+            name: _minify_field(prop, es_version, inherited)
+            for name, prop in iteritems(minified['properties'])}
+    if 'fields' in minified:
+        minified['fields'] = {
+            name: _minify_field(subfield, es_version, {})
+            for name, subfield in iteritems(minified['fields'])}
+    if es_type is None:
+        return minified
+    for key, default in iteritems(_defaults(minified, es_type, es_version)):
+        if key in minified and _is_default(minified[key], default):
+            del minified[key]
+    if minified.get('search_analyzer') is not None and \
+            minified.get('search_analyzer') == minified.get('analyzer'):
+        del minified['search_analyzer']
+    return minified
+
+
+def _defaults(es_mapping, es_type, es_version):
+    """Return the default parameters of a field.
+
+    :param es_mapping: mapping of the field.
+    :param es_type: elasticsearch type of the field.
+    :param es_version: major version of the elasticsearch cluster.
+    """
+    defaults = dict(_common_defaults)
+    if es_version >= 5:
+        defaults.update(_type_defaults.get(es_type, {}))
+        if es_type in _doc_values_types:
+            defaults['doc_values'] = True
+            defaults['index'] = True
+    else:
+        # elasticsearch 2 "string" fields are analyzed by default, and
+        # fields which are not analyzed have doc values
+        defaults['similarity'] = 'default'
+        index = _es2_index_defaults.get(es_type, _es2_index_defaults[None])
+        if es_type in ('object', 'nested'):
+            defaults['enabled'] = True
+        else:
+            defaults['index'] = index
+            if es_mapping.get('index', index) != 'analyzed':
+                defaults['doc_values'] = True
+        if es_type == 'date':
+            defaults['format'] = _type_defaults['date']['format']
+    return defaults
+
+
+def _is_default(value, default):
+    """Check if a parameter value equals its default value.
+
+    Booleans are not numbers here, e.g. ``"boost": true`` is kept, but
+    integers and floats are, e.g. ``"boost": 1`` is dropped.
+    """
+    if isinstance(value, bool) or isinstance(default, bool):
+        return value is default
+    if isinstance(value, numbers.Number):
+        return isinstance(default, numbers.Number) and value == default
+    return value == default
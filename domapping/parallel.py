@@ -0,0 +1,421 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of DoMapping.
+# Copyright (C) 2015, 2016 CERN.
+#
+# DoMapping is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# DoMapping is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DoMapping; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Parallel generation of mappings.
+
+:py:func:`generate_many` maps multiple schemas with a pool of threads.
+
+:py:func:`parallel_schema_to_mapping` maps a single huge schema with a pool
+of processes. The top-level properties of a schema, including the ones
+defined in its "allOf", "anyOf", "oneOf" branches and in its schema
+dependencies, produce independent mapping subtrees. All the definitions of
+a property are compiled and mapped together, as the type of a field depends
+on all of them, and the subtrees are gathered afterwards.
+"""
+
+import contextlib
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+import jsonschema
+from six import iteritems, string_types
+from six.moves.urllib.parse import urldefrag, urljoin
+
+from .compiler import _check_schema, _CompilationContext, _compile_node, \
+    _compile_property
+from .mapping import _add_catch_all, _add_source, _add_template, _gen_field, \
+    _gen_type_properties, _new_root_mapping, schema_to_mapping
+from .resolver import ResolutionCache, SchemaResolver
+
+# state of each worker process, set by _init_worker
+_worker_state = {}
+
+# keywords of the split object schemas which are not compiled with the root
+# mapping, the scopes of the schemas being already known
+_shell_excluded_keys = frozenset(['id', 'properties', 'dependencies'])
+
+
+def generate_many(jobs, config, threads=None, cache=None):
+    """Generate the mappings of multiple schemas with a pool of threads.
+
+    :param jobs: iterable of (json_schema, base_uri, context_schemas) tuples
+        as passed to :py:func:`domapping.mapping.schema_to_mapping`.
+    :param config: configuration shared by all the generations. It must not
+        be modified until all the mappings are generated.
+    :param threads: number of threads. Defaults to the number of CPUs.
+    :param cache: :py:class:`domapping.resolver.ResolutionCache` shared by
+        all the generations. A new cache is used when ``None``.
+    :return: the list of the generated mappings, in the order of the jobs.
+    """
+    if cache is None:
+        cache = ResolutionCache()
+
+    def generate(job):
+        return schema_to_mapping(*job, config=config, cache=cache)
+
+    pool = ThreadPool(threads)
+    try:
+        return pool.map(generate, list(jobs))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def parallel_schema_to_mapping(json_schema, base_uri, context_schemas, config,
+                               processes=None, **kwargs):
+    """Generate an elasticsearch mapping using a pool of processes.
+
+    The result, including the raised errors, is the same as the one of
+    :py:func:`domapping.mapping.schema_to_mapping`. Referenced schemas are
+    fetched once before starting the workers. Schemas which cannot be split
+    in at least two top-level properties are mapped in the current process.
+
+    :param json_schema: json schema used to generate the elasticsearch mapping
+    :param base_uri: json path pointing to the given json_schema.
+    :param context_schemas: dict of schema_id -> schema used to resolve
+        references.
+    :param config: configuration used to generate the elasticsearch mapping.
+    :param processes: number of worker processes. Defaults to the number of
+        CPUs.
+    :param kwargs: compilation options, see
+        :py:func:`domapping.compiler.compile_schema`. Resource limits apply
+        to each worker process.
+    """
+    # check the options before starting any worker
+    _CompilationContext(None, **kwargs)
+    resolver = SchemaResolver(referrer=json_schema, store=context_schemas,
+                              base_uri=base_uri)
+    definitions = []
+    shells = []
+    # the root document is being expanded, see compile_schema
+    if not _collect_units(json_schema, base_uri, resolver, (),
+                          (urldefrag(base_uri)[0],), definitions, shells):
+        return schema_to_mapping(json_schema, base_uri, context_schemas,
+                                 config, **kwargs)
+    units = _group_units(definitions)
+    if len(units) < 2:
+        return schema_to_mapping(json_schema, base_uri, context_schemas,
+                                 config, **kwargs)
+
+    context = dict(context_schemas)
+    context.update(_preload_references(json_schema, base_uri, resolver))
+
+    processes = processes or multiprocessing.cpu_count()
+    chunks = _split(units, processes * 4)
+    pool = multiprocessing.Pool(processes, initializer=_init_worker,
+                                initargs=(json_schema, base_uri, context,
+                                          config, kwargs))
+    try:
+        results = pool.map(_map_units, chunks)
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    # raise the error the sequential generation would raise first: the
+    # first compilation error, then the emission errors in the order of the
+    # properties. The keywords of an object schema which are not properties
+    # are compiled after its properties and before the next definitions.
+    results = [result for chunk_results in results
+               for result in chunk_results]
+    errors = [((position, 1), error) for position, error, _ in results
+              if position is not None]
+    root_node = _compile_root(shells, resolver, kwargs, errors)
+    if errors:
+        raise min(errors, key=lambda error: error[0])[1]
+    mapping = _new_root_mapping(config)
+    templates = []
+    includes = []
+    excludes = []
+    if root_node:
+        _gen_field(root_node, base_uri, config, mapping, (), templates)
+    for (name, _), (_, error, result) in zip(units, results):
+        if error is not None:
+            raise error
+        # fields which are not selected have no mapping
+        if result is not None:
+            field_mapping, field_templates, field_source = result
+            for filters, paths in zip((includes, excludes), field_source):
+                filters.extend(dotted_path for dotted_path in paths
+                               if dotted_path not in filters)
+            mapping['properties'][name] = field_mapping
+            for template in field_templates:
+                _add_template(templates, next(iter(template)),
+                              next(iter(template.values())))
+    _add_source(mapping, config, includes, excludes)
+    _add_catch_all(mapping['properties'], base_uri, config)
+    if templates:
+        mapping['dynamic_templates'] = templates
+    return mapping
+
+
+def _collect_units(json_schema, path, resolver, scopes, refs, units,
+                   shells):
+    """Split an object schema in independently mapped properties.
+
+    :param json_schema: json schema to split.
+    :param path: json path pointing to the given json_schema.
+    :param resolver: jsonschema resolver used to retrieve referenced schemas.
+    :param scopes: tuple of the schema ids and reference urls enclosing the
+        given schema.
+    :param refs: tuple of the resolved reference urls enclosing the given
+        schema, used to detect recursive references as the compiler does.
+    :param units: list extended with (property name, property schema, path,
+        scopes, refs) tuples in the order used by the sequential generation.
+    :param shells: list extended with (object schema, path, scopes, refs,
+        position) tuples of the split object schemas, position being the
+        number of property definitions compiled before the keywords of the
+        object schema which are not properties.
+    :return: False if the schema is not an object schema which can be split,
+        or if it references itself before reaching its properties.
+    """
+    if (not isinstance(json_schema, dict) or
+            not isinstance(json_schema.get('id', ''), string_types)):
+        # the sequential generation reports the error
+        return False
+    pushed = 0
+    if 'id' in json_schema:
+        resolver.push_scope(json_schema['id'])
+        scopes += (json_schema['id'],)
+        pushed += 1
+    try:
+        while '$ref' in json_schema:
+            if not isinstance(json_schema['$ref'], string_types):
+                return False
+            path = json_schema['$ref']
+            url, json_schema = resolver.resolve(path)
+            if url in refs or not isinstance(json_schema, dict):
+                # the sequential generation applies the recursion policy
+                return False
+            resolver.push_scope(url)
+            scopes += (url,)
+            refs += (url,)
+            pushed += 1
+        collection_key = _check_schema(json_schema, path)
+        if collection_key is not None:
+            path += '/' + collection_key
+            for index, sub_schema in enumerate(json_schema[collection_key]):
+                if not _collect_units(sub_schema,
+                                      path + '[' + str(index) + ']',
+                                      resolver, scopes, refs, units,
+                                      shells):
+                    return False
+            return True
+
+        json_type = json_schema.get('type')
+        if json_type is None and 'properties' in json_schema:
+            json_type = 'object'
+        if json_type != 'object':
+            return False
+        for prop, prop_schema in iteritems(json_schema.get('properties',
+                                                           {})):
+            units.append((prop, prop_schema, path + '/' + prop, scopes,
+                          refs))
+        shells.append((json_schema, path, scopes, refs, len(units)))
+        deps_path = path + '/dependencies'
+        for prop, deps in iteritems(json_schema.get('dependencies', {})):
+            if (isinstance(deps, dict) and
+                    not _collect_units(deps, deps_path + '[' + prop + ']',
+                                       resolver, scopes, refs, units,
+                                       shells)):
+                return False
+        return True
+    finally:
+        for _ in range(pushed):
+            resolver.pop_scope()
+
+
+def _group_units(definitions):
+    """Group the property definitions collected by :py:func:`_collect_units`.
+
+    :param definitions: list of (property name, property schema, path,
+        scopes, refs) tuples.
+    :return: list of (property name, list of (property schema, path,
+        scopes, refs, position) tuples) units, in the order of the first
+        definition of each property, position being the index of the
+        definition.
+    """
+    units = []
+    unit_definitions = {}
+    for position, definition in enumerate(definitions):
+        name = definition[0]
+        if name not in unit_definitions:
+            unit_definitions[name] = []
+            units.append((name, unit_definitions[name]))
+        unit_definitions[name].append(definition[1:] + (position,))
+    return units
+
+
+@contextlib.contextmanager
+def _enclosing(context, scopes, refs):
+    """Enter the resolution scopes and references enclosing a schema.
+
+    The compilation of the schema then detects recursive references as the
+    compilation of the whole schema does.
+
+    :param context: :py:class:`domapping.compiler._CompilationContext`.
+    :param scopes: scopes collected by :py:func:`_collect_units`.
+    :param refs: resolved reference urls collected by
+        :py:func:`_collect_units`.
+    """
+    for scope in scopes:
+        context.resolver.push_scope(scope)
+    for url in refs:
+        context.ref_counts[url] = context.ref_counts.get(url, 0) + 1
+        context.ref_stack.append(url)
+    try:
+        yield
+    finally:
+        for url in refs:
+            context.ref_stack.pop()
+            context.ref_counts[url] -= 1
+        for _ in scopes:
+            context.resolver.pop_scope()
+
+
+def _compile_root(shells, resolver, options, errors):
+    """Compile the root of a split schema, without its properties.
+
+    :param shells: object schemas collected by :py:func:`_collect_units`.
+    :param resolver: resolver of the split schema.
+    :param options: compilation options.
+    :param errors: list extended with the ((position, 0), error) tuple of
+        the compilation error, see :py:func:`_collect_units`.
+    :return: the compiled root node.
+    """
+    context = _CompilationContext(resolver, **options)
+    root_node = {}
+    for json_schema, path, scopes, refs, position in shells:
+        shell = {key: value for key, value in iteritems(json_schema)
+                 if key not in _shell_excluded_keys}
+        shell['type'] = 'object'
+        try:
+            with _enclosing(context, scopes, refs):
+                _compile_node(shell, path, context, root_node)
+        except Exception as e:
+            errors.append(((position, 0), e))
+            break
+    return root_node
+
+
+def _preload_references(json_schema, base_uri, resolver):
+    """Fetch every schema referenced directly or indirectly by a schema.
+
+    :return: dict of schema url -> fetched schema.
+    """
+    known = set(resolver.store)
+    visited = set()
+
+    def visit(node, scope):
+        if isinstance(node, list):
+            for item in node:
+                visit(item, scope)
+            return
+        if not isinstance(node, dict):
+            return
+        if isinstance(node.get('id'), string_types):
+            scope = urljoin(scope, node['id'])
+        ref = node.get('$ref')
+        if isinstance(ref, string_types):
+            url = urldefrag(urljoin(scope, ref))[0]
+            if url not in visited:
+                visited.add(url)
+                try:
+                    document = resolver.resolve(url)[1]
+                except jsonschema.RefResolutionError:
+                    # let the workers report the error if the reference is
+                    # really used.
+                    pass
+                else:
+                    visit(document, url)
+        for key, value in iteritems(node):
+            if key != '$ref':
+                visit(value, scope)
+
+    visited.add(urldefrag(base_uri)[0])
+    visit(json_schema, base_uri)
+    return {url: schema for url, schema in iteritems(resolver.store)
+            if url not in known}
+
+
+def _split(units, count):
+    """Split a list in at most count contiguous chunks of similar sizes."""
+    size = -(-len(units) // count)
+    return [units[start:start + size]
+            for start in range(0, len(units), size)]
+
+
+def _init_worker(json_schema, base_uri, context_schemas, config, options):
+    """Initialize the state of a worker process."""
+    resolver = SchemaResolver(referrer=json_schema, store=context_schemas,
+                              base_uri=base_uri)
+    _worker_state['context'] = _CompilationContext(resolver, **options)
+    _worker_state['config'] = config
+    _worker_state['base_uri'] = base_uri
+
+
+def _map_units(units):
+    """Generate the mapping of each unit created by :py:func:`_group_units`.
+
+    Errors are returned instead of being raised so that the parent process
+    raises the one the sequential generation would raise.
+
+    :return: the list of the units' (position, error, result) tuples.
+        Position is the position of the definition whose compilation raised
+        the error, ``None`` if the error was raised by the mapping
+        generation or if there is no error. Result is the (mapping, dynamic
+        templates, "_source" filters) tuple, ``None`` for the units which
+        failed or are not selected.
+    """
+    context = _worker_state['context']
+    config = _worker_state['config']
+    results = []
+    for name, definitions in units:
+        properties = {}
+        position = None
+        try:
+            for prop_schema, path, scopes, refs, position in definitions:
+                with _enclosing(context, scopes, refs):
+                    _compile_property(name, prop_schema, path, context,
+                                      properties)
+        except Exception as e:
+            results.append((position, e, None))
+            continue
+        if name not in properties:
+            results.append((None, None, None))
+            continue
+        templates = []
+        sources = ([], [])
+        try:
+            # the path used by the sequential generation
+            field_mapping = _gen_type_properties(
+                properties[name], _worker_state['base_uri'] + '/' + name,
+                config, None, (name,), templates, sources)
+        except Exception as e:
+            results.append((None, e, None))
+        else:
+            results.append((None, None, (field_mapping, templates, sources)))
+    return results
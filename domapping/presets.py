@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of DoMapping.
+# Copyright (C) 2015, 2016 CERN.
+#
+# DoMapping is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# DoMapping is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DoMapping; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Named configuration presets.
+
+A preset is a configuration dict, as loaded by
+:py:meth:`domapping.mapping.ElasticMappingGeneratorConfig.load`, tuning the
+generated mappings for a workload. Presets are composable: a configuration
+lists them in its ``"presets"`` key and they are loaded in order, before the
+rest of the configuration. Later presets and the configuration itself
+override earlier presets, and ``"x-elasticsearch"`` schema annotations
+override them all, e.g. in order to re-enable ``doc_values`` on the fields
+which are aggregated.
+
+The trade-offs below are estimates based on elasticsearch's documented
+storage costs. Measure them with the actual data before relying on them.
+
+* "ingest": bulk indexing throughput and index size over relevance and
+  analytics. Text fields have no norms, which saves one byte per document
+  and text field, and index only document ids, which removes the positions
+  and frequencies, usually a third to a half of the text inverted index, at
+  the cost of phrase queries and relevance scoring. Numeric and boolean
+  fields have no ``doc_values``: they cannot be sorted nor aggregated, and
+  indexing writes one less columnar structure per field. The "_all" field,
+  which duplicates every value, and dynamic date and numeric detection are
+  disabled.
+* "search": relevance and sorting over size. Text fields keep their norms
+  and positions, and a "raw" keyword subfield of values up to 256
+  characters is added for exact matching, sorting and aggregations, which
+  roughly doubles the indexed size of short strings and adds one field per
+  string to the mapping. Every leaf field is also copied to a "catch_all"
+  text field, the default field of full-text queries, which replaces the
+  "_all" field removed in elasticsearch 6 and indexes every value a second
+  time as text.
+* "keyword-raw": only the "raw" keyword subfield of "search".
+* "no-detection": disables the "_all" field and dynamic date and numeric
+  detection, keeping the mapping of the fields unchanged.
+"""
+
+PRESETS = {
+    'no-detection': {
+        'all_field': False,
+        'date_detection': False,
+        'numeric_detection': False,
+    },
+    'keyword-raw': {
+        'multi_fields': [{
+            'json_type': 'string',
+            'fields': {'raw': {'type': 'keyword', 'ignore_above': 256}},
+        }],
+    },
+    'ingest': {
+        'presets': ['no-detection'],
+        'types': [{
+            'json_type': 'string',
+            'es_type': 'string',
+            'es_props': {'norms': False, 'index_options': 'docs'},
+        }, {
+            'json_type': 'number',
+            'es_type': 'double',
+            'es_props': {'doc_values': False},
+        }, {
+            'json_type': 'integer',
+            'es_type': 'integer',
+            'es_props': {'doc_values': False},
+        }, {
+            'json_type': 'boolean',
+            'es_type': 'boolean',
+            'es_props': {'doc_values': False},
+        }],
+    },
+    'search': {
+        'presets': ['keyword-raw'],
+        'catch_all': {'field': 'catch_all', 'include': ['**']},
+    },
+}
+"""Preset name -> configuration dict."""
+
+
+def get_preset(name):
+    """Return the configuration dict of a preset.
+
+    :param name: name of the preset, one of :py:data:`PRESETS`.
+    :raises ValueError: if the preset does not exist.
+    """
+    try:
+        return PRESETS[name]
+    except KeyError:
+        raise ValueError('Unknown preset "{}". Available presets: {}.'.format(
+            name, ', '.join(sorted(PRESETS))))
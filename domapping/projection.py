@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of DoMapping.
+# Copyright (C) 2015, 2016 CERN.
+#
+# DoMapping is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# DoMapping is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DoMapping; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Selection of the fields of a mapping.
+
+Fields are selected with dotted paths, e.g. ``metadata.title``, where each
+segment is a :py:mod:`fnmatch` pattern and ``**`` matches any number of
+segments. Arrays are transparent: the path of a field of the items of an
+array goes through the array field.
+
+A :py:class:`Projection` is evaluated while traversing the schema, one
+property at a time, so that subtrees which cannot contain any selected field
+are skipped without being resolved.
+"""
+
+from fnmatch import fnmatchcase
+
+SKIP = None
+"""State of the fields which are not selected."""
+
+
+class Projection(object):
+    """Include and exclude patterns of field paths."""
+
+    def __init__(self, include=None, exclude=None):
+        """Constructor.
+
+        :param include: list of path patterns of the selected fields. Their
+            subfields and their parent objects are selected too. Every field
+            is selected when ``None``.
+        :param exclude: list of path patterns of the fields removed, with
+            their subfields, from the selection.
+        """
+        self.include = [_split(pattern) for pattern in include or ()]
+        self.exclude = [_split(pattern) for pattern in exclude or ()]
+
+    def root(self):
+        """Return the state of the root object.
+
+        A state is a tuple (include matches, exclude matches) where matches
+        are frozensets of (pattern index, matched segments) partial matches.
+        Include matches are ``None`` once a field is fully included.
+        """
+        include = None
+        if self.include:
+            include = _advance(self.include,
+                               ((index, 0) for index in
+                                range(len(self.include))), None)
+        exclude = _advance(self.exclude,
+                           ((index, 0) for index in range(len(self.exclude))),
+                           None)
+        return include, exclude
+
+    def child(self, state, name):
+        """Return the state of a property, or :py:data:`SKIP`.
+
+        :param state: state of the object containing the property.
+        :param name: name of the property.
+        """
+        include, exclude = state
+        if exclude:
+            exclude = _advance(self.exclude, exclude, name)
+            if _complete(self.exclude, exclude):
+                return SKIP
+        if include is not None:
+            include = _advance(self.include, include, name)
+            if _complete(self.include, include):
+                include = None
+            elif not include:
+                return SKIP
+        return include, exclude
+
+    @staticmethod
+    def is_partial(state):
+        """Check if only some subfields of a field are selected."""
+        return state[0] is not None
+
+    def matches(self, names):
+        """Check if a field is selected.
+
+        :param names: sequence of the names of the path of the field.
+        """
+        state = self.root()
+        for name in names:
+            state = self.child(state, name)
+            if state is SKIP:
+                return False
+        return not self.is_partial(state)
+
+
+def _split(pattern):
+    """Split a dotted path pattern in segments."""
+    return tuple(pattern.split('.'))
+
+
+def _advance(patterns, matches, name):
+    """Match a path segment against partial matches.
+
+    :param patterns: list of split patterns.
+    :param matches: iterable of (pattern index, matched segments) tuples.
+    :param name: name of the segment. ``None`` only expands the "**"
+        segments matching nothing.
+    :return: frozenset of the resulting partial matches.
+    """
+    result = set()
+    stack = []
+    for index, position in matches:
+        pattern = patterns[index]
+        if name is None:
+            stack.append((index, position))
+        elif position < len(pattern):
+            segment = pattern[position]
+            if segment == '**':
+                # "**" matches the segment and may match the next ones
+                stack.append((index, position))
+                stack.append((index, position + 1))
+            elif fnmatchcase(name, segment):
+                stack.append((index, position + 1))
+    # "**" may match no segment at all
+    while stack:
+        index, position = stack.pop()
+        if (index, position) in result:
+            continue
+        result.add((index, position))
+        pattern = patterns[index]
+        if position < len(pattern) and pattern[position] == '**':
+            stack.append((index, position + 1))
+    return frozenset(result)
+
+
+def _complete(patterns, matches):
+    """Check if one of the partial matches is complete."""
+    for index, position in matches:
+        if position == len(patterns[index]):
+            return True
+    return False
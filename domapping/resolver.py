@@ -0,0 +1,413 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of DoMapping.
+# Copyright (C) 2015, 2016 CERN.
+#
+# DoMapping is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# DoMapping is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DoMapping; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Reference resolution.
+
+:py:class:`SchemaResolver` is the resolver used by default. It memoizes the
+JSON pointers resolved in each document so that resolving a reference again
+is a couple of dict lookups. Documents are never indexed as a whole unless
+a reference uses an "id" which is not a document url.
+
+A resolver holds the resolution scope of the schema being mapped, thus each
+generation task needs its own resolver. What can be shared between tasks is
+the result of the resolution: fetched documents and their indexes. They are
+kept in a :py:class:`ResolutionCache` which can be used from multiple
+threads, including on free-threaded Python builds.
+"""
+
+import contextlib
+import threading
+
+import jsonschema
+from six import iteritems, string_types
+from six.moves.urllib.parse import unquote, urldefrag, urljoin, urlsplit
+from six.moves.urllib.request import urlopen
+
+from . import serialization
+
+try:
+    import requests
+except ImportError:  # pragma: no cover
+    requests = None
+
+
+class StripedCache(object):
+    """Thread-safe cache computing each missing value only once.
+
+    Reads are lock free. Computations of missing values are serialized by a
+    lock chosen from the key's hash so that different keys are mostly
+    computed concurrently while a given key is computed only once.
+    """
+
+    def __init__(self, stripes=16):
+        """Constructor.
+
+        :param stripes: number of locks.
+        """
+        self._values = {}
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def get(self, key, compute):
+        """Return the value of a key, computing it if it is missing.
+
+        :param key: hashable key.
+        :param compute: function without parameters returning the value.
+        """
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+        with self._locks[hash(key) % len(self._locks)]:
+            try:
+                return self._values[key]
+            except KeyError:
+                value = compute()
+                self._values[key] = value
+                return value
+
+    def __contains__(self, key):
+        """Check if the value of a key is cached."""
+        return key in self._values
+
+    def __len__(self):
+        """Return the number of cached values."""
+        return len(self._values)
+
+
+class ResolutionCache(object):
+    """Documents and indexes shared by :py:class:`SchemaResolver` instances.
+
+    Documents are identified by their absolute URI. Schemas mapped with the
+    same cache should thus have distinct ids.
+    """
+
+    def __init__(self, stripes=16):
+        """Constructor.
+
+        :param stripes: number of locks of each cache.
+        """
+        self.documents = StripedCache(stripes)
+        """Remote documents, by URI."""
+        self.indexes = StripedCache(stripes)
+        """JSON pointer and id indexes of the remote documents, by URI."""
+
+
+class SchemaResolver(object):
+    """Lightweight JSON reference resolver.
+
+    It implements the part of the :py:class:`jsonschema.RefResolver`
+    interface used by the mapping generation: ``push_scope``, ``pop_scope``,
+    ``resolution_scope``, ``resolve``, ``resolve_from_url`` and ``store``.
+
+    Each JSON pointer is resolved once per document, the "id" of the
+    subschemas of a document are only collected when a plain name fragment
+    or an unknown url is resolved. Resolving a reference is then a memoized
+    url join followed by dict lookups.
+
+    Each instance must be used by a single task at a time as it keeps the
+    resolution scope.
+    """
+
+    max_memoized_urls = 65536
+    """Maximum number of memoized url joins."""
+
+    def __init__(self, base_uri, referrer, store=(), cache=None,
+                 handlers=()):
+        """Constructor.
+
+        :param base_uri: base URI of the referring document.
+        :param referrer: referring document.
+        :param store: dict of URI -> document, or iterable of (URI, document)
+            tuples, of the documents known in advance.
+        :param cache: :py:class:`ResolutionCache` shared with other resolvers.
+            Only remote documents and their indexes are shared.
+        :param handlers: dict of URI scheme -> function fetching a remote
+            document.
+        """
+        self.referrer = referrer
+        self.cache = cache
+        self.handlers = dict(handlers)
+        self.store = {}
+        for uri, document in iteritems(dict(store)):
+            self.store[urldefrag(uri)[0]] = document
+        self.store[urldefrag(base_uri)[0]] = referrer
+        self.remote_fetches = 0
+        """Number of remote documents retrieved, from the network or from
+        the shared cache."""
+        self._scopes_stack = [base_uri]
+        # (scope, reference) -> (url, document url, decoded fragment)
+        self._urls = {}
+        # document url -> _DocumentIndex
+        self._indexes = {}
+        # document url -> subschema defining this url as its "id"
+        self._subschemas = {}
+
+    @property
+    def resolution_scope(self):
+        """Retrieve the current resolution scope."""
+        return self._scopes_stack[-1]
+
+    @property
+    def base_uri(self):
+        """Retrieve the current base URI, without its fragment."""
+        return urldefrag(self.resolution_scope)[0]
+
+    def push_scope(self, scope):
+        """Enter a new resolution scope, relative to the current one."""
+        self._scopes_stack.append(self._split(self.resolution_scope,
+                                              scope)[0])
+
+    def pop_scope(self):
+        """Exit the current resolution scope."""
+        self._scopes_stack.pop()
+
+    @contextlib.contextmanager
+    def resolving(self, ref):
+        """Resolve a reference and enter its scope.
+
+        :param ref: reference to resolve.
+        """
+        url, resolved = self.resolve(ref)
+        self.push_scope(url)
+        try:
+            yield resolved
+        finally:
+            self.pop_scope()
+
+    def resolve(self, ref):
+        """Resolve a reference in the current scope.
+
+        :param ref: reference to resolve.
+        :return: a tuple (absolute url, resolved document).
+        """
+        url, document_url, fragment = self._split(self.resolution_scope, ref)
+        return url, self._resolve(document_url, fragment)
+
+    def resolve_from_url(self, url):
+        """Resolve an absolute url.
+
+        :param url: url to resolve.
+        :return: the resolved document.
+        """
+        _, document_url, fragment = self._split('', url)
+        return self._resolve(document_url, fragment)
+
+    def resolve_fragment(self, document, fragment):
+        """Resolve a JSON pointer in a document without using the index.
+
+        :param document: document in which the pointer is resolved.
+        :param fragment: decoded JSON pointer.
+        :return: the pointed document.
+        """
+        for part in fragment.lstrip('/').split('/') if fragment else []:
+            part = part.replace('~1', '/').replace('~0', '~')
+            if isinstance(document, list):
+                try:
+                    part = int(part)
+                except ValueError:
+                    pass
+            try:
+                document = document[part]
+            except (TypeError, LookupError):
+                raise jsonschema.RefResolutionError(
+                    'Unresolvable JSON pointer: {!r}'.format(fragment))
+        return document
+
+    def resolve_remote(self, uri):
+        """Fetch a remote document and add it to the store.
+
+        Documents are fetched once for all the resolvers sharing the cache.
+
+        :param uri: URI of the document.
+        :return: the fetched document.
+        """
+        self.remote_fetches += 1
+        if self.cache is not None:
+            document = self.cache.documents.get(
+                uri, lambda: self._fetch(uri))
+        else:
+            document = self._fetch(uri)
+        self.store[uri] = document
+        return document
+
+    def _fetch(self, uri):
+        """Fetch a remote document."""
+        scheme = urlsplit(uri).scheme
+        if scheme in self.handlers:
+            return self.handlers[scheme](uri)
+        if scheme in ('http', 'https') and requests is not None:
+            # requests detects the encoding of json over http
+            return requests.get(uri).json()
+        with contextlib.closing(urlopen(uri)) as response:
+            return serialization.loads(response.read())
+
+    def _split(self, scope, ref):
+        """Join a reference to a scope and split the resulting url.
+
+        :return: a tuple (url, document url, decoded fragment).
+        """
+        # the fragment of the scope does not change the result
+        scope = scope.partition('#')[0]
+        if ref.startswith('#'):
+            # local references, the most frequent ones, need no join
+            fragment = ref[1:]
+            if '%' in fragment:
+                fragment = unquote(fragment)
+            return (scope + ref if fragment else scope), scope, fragment
+        key = (scope, ref)
+        try:
+            return self._urls[key]
+        except KeyError:
+            pass
+        if len(self._urls) >= self.max_memoized_urls:
+            self._urls.clear()
+        url = urljoin(scope, ref)
+        document_url, fragment = urldefrag(url)
+        result = self._urls[key] = (url, document_url, unquote(fragment))
+        return result
+
+    def _resolve(self, document_url, fragment):
+        """Resolve a fragment of a document.
+
+        :param document_url: url of the document, without fragment.
+        :param fragment: decoded fragment.
+        :return: the resolved document.
+        """
+        index = self._index(document_url)
+        try:
+            return index.pointers[fragment]
+        except KeyError:
+            pass
+        if fragment.startswith('/'):
+            try:
+                resolved = self.resolve_fragment(index.document, fragment)
+            except jsonschema.RefResolutionError:
+                # an "id" may look like a JSON pointer
+                if fragment not in index.ids()[0]:
+                    raise
+                return index.ids()[0][fragment]
+            index.pointers[fragment] = resolved
+            return resolved
+        try:
+            return index.ids()[0][fragment]
+        except KeyError:
+            return self.resolve_fragment(index.document, fragment)
+
+    def _document(self, document_url):
+        """Find a document in the store, in the indexed ids or remotely."""
+        try:
+            return self.store[document_url]
+        except KeyError:
+            pass
+        if document_url not in self._subschemas:
+            # the url may be the "id" of a subschema of a known document
+            for url in list(self.store):
+                self._subschemas.update(self._index(url).ids()[1])
+        try:
+            return self._subschemas[document_url]
+        except KeyError:
+            pass
+        try:
+            return self.resolve_remote(document_url)
+        except Exception as e:
+            raise jsonschema.RefResolutionError(e)
+
+    def _index(self, document_url):
+        """Return the :py:class:`_DocumentIndex` of a document."""
+        document = self._document(document_url)
+        index = self._indexes.get(document_url)
+        if index is None or index.document is not document:
+            index = None
+            if (self.cache is not None and
+                    document_url in self.cache.documents):
+                # remote documents are indexed once for all the resolvers
+                index = self.cache.indexes.get(
+                    document_url,
+                    lambda: _DocumentIndex(document, document_url))
+            if index is None or index.document is not document:
+                index = _DocumentIndex(document, document_url)
+            self._indexes[document_url] = index
+        return index
+
+
+class _DocumentIndex(object):
+    """Lazy index of the JSON pointers and the ids of a document."""
+
+    def __init__(self, document, document_url):
+        """Constructor.
+
+        :param document: indexed document.
+        :param document_url: url of the document, without fragment.
+        """
+        self.document = document
+        self.document_url = document_url
+        self.pointers = {'': document}
+        """Resolved JSON pointers, by decoded JSON pointer."""
+        self._ids = None
+        self._lock = threading.Lock()
+
+    def ids(self):
+        """Return the subschemas of the document having an "id".
+
+        The document is walked the first time this is called.
+
+        :return: a tuple (dict of plain name fragment -> subschema, dict of
+            url -> subschema having this url as "id").
+        """
+        if self._ids is None:
+            with self._lock:
+                if self._ids is None:
+                    self._ids = _index_ids(self.document, self.document_url)
+        return self._ids
+
+
+def _index_ids(document, document_url):
+    """Index the ids of a document.
+
+    :param document: document to index.
+    :param document_url: url of the document, without fragment.
+    :return: see :py:meth:`_DocumentIndex.ids`.
+    """
+    names = {}
+    subschemas = {}
+    stack = [(document, True, document_url)]
+    while stack:
+        node, is_root, scope = stack.pop()
+        if isinstance(node, dict):
+            node_id = node.get('id')
+            # the id of the root is the url of the document
+            if not is_root and isinstance(node_id, string_types):
+                scope = urljoin(scope, node_id)
+                id_url, fragment = urldefrag(scope)
+                if fragment:
+                    names.setdefault(fragment, node)
+                elif id_url != document_url:
+                    subschemas.setdefault(id_url, node)
+            children = node.values()
+        else:
+            children = node
+        for value in children:
+            if isinstance(value, (dict, list)):
+                stack.append((value, False, scope))
+    return names, subschemas
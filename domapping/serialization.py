@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of DoMapping.
+# Copyright (C) 2015, 2016 CERN.
+#
+# DoMapping is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# DoMapping is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DoMapping; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""JSON codec used to read schemas and write mappings.
+
+The fastest installed JSON library is used for parsing and for compact
+output. The standard library :py:mod:`json` module is the fallback and is
+always used for indented output so that pretty printed mappings do not
+change with the installed libraries.
+"""
+
+import gzip
+import io
+import json
+import re
+
+from six import binary_type, text_type
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import ujson
+except ImportError:  # pragma: no cover
+    ujson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+
+FORMATS = ('json', 'gzip', 'msgpack')
+"""Supported output formats."""
+
+_GZIP_MAGIC = b'\x1f\x8b'
+
+# runs of digits which can be integers beyond 64 bits. The fast backends
+# parse them as floats, losing precision, so these documents are parsed by
+# the standard library. Long digit runs in strings or fractions are parsed by
+# the standard library too, which is slower but still correct.
+_LONG_DIGITS = re.compile(r'\d{20}')
+_LONG_DIGITS_BYTES = re.compile(br'\d{20}')
+
+
+if orjson is not None:
+    backend = 'orjson'
+
+    def _fast_loads(data):
+        return orjson.loads(data)
+
+    def _fast_dumps(obj):
+        return orjson.dumps(obj).decode('utf-8')
+elif ujson is not None:  # pragma: no cover
+    backend = 'ujson'
+
+    def _fast_loads(data):
+        if isinstance(data, binary_type):
+            data = data.decode('utf-8')
+        return ujson.loads(data)
+
+    def _fast_dumps(obj):
+        return ujson.dumps(obj, escape_forward_slashes=False)
+else:
+    backend = 'json'
+    _fast_loads = None
+    _fast_dumps = None
+
+
+def loads(data):
+    """Parse a JSON document.
+
+    Integers are parsed exactly, whatever their size, as the standard
+    library does.
+
+    :param data: JSON document as a text or bytes string.
+    :return: the parsed document.
+    """
+    if isinstance(data, binary_type):
+        long_digits = _LONG_DIGITS_BYTES
+    else:
+        long_digits = _LONG_DIGITS
+    if _fast_loads is not None and not long_digits.search(data):
+        return _fast_loads(data)
+    if isinstance(data, binary_type):
+        data = data.decode('utf-8')
+    return json.loads(data)
+
+
+def load(fp):
+    """Parse a JSON document read from a file object.
+
+    :param fp: file object opened either in text or in binary mode.
+    :return: the parsed document.
+    """
+    return loads(fp.read())
+
+
+def dumps(obj, indent=None):
+    """Serialize an object as a JSON text string.
+
+    :param obj: object to serialize.
+    :param indent: indentation step. ``None`` produces compact output.
+    """
+    if indent is None:
+        if _fast_dumps is not None:
+            try:
+                return _fast_dumps(obj)
+            except (TypeError, OverflowError):
+                # the fast backend rejects some values, e.g. huge integers.
+                pass
+        return json.dumps(obj, separators=(',', ':'))
+    return json.dumps(obj, indent=indent)
+
+
+def encode(obj, fmt='json', indent=None):
+    """Serialize an object in the given format.
+
+    :param obj: object to serialize.
+    :param fmt: one of :py:data:`FORMATS`. "gzip" is gzip compressed JSON.
+    :param indent: indentation step of JSON formats. ``None`` produces
+        compact output.
+    :return: the serialized object as a bytes string.
+    """
+    if fmt == 'msgpack':
+        if msgpack is None:  # pragma: no cover
+            raise ValueError('The "msgpack" format requires the msgpack '
+                             'package to be installed.')
+        return msgpack.packb(obj, use_bin_type=True)
+    if fmt not in FORMATS:
+        raise ValueError('Unknown format "{}".'.format(fmt))
+    data = dumps(obj, indent=indent).encode('utf-8')
+    if fmt == 'gzip':
+        buf = io.BytesIO()
+        with gzip.GzipFile(fileobj=buf, mode='wb', mtime=0) as gz:
+            gz.write(data)
+        data = buf.getvalue()
+    return data
+
+
+def decode(data, fmt=None):
+    """Deserialize a bytes string produced by :py:func:`encode`.
+
+    :param data: serialized object.
+    :param fmt: one of :py:data:`FORMATS`. When ``None`` gzip compressed
+        data is detected and JSON is assumed otherwise.
+    :return: the deserialized object.
+    """
+    if fmt == 'msgpack':
+        if msgpack is None:  # pragma: no cover
+            raise ValueError('The "msgpack" format requires the msgpack '
+                             'package to be installed.')
+        return msgpack.unpackb(data, raw=False)
+    if isinstance(data, text_type):
+        return loads(data)
+    if fmt == 'gzip' or (fmt is None and data[:2] == _GZIP_MAGIC):
+        with gzip.GzipFile(fileobj=io.BytesIO(data), mode='rb') as gz:
+            data = gz.read()
+    return loads(data)
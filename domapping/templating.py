@@ -29,6 +29,7 @@ import json
 import jinja2
 from six import iteritems
 
+from . import serialization
 from .mapping import clean_mapping
 
 
@@ -117,4 +118,4 @@ def jinja_to_mapping(template, context_paths=None, context_packages=None):
     # generate the mapping from the import jinja template
     mapping_str = jinja_env.from_string(template).render()
     # parse the mapping and clean it (remove keys with null values)
-    return clean_mapping(json.loads(mapping_str))
+    return clean_mapping(serialization.loads(mapping_str))
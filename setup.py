@@ -49,6 +49,9 @@ extras_require = {
     'docs': [
         "Sphinx>=1.4.2",
     ],
+    'msgpack': [
+        'msgpack>=0.5.2',
+    ],
     'tests': tests_require,
 }
 
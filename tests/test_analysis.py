@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of DoMapping.
+# Copyright (C) 2015, 2016 CERN.
+#
+# DoMapping is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# DoMapping is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DoMapping; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Tests of domapping.analysis."""
+
+import json
+
+from click.testing import CliRunner
+
+from domapping import serialization
+from domapping.analysis import analyze_events, analyze_mapping
+from domapping.cli import analyze_cli
+from domapping.events import iter_mapping_events
+from domapping.mapping import ElasticMappingGeneratorConfig, schema_to_mapping
+
+mapping = {
+    '_all': {'enabled': True},
+    'numeric_detection': True,
+    'date_detection': True,
+    'properties': {
+        'title': {
+            'type': 'text',
+            'fields': {'raw': {'type': 'keyword'}},
+        },
+        'authors': {
+            'type': 'nested',
+            'properties': {
+                'name': {'type': 'string'},
+                'affiliation': {
+                    'type': 'object',
+                    'properties': {'name': {'type': 'string'}},
+                },
+            },
+        },
+        'empty': {'type': 'object', 'properties': {}},
+    },
+}
+
+
+def test_analyze_mapping():
+    """Check the measures and the limits."""
+    analysis = analyze_mapping(mapping)
+    assert analysis.total_fields == 7
+    assert analysis.max_depth == 3
+    assert analysis.nested_fields == 1
+    assert analysis.size == len(serialization.dumps(mapping))
+    assert analysis.subtree_fields == {
+        'authors': 3,
+        'authors.affiliation': 1,
+        'empty': 0,
+    }
+    assert analysis.violations == []
+    analysis = analyze_mapping(mapping, {'total_fields': 5, 'depth': None,
+                                         'size': 100})
+    assert analysis.violations == [
+        {'limit': 'total_fields', 'value': 7, 'max': 5},
+        {'limit': 'size', 'value': analysis.size, 'max': 100},
+    ]
+    assert analysis.to_dict(subtrees=1)['largest_subtrees'] == [
+        {'path': 'authors', 'fields': 3},
+    ]
+
+
+def test_analyze_events():
+    """Check that a mapping can be analyzed while it is generated."""
+    json_schema = {
+        'id': 'https://example.org/root_schema.json',
+        'type': 'object',
+        'properties': {
+            'obj': {
+                'type': 'object',
+                'properties': {'attr': {'type': 'integer'}},
+            },
+            'attr': {'type': 'boolean'},
+        },
+    }
+    config = ElasticMappingGeneratorConfig()
+    generated = schema_to_mapping(json_schema, json_schema['id'], {}, config)
+    analysis = analyze_events(iter_mapping_events(
+        json_schema, json_schema['id'], {}, config))
+    assert analysis.to_dict() == analyze_mapping(generated).to_dict()
+    assert analysis.size == len(serialization.dumps(generated))
+
+
+def test_analyze_cli():
+    """Test the analyze command."""
+    runner = CliRunner()
+    result = runner.invoke(analyze_cli, ['-', '-'],
+                           input=json.dumps({'mappings': {'rec': mapping}}))
+    assert result.exit_code == 0
+    assert json.loads(result.output)['rec']['total_fields'] == 7
+    result = runner.invoke(analyze_cli, ['-', '-', '--depth-limit', '2'],
+                           input=json.dumps(mapping))
+    assert result.exit_code == 1
+    assert json.loads(result.output)['violations'] == [
+        {'limit': 'depth', 'value': 3, 'max': 2},
+    ]
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of DoMapping.
+# Copyright (C) 2015, 2016 CERN.
+#
+# DoMapping is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# DoMapping is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DoMapping; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Tests of domapping.budget."""
+
+import json
+
+import pytest
+from click.testing import CliRunner
+
+from domapping.analysis import analyze_mapping
+from domapping.budget import apply_field_budget
+from domapping.cli import schema_to_mapping_cli
+from domapping.compiler import compile_schema
+from domapping.errors import JsonSchemaSupportError
+from domapping.mapping import ElasticMappingGeneratorConfig, \
+    compiled_schema_to_mapping
+
+json_schema = {
+    'id': 'https://example.org/root_schema.json',
+    'type': 'object',
+    'properties': {
+        'a': {
+            'type': 'object',
+            'properties': {
+                'x': {'type': 'string'},
+                'y': {'type': 'string'},
+                'z': {'type': 'string'},
+            },
+        },
+        'b': {
+            'type': 'object',
+            'properties': {
+                'c': {
+                    'type': 'object',
+                    'properties': {
+                        'x': {'type': 'string',
+                              'x-domapping': {'priority': 5}},
+                        'y': {'type': 'string'},
+                    },
+                },
+                'd': {'type': 'string'},
+            },
+        },
+        'e': {'type': 'string'},
+    },
+}
+
+
+@pytest.mark.parametrize('max_fields, priority, keep, disabled', [
+    (10, 'depth', None, []),
+    (7, 'depth', None, ['b']),
+    (7, 'annotation', None, ['a']),
+    (7, 'depth', ['b.c'], ['a']),
+    (3, 'depth', None, ['a', 'b']),
+])
+def test_field_budget(max_fields, priority, keep, disabled):
+    """Test that the least important objects are disabled."""
+    compiled = compile_schema(json_schema, json_schema['id'], {})
+    budgeted, disabled_paths = apply_field_budget(
+        compiled, max_fields, priority=priority, keep=keep)
+    assert disabled_paths == disabled
+    # the compiled schema is not modified
+    assert compiled == compile_schema(json_schema, json_schema['id'], {})
+
+    mapping = compiled_schema_to_mapping(budgeted,
+                                         ElasticMappingGeneratorConfig())
+    fields = []
+
+    def count(properties):
+        for field in properties.values():
+            fields.append(field)
+            count(field.get('properties', {}))
+    count(mapping['properties'])
+    assert len(fields) <= max_fields
+    for path in disabled:
+        field = mapping
+        for name in path.split('.'):
+            field = field['properties'][name]
+        assert field == {'type': 'object', 'enabled': False}
+
+
+@pytest.mark.parametrize('max_fields, disabled', [
+    (18, []),
+    (17, ['b.c']),
+    (13, ['b']),
+    (10, ['a', 'b.c']),
+    (7, ['a', 'b']),
+])
+def test_field_budget_config(max_fields, disabled):
+    """Test counting the fields added by the configuration."""
+    config = ElasticMappingGeneratorConfig()
+    config.load({'presets': ['search']})
+    config.set_catch_all('catch_all')
+    compiled = compile_schema(json_schema, json_schema['id'], {})
+    budgeted, disabled_paths = apply_field_budget(compiled, max_fields,
+                                                  config=config)
+    assert disabled_paths == disabled
+    mapping = compiled_schema_to_mapping(budgeted, config)
+    assert analyze_mapping(mapping).total_fields <= max_fields
+    with pytest.raises(JsonSchemaSupportError):
+        apply_field_budget(compiled, 4, config=config)
+
+
+def test_field_budget_errors():
+    """Test invalid field budgets."""
+    compiled = compile_schema(json_schema, json_schema['id'], {})
+    with pytest.raises(JsonSchemaSupportError):
+        apply_field_budget(compiled, 2)
+    with pytest.raises(ValueError):
+        apply_field_budget(compiled, 10, priority='unknown')
+
+
+def test_field_budget_cli():
+    """Test the --field-budget option of schema_to_mapping."""
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        result = runner.invoke(schema_to_mapping_cli,
+                               ['-', 'mapping.json', '--field-budget', '7',
+                                '--budget-priority', 'annotation'],
+                               input=json.dumps(json_schema))
+        assert not result.exception
+        assert 'Disabled object field "a".' in result.output
+        with open('mapping.json') as mapping_file:
+            mapping = json.load(mapping_file)
+    assert mapping['properties']['a'] == {'type': 'object', 'enabled': False}
+    assert mapping['properties']['b']['properties']['c']['properties'] == {
+        'x': {'type': 'string'},
+        'y': {'type': 'string'},
+    }
@@ -34,8 +34,8 @@ import jinja2
 import pytest
 from click.testing import CliRunner
 
-from domapping.cli import jinja_to_mapping_cli, mapping_to_jinja_cli, \
-    schema_to_mapping_cli
+from domapping.cli import jinja_to_mapping_cli, lint_cli, \
+    mapping_to_jinja_cli, schema_to_mapping_cli
 from domapping.errors import JsonSchemaSupportError, UnknownFieldTypeError
 
 
@@ -244,6 +244,31 @@ def test_schema_to_mapping(src_schema, schemas, config, expected_mapping,
             assert_no_exception(result)
             assert json.loads(result.output) == expected_mapping
 
+        # test the parallel generation
+        result = runner.invoke(
+            schema_to_mapping_cli,
+            [src_schema, '-', '--config', config_file, '-j', '2'],
+        )
+        if expected_exception:
+            assert_exception(result, expected_exception)
+        else:
+            assert_no_exception(result)
+            assert json.loads(result.output) == expected_mapping
+
+        # test the streaming generation
+        result = runner.invoke(
+            schema_to_mapping_cli,
+            [src_schema, '-', '--config', config_file, '--stream', '-t',
+             'schema'],
+        )
+        if expected_exception:
+            assert_exception(result, expected_exception)
+        else:
+            assert_no_exception(result)
+            assert json.loads(result.output) == {
+                'mappings': {'schema': expected_mapping},
+            }
+
         if test_stream:
             # test with a stream instead of a file
             result = runner.invoke(
@@ -675,3 +700,276 @@ def test_jinja_to_mapping():
         )
         assert_no_exception(result)
         assert json.loads(result.output) == expected_output
+
+
+def test_schema_to_mapping_ndjson():
+    """Test schema_to_mapping with a stream of newline delimited schemas."""
+    root_schema = {
+        'id': 'https://example.org/root_schema.json',
+        'type': 'object',
+        'definitions': {
+            'name': {'type': 'string'},
+        },
+        'properties': {
+            'name': {'$ref': '#/definitions/name'},
+        },
+    }
+    envelope = {
+        'id': 'https://example.org/other_schema.json',
+        'mapping_type': 'other',
+        'schema': {
+            'type': 'object',
+            'definitions': {
+                'title': {'type': 'string'},
+            },
+            'properties': {
+                # the definitions of the previous line are not kept
+                'title': {'$ref': '#/definitions/title'},
+            },
+        },
+    }
+    invalid_schema = {
+        'id': 'https://example.org/invalid_schema.json',
+        'type': 'object',
+        'properties': {
+            'attr': {'format': 'not important'},
+        },
+    }
+    malformed_schema = {
+        'id': 'https://example.org/malformed_schema.json',
+        'type': 'object',
+        'properties': {'attr': 'string'},
+    }
+    lines = [json.dumps(root_schema), '', json.dumps(envelope),
+             json.dumps(invalid_schema), '{"not json',
+             json.dumps({'type': 'object', 'properties': {}}),
+             json.dumps({'id': 5, 'type': 'object'}),
+             json.dumps({'id': [], 'schema': {'type': 'object'}}),
+             json.dumps(malformed_schema),
+             json.dumps(root_schema),
+             json.dumps({'id': 'https://example.org/broken_ref.json',
+                         'type': 'object',
+                         'properties': {
+                             'ref': {'$ref': '#/definitions/missing'},
+                         }})]
+    runner = CliRunner()
+    result = runner.invoke(
+        schema_to_mapping_cli,
+        ['-', '-', '--ndjson', '-t', 'default'],
+        input='\n'.join(lines) + '\n',
+    )
+    assert_no_exception(result)
+    output = [json.loads(line) for line in result.output.splitlines()]
+    assert len(output) == 10
+    assert output[0]['mappings']['default']['properties'] == {
+        'name': {'type': 'string'},
+    }
+    assert output[1]['mappings']['other']['properties'] == {
+        'title': {'type': 'string'},
+    }
+    assert output[2]['error']['type'] == 'UnknownFieldTypeError'
+    assert output[2]['error']['line'] == 4
+    assert output[2]['error']['id'] == invalid_schema['id']
+    assert output[2]['error']['path'] == invalid_schema['id'] + '/attr'
+    # invalid json
+    assert output[3]['error']['line'] == 5
+    assert output[4]['error']['type'] == 'JsonSchemaSupportError'
+    # malformed lines do not stop the stream
+    assert output[5]['error']['type'] == 'JsonSchemaSupportError'
+    assert output[6]['error']['type'] == 'JsonSchemaSupportError'
+    assert output[7]['error']['path'] == malformed_schema['id'] + '/attr'
+    assert output[8] == output[0]
+    # the name of the private subclasses of jsonschema is not exposed
+    assert output[9]['error']['type'] == 'RefResolutionError'
+    assert output[9]['error']['path'] == 'https://example.org/broken_ref.json'
+
+    result = runner.invoke(
+        schema_to_mapping_cli,
+        ['-', '-', '--ndjson', '-f', 'gzip'],
+        input=json.dumps(root_schema),
+    )
+    assert result.exit_code != 0
+
+
+def test_schema_to_mapping_incompatible_options():
+    """Test that schema_to_mapping rejects the ignored options."""
+    schema = {
+        'id': 'https://example.org/root_schema#',
+        'type': 'object',
+        'properties': {'name': {'type': 'string'}},
+    }
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        with open('es6.json', 'w') as f:
+            json.dump({'es_version': 6}, f)
+        for options in (['--target', 'es6=es6.json'], ['--stream'],
+                        ['--processes', '2'], ['--compiled']):
+            result = runner.invoke(
+                schema_to_mapping_cli,
+                ['-', '-', '--ndjson'] + options,
+                input=json.dumps(schema),
+            )
+            assert result.exit_code == 2
+            assert 'cannot be used with --ndjson' in result.output
+    result = runner.invoke(
+        schema_to_mapping_cli,
+        ['-', '-', '--compiled', '-j', '2'],
+        input=json.dumps(schema),
+    )
+    assert result.exit_code == 2
+    assert '--compiled cannot be used with --processes' in result.output
+
+
+def test_schema_to_mapping_targets():
+    """Test schema_to_mapping with multiple targets."""
+    schema = {
+        'id': 'https://example.org/root_schema#',
+        'type': 'object',
+        'properties': {
+            'name': {'type': 'string'},
+            'nb': {'type': 'number'},
+        },
+    }
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        with open('base.json', 'w') as f:
+            json.dump({'types': [{'json_type': 'number',
+                                  'es_type': 'float'}]}, f)
+        with open('es6.json', 'w') as f:
+            json.dump({'es_version': 6}, f)
+        with open('es2.json', 'w') as f:
+            json.dump({'all_field': False}, f)
+        result = runner.invoke(
+            schema_to_mapping_cli,
+            ['-', '-', '-c', 'base.json', '--target', 'es2=es2.json',
+             '--target', 'es6=es6.json', '-t', 'doc'],
+            input=json.dumps(schema),
+        )
+        assert_no_exception(result)
+        output = json.loads(result.output)
+        es2 = output['es2']['mappings']['doc']
+        es6 = output['es6']['mappings']['doc']
+        assert es2['_all'] == {'enabled': False}
+        assert es2['properties'] == {'name': {'type': 'string'},
+                                     'nb': {'type': 'float'}}
+        assert '_all' not in es6
+        assert es6['properties'] == {'name': {'type': 'text'},
+                                     'nb': {'type': 'float'}}
+
+        # the configuration files override the presets
+        result = runner.invoke(
+            schema_to_mapping_cli,
+            ['-', '-', '--preset', 'ingest', '--preset', 'keyword-raw',
+             '-c', 'base.json', '--target', 'es6=es6.json'],
+            input=json.dumps(schema),
+        )
+        assert_no_exception(result)
+        es6 = json.loads(result.output)['es6']
+        assert es6['date_detection'] is False
+        assert es6['properties'] == {
+            'name': {'type': 'text', 'norms': False, 'index_options': 'docs',
+                     'fields': {'raw': {'type': 'keyword',
+                                        'ignore_above': 256}}},
+            'nb': {'type': 'float'},
+        }
+
+        result = runner.invoke(
+            schema_to_mapping_cli,
+            ['-', '-', '--target', 'es6'],
+            input=json.dumps(schema),
+        )
+        assert result.exit_code == 2
+
+
+def test_schema_to_mapping_index():
+    """Test schema_to_mapping generating an index body."""
+    schema = {
+        'id': 'https://example.org/root_schema#',
+        'type': 'object',
+        'x-domapping': {'index': {'sort': ['nb'], 'routing': True}},
+        'properties': {'nb': {'type': 'integer'}},
+    }
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        with open('es6.json', 'w') as f:
+            json.dump({'es_version': 6}, f)
+        with open('settings.json', 'w') as f:
+            json.dump({'index.number_of_shards': 2}, f)
+        result = runner.invoke(
+            schema_to_mapping_cli,
+            ['-', '-', '-c', 'es6.json', '--settings', 'settings.json',
+             '-t', 'doc'],
+            input=json.dumps(schema),
+        )
+        assert_no_exception(result)
+        output = json.loads(result.output)
+        assert output['settings'] == {'index.number_of_shards': 2,
+                                      'index.sort.field': ['nb']}
+        assert output['mappings']['doc']['_routing'] == {'required': True}
+
+        result = runner.invoke(
+            schema_to_mapping_cli,
+            ['-', '-', '--index', '--stream'],
+            input=json.dumps(schema),
+        )
+        assert result.exit_code == 2
+
+
+def test_schema_to_mapping_minify():
+    """Test schema_to_mapping removing the default parameters."""
+    schema = {
+        'id': 'https://example.org/root_schema#',
+        'type': 'object',
+        'properties': {'name': {'type': 'string'}},
+    }
+    runner = CliRunner()
+    result = runner.invoke(schema_to_mapping_cli,
+                           ['-', '-', '--minify', '-t', 'doc'],
+                           input=json.dumps(schema))
+    assert_no_exception(result)
+    assert json.loads(result.output) == {
+        'mappings': {'doc': {
+            # elasticsearch does not detect numbers by default
+            'numeric_detection': True,
+            'properties': {'name': {'type': 'string'}},
+        }},
+    }
+    result = runner.invoke(schema_to_mapping_cli,
+                           ['-', '-', '--minify', '--stream'],
+                           input=json.dumps(schema))
+    assert result.exit_code == 2
+
+
+def test_lint():
+    """Test linting a directory of schemas."""
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        os.mkdir('schemas')
+        os.mkdir('schemas/records')
+        with open('schemas/author.json', 'w') as f:
+            json.dump({
+                'id': 'https://example.org/author.json',
+                'type': 'object',
+                'properties': {'name': {'type': 'string'}},
+            }, f)
+        with open('schemas/records/record.json', 'w') as f:
+            json.dump({
+                'id': 'https://example.org/record.json',
+                'type': 'object',
+                'properties': {
+                    'author': {'$ref': 'https://example.org/author.json'},
+                    'untyped': {},
+                    'list': {'type': 'array'},
+                },
+            }, f)
+        result = runner.invoke(lint_cli, ['schemas', '-j', '1'])
+        assert result.exit_code == 1
+        report = json.loads(result.output)
+        assert report['schemas'] == 2
+        assert report['errors'] == 2
+        assert list(report['failures']) == ['records/record.json']
+
+        os.remove('schemas/records/record.json')
+        result = runner.invoke(lint_cli, ['schemas', '-j', '1'])
+        assert_no_exception(result)
+        assert json.loads(result.output)['failures'] == {}
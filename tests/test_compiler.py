@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of DoMapping.
+# Copyright (C) 2015, 2016 CERN.
+#
+# DoMapping is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# DoMapping is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DoMapping; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Tests of domapping.compiler."""
+
+import json
+import pickle
+
+import pytest
+import responses
+from click.testing import CliRunner
+
+from domapping.cli import compile_schema_cli, schema_to_mapping_cli
+from domapping.compiler import compile_schema
+from domapping.errors import JsonSchemaSupportError, ResourceLimitError, \
+    SchemaRecursionError
+from domapping.limits import ResourceLimits
+from domapping.lint import lint_schema
+from domapping.mapping import ElasticMappingGeneratorConfig, \
+    compiled_schema_to_mapping, schema_to_mapping
+
+json_schema = {
+    'id': 'https://example.org/root_schema.json',
+    'type': 'object',
+    'definitions': {
+        'date': {'type': 'string', 'format': 'date', 'title': 'Date'},
+    },
+    'allOf': [{
+        'properties': {
+            'title': {'type': 'string', 'maxLength': 20},
+            'created': {'$ref': '#/definitions/date'},
+            'kind': {'enum': ['a', 'b']},
+            'tags': {
+                'type': 'array',
+                'items': {
+                    'type': 'object',
+                    'properties': {'tag': {'type': 'string'}},
+                },
+            },
+        },
+    }, {
+        'properties': {
+            'tags': {
+                'type': 'array',
+                'items': [{
+                    'type': 'object',
+                    'properties': {'score': {'type': 'number'}},
+                }],
+            },
+            # field defined twice with different schemas
+            'created': {'type': 'string'},
+        },
+    }],
+}
+
+compiled = {
+    'id': 'https://example.org/root_schema.json',
+    'type': 'object',
+    'properties': {
+        'title': {'type': 'string', 'maxLength': 20},
+        'created': {'allOf': [
+            {'type': 'string', 'format': 'date',
+             'x-domapping': {'path': '#/definitions/date'}},
+            {'type': 'string', 'x-domapping': {
+                'path': 'https://example.org/root_schema.json/allOf[1]/'
+                        'created'}},
+        ]},
+        'kind': {'type': 'string', 'enum': ['a', 'b'],
+                 'x-domapping': {'enum': {'type': 'string', 'count': 2}}},
+        'tags': {
+            'type': 'object',
+            'properties': {
+                'tag': {'type': 'string'},
+                'score': {'type': 'number'},
+            },
+        },
+    },
+}
+
+
+def test_compile_schema():
+    """Test that references, collections, enums and arrays are compiled."""
+    result = compile_schema(json_schema, json_schema['id'], {})
+    assert result == compiled
+    # compiling a compiled schema changes nothing
+    assert compile_schema(result, result['id'], {}) == compiled
+    # a compiled schema is plain json
+    assert json.loads(json.dumps(result)) == compiled
+
+
+def test_compiled_schema_to_mapping():
+    """Test mapping a compiled schema with multiple configurations."""
+    default_config = ElasticMappingGeneratorConfig()
+    float_config = ElasticMappingGeneratorConfig().map_type(
+        es_type='float', json_type='number')
+    for config in (default_config, float_config):
+        assert compiled_schema_to_mapping(compiled, config) == \
+            schema_to_mapping(json_schema, json_schema['id'], {}, config)
+    assert compiled_schema_to_mapping(compiled, float_config)[
+        'properties']['tags']['properties']['score'] == {'type': 'float'}
+    # the definitions of "created" are incompatible with this configuration
+    date_config = ElasticMappingGeneratorConfig().map_type(
+        es_type='date', json_type='string', json_format='date')
+    with pytest.raises(JsonSchemaSupportError) as error:
+        compiled_schema_to_mapping(compiled, date_config)
+    assert error.value.path == json_schema['id'] + '/allOf[1]/created'
+
+
+def test_redefinition_error_paths():
+    """Check that redefinition errors report the path of their schema."""
+    json_schema = {
+        'id': 'https://example.org/root_schema.json',
+        'type': 'object',
+        'definitions': {
+            'd1': {'oneOf': [
+                {'type': 'string'},
+                {'type': 'array', 'items': {'type': 'integer'}},
+            ]},
+        },
+        'properties': {
+            # identical definitions do not shift the reported index
+            'r': {'oneOf': [{'type': 'string'}, {'type': 'string'},
+                            {'type': 'integer'}]},
+            'q': {'$ref': '#/definitions/d1'},
+        },
+    }
+    config = ElasticMappingGeneratorConfig()
+    errors = lint_schema(json_schema, json_schema['id'], {}, config)
+    assert sorted(error['path'] for error in errors) == [
+        '#/definitions/d1/oneOf[1]/items',
+        json_schema['id'] + '/r/oneOf[2]',
+    ]
+    del json_schema['properties']['q']
+    with pytest.raises(JsonSchemaSupportError) as error:
+        schema_to_mapping(json_schema, json_schema['id'], {}, config)
+    assert error.value.path == json_schema['id'] + '/r/oneOf[2]'
+    # the paths survive the serialization of the compiled schema
+    compiled_schema = json.loads(json.dumps(
+        compile_schema(json_schema, json_schema['id'], {})))
+    with pytest.raises(JsonSchemaSupportError) as error:
+        compiled_schema_to_mapping(compiled_schema, config)
+    assert error.value.path == json_schema['id'] + '/r/oneOf[2]'
+
+
+def test_compile_schema_cli():
+    """Test compile_schema and schema_to_mapping --compiled commands."""
+    runner = CliRunner()
+    result = runner.invoke(compile_schema_cli, ['-', '-', '-f', 'gzip'],
+                           input=json.dumps(json_schema))
+    assert not result.exception
+    compiled_output = result.stdout_bytes
+    result = runner.invoke(schema_to_mapping_cli, ['-', '-', '--compiled'],
+                           input=compiled_output)
+    assert not result.exception
+    assert json.loads(result.output) == schema_to_mapping(
+        json_schema, json_schema['id'], {}, ElasticMappingGeneratorConfig())
+
+
+recursive_schema = {
+    'id': 'https://example.org/tree.json',
+    'type': 'object',
+    'definitions': {
+        'node': {
+            'type': 'object',
+            'properties': {
+                'name': {'type': 'string'},
+                'children': {
+                    'type': 'array',
+                    'items': {'$ref': '#/definitions/node'},
+                },
+            },
+        },
+    },
+    'properties': {'root': {'$ref': '#/definitions/node'}},
+}
+
+
+def test_recursive_schema():
+    """Test the recursion policies."""
+    config = ElasticMappingGeneratorConfig()
+    uri = recursive_schema['id']
+    node_uri = uri + '#/definitions/node'
+    with pytest.raises(SchemaRecursionError) as error:
+        schema_to_mapping(recursive_schema, uri, {}, config)
+    assert error.value.cycle == [node_uri, node_uri]
+    assert error.value.path == '#/definitions/node'
+
+    def node(children):
+        properties = {'name': {'type': 'string'}}
+        if children is not None:
+            properties['children'] = children
+        return {'type': 'object', 'properties': properties}
+
+    truncated = schema_to_mapping(recursive_schema, uri, {}, config,
+                                  recursion_policy='truncate')
+    assert truncated['properties']['root'] == node(None)
+    # expand the recursive reference one more time
+    truncated = schema_to_mapping(recursive_schema, uri, {}, config,
+                                  recursion_policy='truncate',
+                                  max_recursion=1)
+    assert truncated['properties']['root'] == node(node(None))
+
+    disabled = schema_to_mapping(recursive_schema, uri, {}, config,
+                                 recursion_policy='disable')
+    assert disabled['properties']['root'] == node(
+        {'type': 'object', 'enabled': False})
+    # the stub survives a new compilation
+    compiled = compile_schema(recursive_schema, uri, {},
+                              recursion_policy='disable')
+    assert compile_schema(compiled, uri, {}) == compiled
+
+    dynamic = schema_to_mapping(recursive_schema, uri, {}, config,
+                                recursion_policy='object')
+    assert dynamic['properties']['root'] == node(
+        {'type': 'object', 'properties': {}})
+
+    with pytest.raises(ValueError):
+        compile_schema(recursive_schema, uri, {}, recursion_policy='unknown')
+
+    # the root document counts as an expanded reference
+    root_schema = {
+        'id': 'https://example.org/root_tree.json',
+        'type': 'object',
+        'properties': {
+            'name': {'type': 'string'},
+            'children': {'type': 'array', 'items': {'$ref': '#'}},
+        },
+    }
+    with pytest.raises(SchemaRecursionError) as error:
+        schema_to_mapping(root_schema, root_schema['id'], {}, config)
+    assert error.value.cycle == [root_schema['id']] * 2
+    truncated = schema_to_mapping(root_schema, root_schema['id'], {}, config,
+                                  recursion_policy='truncate')
+    assert truncated['properties'] == node(None)['properties']
+    truncated = schema_to_mapping(root_schema, root_schema['id'], {}, config,
+                                  recursion_policy='truncate',
+                                  max_recursion=1)
+    assert truncated['properties'] == node(node(None))['properties']
+
+    runner = CliRunner()
+    result = runner.invoke(schema_to_mapping_cli,
+                           ['-', '-', '--recursion-policy', 'disable'],
+                           input=json.dumps(recursive_schema))
+    assert not result.exception
+    assert json.loads(result.output) == disabled
+
+
+def _diamond_schema(levels):
+    """Create a schema whose references expand exponentially."""
+    definitions = {'level0': {'type': 'string'}}
+    for level in range(1, levels + 1):
+        definitions['level{}'.format(level)] = {
+            'type': 'object',
+            'properties': {
+                'left': {'$ref': '#/definitions/level{}'.format(level - 1)},
+                'right': {'$ref': '#/definitions/level{}'.format(level - 1)},
+            },
+        }
+    return {
+        'definitions': definitions,
+        'allOf': [{'$ref': '#/definitions/level{}'.format(levels)}],
+    }
+
+
+@pytest.mark.parametrize('json_schema, limits, limit, path', [
+    (_diamond_schema(30), ResourceLimits(max_nodes=1000), 'max_nodes', None),
+    (_diamond_schema(30), ResourceLimits(max_fields=100), 'max_fields', None),
+    (_diamond_schema(30), ResourceLimits(max_depth=10), 'max_depth',
+     '#/definitions/level22/left'),
+    (_diamond_schema(30), ResourceLimits(timeout=0), 'timeout', None),
+    ({
+        'type': 'object',
+        'properties': {'huge': {'enum': list(range(100000))}},
+    }, ResourceLimits(max_nodes=1000), 'max_nodes',
+     'https://example.org/root_schema.json/huge'),
+])
+def test_resource_limits(json_schema, limits, limit, path):
+    """Check that exceeding a limit stops the compilation."""
+    with pytest.raises(ResourceLimitError) as error:
+        compile_schema(json_schema, 'https://example.org/root_schema.json',
+                       {}, limits=limits)
+    assert error.value.limit == limit
+    if path is not None:
+        assert error.value.path == path
+    assert set(error.value.counters) == set(['nodes', 'depth', 'fields',
+                                             'fetches', 'seconds'])
+    if limit != 'timeout':
+        assert error.value.counters[limit[4:]] > getattr(limits, limit)
+    # errors can be sent by worker processes
+    assert pickle.loads(pickle.dumps(error.value)).counters == \
+        error.value.counters
+
+
+def test_shared_enum_analysis():
+    """Check that an enum referenced by many fields is analyzed once."""
+    json_schema = {
+        'type': 'object',
+        'definitions': {'code': {'enum': list(range(100000))}},
+        'properties': {
+            'field{}'.format(index): {'$ref': '#/definitions/code'}
+            for index in range(100)
+        },
+    }
+    compiled = compile_schema(json_schema,
+                              'https://example.org/root_schema.json', {},
+                              limits=ResourceLimits(max_nodes=200000))
+    assert compiled['properties']['field0']['x-domapping'] == {
+        'enum': {'type': 'integer', 'count': 100000,
+                 'minimum': 0, 'maximum': 99999},
+    }
+
+
+def test_max_fetches():
+    """Check the limit of remote documents."""
+    json_schema = {
+        'id': 'https://example.org/root_schema.json',
+        'type': 'object',
+        'properties': {
+            'attr{}'.format(idx): {
+                '$ref': 'https://example.org/schema{}.json'.format(idx),
+            } for idx in range(3)
+        },
+    }
+    with responses.RequestsMock(assert_all_requests_are_fired=False) as rsps:
+        for idx in range(3):
+            rsps.add(responses.GET,
+                     'https://example.org/schema{}.json'.format(idx),
+                     body=json.dumps({'type': 'string'}),
+                     content_type='application/json')
+        compile_schema(json_schema, 'https://example.org/root_schema.json',
+                       {}, limits=ResourceLimits(max_fetches=3))
+        with pytest.raises(ResourceLimitError) as error:
+            compile_schema(json_schema,
+                           'https://example.org/root_schema.json', {},
+                           limits=ResourceLimits(max_fetches=2))
+        assert error.value.counters['fetches'] == 3
+
+        runner = CliRunner()
+        result = runner.invoke(schema_to_mapping_cli,
+                               ['-', '-', '--max-fields', '1'],
+                               input=json.dumps(json_schema))
+    assert isinstance(result.exception, ResourceLimitError)
+    assert result.exception.limit == 'max_fields'
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of DoMapping.
+# Copyright (C) 2015, 2016 CERN.
+#
+# DoMapping is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# DoMapping is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DoMapping; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Tests of domapping.events."""
+
+import io
+import json
+
+import pytest
+
+from domapping import serialization
+from domapping.analysis import analyze_mapping
+from domapping.errors import JsonSchemaSupportError
+from domapping.events import build_mapping, dump_events, iter_dict_events, \
+    iter_mapping_events
+from domapping.mapping import ElasticMappingGeneratorConfig, schema_to_mapping
+
+json_schema = {
+    'id': 'https://example.org/root_schema.json',
+    'type': 'object',
+    'properties': {
+        'title': {'type': 'string'},
+        'empty': {'type': 'object', 'properties': {}},
+        'author': {
+            'type': 'object',
+            'patternProperties': {'^x-': {'type': 'string'}},
+            'properties': {
+                'name': {'type': 'string'},
+                'address': {
+                    'type': 'object',
+                    'properties': {'city': {'type': 'string'}},
+                },
+            },
+        },
+        'date': {'type': 'string'},
+    },
+}
+
+
+def test_iter_mapping_events():
+    """Check the events and their consumers."""
+    config = ElasticMappingGeneratorConfig()
+    events = list(iter_mapping_events(json_schema, json_schema['id'], {},
+                                      config))
+    assert [(event, path) for event, path, _ in events] == [
+        ('start_object', ()),
+        ('field', ('title',)),
+        ('start_object', ('empty',)),
+        ('end_object', ('empty',)),
+        ('start_object', ('author',)),
+        ('field', ('author', 'name')),
+        ('start_object', ('author', 'address')),
+        ('field', ('author', 'address', 'city')),
+        ('end_object', ('author', 'address')),
+        ('end_object', ('author',)),
+        ('field', ('date',)),
+        ('end_object', ()),
+    ]
+    assert events[0][2] == {
+        '_all': {'enabled': True},
+        'numeric_detection': True,
+        'date_detection': True,
+    }
+    assert events[-2][2] == {'type': 'string'}
+    # the dynamic templates follow the root properties
+    assert list(events[-1][2]) == ['dynamic_templates']
+
+    expected = schema_to_mapping(json_schema, json_schema['id'], {}, config)
+    assert build_mapping(events) == expected
+    assert analyze_mapping(expected).size == \
+        len(serialization.dumps(expected))
+    for indent in (None, 2, 4):
+        output = io.BytesIO()
+        dump_events(events, output, indent=indent)
+        assert output.getvalue().decode('utf-8') == \
+            serialization.dumps(expected, indent=indent)
+        output = io.BytesIO()
+        dump_events(iter_dict_events(expected), output, indent=indent)
+        assert output.getvalue().decode('utf-8') == \
+            serialization.dumps(expected, indent=indent)
+        output = io.BytesIO()
+        dump_events(events, output, indent=indent,
+                    wrappers=('mappings', 'record'))
+        assert json.loads(output.getvalue().decode('utf-8')) == \
+            {'mappings': {'record': expected}}
+
+
+def test_iter_mapping_events_errors():
+    """Check that errors are raised when reaching the failing field."""
+    json_schema = {
+        'id': 'https://example.org/root_schema.json',
+        'type': 'object',
+        'allOf': [{
+            'properties': {
+                'first': {'type': 'string'},
+                'second': {'type': 'string'},
+            },
+        }, {
+            'properties': {'second': {'type': 'boolean'}},
+        }],
+    }
+    events = iter_mapping_events(json_schema, json_schema['id'], {},
+                                 ElasticMappingGeneratorConfig())
+    assert next(events)[0] == 'start_object'
+    assert next(events)[1] == ('first',)
+    with pytest.raises(JsonSchemaSupportError) as error:
+        next(events)
+    assert error.value.path == json_schema['id'] + '/allOf[1]/second'
@@ -29,8 +29,12 @@ import json
 import pytest
 import responses
 
+from domapping.analysis import analyze_mapping
 from domapping.errors import JsonSchemaSupportError
-from domapping.mapping import ElasticMappingGeneratorConfig, schema_to_mapping
+from domapping.events import build_mapping, iter_mapping_events
+from domapping.mapping import ElasticMappingGeneratorConfig, \
+    schema_to_mapping, schema_to_mappings
+from domapping.parallel import parallel_schema_to_mapping
 
 
 def test_simple_properties():
@@ -379,3 +383,813 @@ def test_additionnalproperties_value_to_false():
                                        {},
                                        ElasticMappingGeneratorConfig())
     assert result_mapping == es_mapping
+
+
+def test_multiple_targets():
+    """Test generating the mappings of multiple elasticsearch versions."""
+    json_schema = {
+        'id': 'https://example.org/root_schema#',
+        'type': 'object',
+        'properties': {
+            'title': {'type': 'string'},
+            'created': {'type': 'string', 'format': 'date-time'},
+        },
+    }
+    es2 = ElasticMappingGeneratorConfig()
+    es2.load({
+        'types': [{'json_type': 'string', 'json_format': 'date-time',
+                   'es_type': 'date'}],
+        'date_format': 'YYYY-MM-dd',
+    })
+    es6 = ElasticMappingGeneratorConfig()
+    es6.load({
+        'types': [{'json_type': 'string', 'json_format': 'date-time',
+                   'es_type': 'date'}],
+        'date_format': 'strict_date_optional_time',
+        'es_version': 6,
+    })
+    mappings = schema_to_mappings(json_schema, json_schema['id'], {},
+                                  {'es2': es2, 'es6': es6})
+    assert mappings == {
+        'es2': {
+            '_all': {'enabled': True},
+            'numeric_detection': True,
+            'date_detection': True,
+            'properties': {
+                'title': {'type': 'string'},
+                'created': {'type': 'date', 'format': 'YYYY-MM-dd'},
+            },
+        },
+        'es6': {
+            'numeric_detection': True,
+            'date_detection': True,
+            'properties': {
+                'title': {'type': 'text'},
+                'created': {'type': 'date',
+                            'format': 'strict_date_optional_time'},
+            },
+        },
+    }
+    assert mappings['es6'] == schema_to_mapping(json_schema,
+                                                json_schema['id'], {}, es6)
+
+
+def test_elasticsearch_annotations():
+    """Test merging "x-elasticsearch" parameters in the field mappings."""
+    json_schema = {
+        'id': 'https://example.org/root_schema#',
+        'type': 'object',
+        'allOf': [{
+            'x-elasticsearch': {'dynamic': 'strict'},
+            'properties': {
+                'title': {
+                    'type': 'string',
+                    'x-elasticsearch': {'norms': False,
+                                        'index_options': 'docs'},
+                },
+                'created': {
+                    'type': 'string', 'format': 'date-time',
+                    'x-elasticsearch': {'doc_values': False},
+                },
+                'identifier': {
+                    'type': 'string',
+                    'x-elasticsearch': {'type': 'keyword',
+                                        'eager_global_ordinals': True},
+                },
+                # the parameters of the configured type are dropped
+                'modified': {
+                    'type': 'string', 'format': 'date-time',
+                    'x-elasticsearch': {'type': 'keyword'},
+                },
+                'raw': {'type': 'string',
+                        'x-elasticsearch': {'index': False}},
+                'authors': {
+                    'type': 'array',
+                    'items': {
+                        'type': 'object',
+                        'x-elasticsearch': {'nested': True},
+                        'properties': {'name': {'type': 'string'}},
+                    },
+                },
+            },
+        }, {
+            # the nested annotation applies to all the definitions
+            'properties': {
+                'authors': {
+                    'type': 'array',
+                    'items': {
+                        'type': 'object',
+                        'properties': {'affiliation': {'type': 'string'}},
+                    },
+                },
+            },
+        }],
+    }
+    config = ElasticMappingGeneratorConfig()
+    config.load({
+        'types': [{'json_type': 'string', 'json_format': 'date-time',
+                   'es_type': 'date', 'es_props': {'doc_values': True}}],
+        'es_version': 6,
+    })
+    es_mapping = {
+        'numeric_detection': True,
+        'date_detection': True,
+        'dynamic': 'strict',
+        'properties': {
+            'title': {'type': 'text', 'norms': False,
+                      'index_options': 'docs'},
+            'created': {'type': 'date', 'format': None,
+                        'doc_values': False},
+            'identifier': {'type': 'keyword',
+                           'eager_global_ordinals': True},
+            'modified': {'type': 'keyword'},
+            'raw': {'type': 'text', 'index': False},
+            'authors': {
+                'type': 'nested',
+                'properties': {
+                    'name': {'type': 'text'},
+                    'affiliation': {'type': 'text'},
+                },
+            },
+        },
+    }
+    assert schema_to_mapping(json_schema, json_schema['id'], {},
+                             config) == es_mapping
+
+    # narrowed parameters are dropped too
+    json_schema = {
+        'id': 'https://example.org/root_schema#',
+        'type': 'object',
+        'properties': {
+            'price': {'type': 'number', 'minimum': 0, 'maximum': 100,
+                      'multipleOf': 0.01},
+            'code': {'type': 'number', 'minimum': 0, 'maximum': 100,
+                     'multipleOf': 0.01,
+                     'x-elasticsearch': {'type': 'keyword'}},
+        },
+    }
+    config.load({'numeric_narrowing': 'exact'})
+    properties = schema_to_mapping(json_schema, json_schema['id'], {},
+                                   config)['properties']
+    assert properties == {
+        'price': {'type': 'scaled_float', 'scaling_factor': 100},
+        'code': {'type': 'keyword'},
+    }
+
+
+def test_elasticsearch_annotations_es2():
+    """Test converting "x-elasticsearch" norms for elasticsearch 2."""
+    json_schema = {
+        'id': 'https://example.org/root_schema#',
+        'type': 'object',
+        'properties': {
+            'title': {'type': 'string',
+                      'x-elasticsearch': {'norms': False}},
+            'body': {'type': 'string',
+                     'x-elasticsearch': {'norms': {'enabled': True}}},
+        },
+    }
+    config = ElasticMappingGeneratorConfig()
+    config.load({'es_version': 2})
+    properties = schema_to_mapping(json_schema, json_schema['id'], {},
+                                   config)['properties']
+    assert properties == {
+        'title': {'type': 'string', 'norms': {'enabled': False}},
+        'body': {'type': 'string', 'norms': {'enabled': True}},
+    }
+    config.load({'es_version': 5})
+    properties = schema_to_mapping(json_schema, json_schema['id'], {},
+                                   config)['properties']
+    assert properties['title'] == {'type': 'text', 'norms': False}
+
+
+@pytest.mark.parametrize('field', [
+    {'type': 'string', 'x-elasticsearch': {'unknown': True}},
+    {'type': 'string', 'x-elasticsearch': {'nested': True}},
+    {'type': 'string', 'x-elasticsearch': {'index_options': 'all'}},
+    {'type': 'string', 'x-elasticsearch': {'ignore_above': True}},
+    {'type': 'string', 'x-elasticsearch': {'type': 'nested'}},
+    {'type': 'string', 'x-elasticsearch': 'keyword'},
+    {'type': 'object', 'x-elasticsearch': {'doc_values': False}},
+])
+def test_invalid_elasticsearch_annotations(field):
+    """Check that invalid "x-elasticsearch" parameters are rejected."""
+    json_schema = {
+        'id': 'https://example.org/root_schema#',
+        'type': 'object',
+        'properties': {'field': field},
+    }
+    with pytest.raises(JsonSchemaSupportError):
+        schema_to_mapping(json_schema, json_schema['id'], {},
+                          ElasticMappingGeneratorConfig())
+    json_schema = {
+        'id': 'https://example.org/root_schema#',
+        'type': 'object',
+        'x-elasticsearch': {'nested': True},
+    }
+    with pytest.raises(JsonSchemaSupportError):
+        schema_to_mapping(json_schema, json_schema['id'], {},
+                          ElasticMappingGeneratorConfig())
+
+
+def test_multi_fields():
+    """Test adding subfields to the matching leaf fields."""
+    json_schema = {
+        'id': 'https://example.org/root_schema#',
+        'type': 'object',
+        'properties': {
+            'title': {'type': 'string'},
+            'doi': {'type': 'string', 'format': 'uri'},
+            'count': {'type': 'integer'},
+            'metadata': {
+                'type': 'object',
+                'properties': {
+                    'abstract': {'type': 'string'},
+                    'keywords': {
+                        'type': 'array',
+                        'items': {
+                            'type': 'string',
+                            'x-elasticsearch': {'fields': {}},
+                        },
+                    },
+                },
+            },
+        },
+    }
+    config = ElasticMappingGeneratorConfig()
+    config.load({
+        'es_version': 6,
+        'multi_fields': [{
+            'json_type': 'string',
+            'fields': {'raw': {'type': 'keyword', 'ignore_above': 256}},
+        }, {
+            'json_format': 'uri',
+            'fields': {'raw': {'type': 'keyword'}},
+        }, {
+            'path': 'metadata.abstract',
+            'fields': {'english': {'type': 'string',
+                                   'analyzer': 'english'}},
+        }],
+    })
+    raw = {'type': 'keyword', 'ignore_above': 256}
+    es_mapping = {
+        'numeric_detection': True,
+        'date_detection': True,
+        'properties': {
+            'title': {'type': 'text', 'fields': {'raw': raw}},
+            'doi': {'type': 'text', 'fields': {'raw': {'type': 'keyword'}}},
+            'count': {'type': 'integer'},
+            'metadata': {
+                'type': 'object',
+                'properties': {
+                    'abstract': {
+                        'type': 'text',
+                        'fields': {
+                            'raw': raw,
+                            'english': {'type': 'text',
+                                        'analyzer': 'english'},
+                        },
+                    },
+                    # the annotation overrides the configuration
+                    'keywords': {'type': 'text', 'fields': {}},
+                },
+            },
+        },
+    }
+    assert schema_to_mapping(json_schema, json_schema['id'], {},
+                             config) == es_mapping
+    events = iter_mapping_events(json_schema, json_schema['id'], {}, config)
+    assert build_mapping(events) == es_mapping
+
+
+@pytest.mark.parametrize('es_version, presets, title, count', [
+    (6, ['ingest'],
+     {'type': 'text', 'norms': False, 'index_options': 'docs'},
+     {'type': 'integer', 'doc_values': False}),
+    (2, ['ingest'],
+     {'type': 'string', 'norms': {'enabled': False},
+      'index_options': 'docs'},
+     {'type': 'integer', 'doc_values': False}),
+    (6, ['search'],
+     {'type': 'text',
+      'fields': {'raw': {'type': 'keyword', 'ignore_above': 256}},
+      'copy_to': 'catch_all'},
+     {'type': 'integer', 'copy_to': 'catch_all'}),
+    (2, ['ingest', 'keyword-raw'],
+     {'type': 'string', 'norms': {'enabled': False},
+      'index_options': 'docs',
+      'fields': {'raw': {'type': 'string', 'index': 'not_analyzed',
+                         'ignore_above': 256}}},
+     {'type': 'integer', 'doc_values': False}),
+])
+def test_presets(es_version, presets, title, count):
+    """Test loading composed configuration presets."""
+    json_schema = {
+        'id': 'https://example.org/root_schema#',
+        'type': 'object',
+        'properties': {
+            'title': {'type': 'string'},
+            'count': {'type': 'integer'},
+        },
+    }
+    config = ElasticMappingGeneratorConfig()
+    config.load({'presets': presets, 'es_version': es_version})
+    mapping = schema_to_mapping(json_schema, json_schema['id'], {}, config)
+    assert mapping['properties']['title'] == title
+    assert mapping['properties']['count'] == count
+    if 'ingest' in presets:
+        assert mapping['date_detection'] is False
+        assert mapping['numeric_detection'] is False
+
+    with pytest.raises(ValueError):
+        config.load({'presets': ['unknown']})
+
+
+@pytest.mark.parametrize('es_version', [2, 6])
+def test_search_preset(es_version):
+    """Test the cost of the "search" preset over "keyword-raw"."""
+    json_schema = {
+        'id': 'https://example.org/root_schema#',
+        'type': 'object',
+        'properties': {
+            'title': {'type': 'string'},
+            'count': {'type': 'integer'},
+            'meta': {
+                'type': 'object',
+                'properties': {'note': {'type': 'string'}},
+            },
+        },
+    }
+    analyses = {}
+    for preset in ('keyword-raw', 'search'):
+        config = ElasticMappingGeneratorConfig()
+        config.load({'presets': [preset], 'es_version': es_version})
+        mapping = schema_to_mapping(json_schema, json_schema['id'], {},
+                                    config)
+        analyses[preset] = analyze_mapping(mapping)
+    assert mapping['properties']['catch_all'] == {
+        'type': 'text' if es_version >= 5 else 'string',
+    }
+    assert mapping['properties']['meta']['properties']['note'][
+        'copy_to'] == 'catch_all'
+    if es_version < 6:
+        # the catch-all field replaces "_all"
+        assert mapping['_all'] == {'enabled': False}
+    # the catch-all field is the only added field
+    assert (analyses['search'].total_fields ==
+            analyses['keyword-raw'].total_fields + 1)
+    assert analyses['search'].size > analyses['keyword-raw'].size
+
+
+@pytest.mark.parametrize('narrowing, es_version, field, expected', [
+    (None, 6, {'type': 'integer', 'minimum': 0, 'maximum': 10},
+     {'type': 'integer'}),
+    ('exact', 6, {'type': 'integer', 'minimum': 0, 'maximum': 10},
+     {'type': 'byte'}),
+    ('exact', 6, {'type': 'integer', 'minimum': -1,
+                  'exclusiveMaximum': True, 'maximum': 128},
+     {'type': 'byte'}),
+    ('exact', 6, {'type': 'integer', 'minimum': 0, 'exclusiveMaximum': 65536},
+     {'type': 'integer'}),
+    ('exact', 6, {'type': 'integer', 'minimum': 0, 'maximum': 2 ** 40},
+     # narrowing never widens the configured type
+     {'type': 'integer'}),
+    ('exact', 6, {'type': 'integer', 'minimum': 0}, {'type': 'integer'}),
+    ('exact', 6, {'type': 'number', 'minimum': 0, 'maximum': 1000,
+                  'multipleOf': 1},
+     {'type': 'short'}),
+    # no integer type holds the values
+    ('exact', 6, {'type': 'number', 'minimum': 0, 'maximum': 1e20,
+                  'multipleOf': 1},
+     {'type': 'double'}),
+    ('exact', 6, {'type': 'number', 'minimum': 0, 'maximum': 100,
+                  'multipleOf': 0.01},
+     {'type': 'scaled_float', 'scaling_factor': 100}),
+    ('exact', 2, {'type': 'number', 'minimum': 0, 'maximum': 100,
+                  'multipleOf': 0.01},
+     {'type': 'double'}),
+    ('exact', 6, {'type': 'number', 'minimum': 0, 'maximum': 100},
+     {'type': 'double'}),
+    ('float', 6, {'type': 'number', 'minimum': 0, 'maximum': 100},
+     {'type': 'float'}),
+    ('float', 6, {'type': 'number', 'minimum': 0, 'maximum': 1e300},
+     {'type': 'double'}),
+])
+def test_numeric_narrowing(narrowing, es_version, field, expected):
+    """Test choosing numeric types from the bounds of the fields."""
+    json_schema = {
+        'id': 'https://example.org/root_schema#',
+        'type': 'object',
+        'properties': {'field': field},
+    }
+    config = ElasticMappingGeneratorConfig()
+    config.load({'numeric_narrowing': narrowing, 'es_version': es_version})
+    mapping = schema_to_mapping(json_schema, json_schema['id'], {}, config)
+    assert mapping['properties']['field'] == expected
+
+
+@pytest.mark.parametrize('maximum, expected', [
+    (1000, 'short'),
+    (2 ** 31 - 1, 'integer'),
+    # "long" is wider than the configured "float"
+    (1e12, 'float'),
+])
+def test_numeric_narrowing_float_type(maximum, expected):
+    """Check that narrowing never widens a configured "float" type."""
+    json_schema = {
+        'id': 'https://example.org/root_schema#',
+        'type': 'object',
+        'properties': {'field': {'type': 'number', 'minimum': 0,
+                                 'maximum': maximum, 'multipleOf': 1}},
+    }
+    config = ElasticMappingGeneratorConfig()
+    config.load({'numeric_narrowing': 'exact', 'es_version': 6,
+                 'types': [{'json_type': 'number', 'es_type': 'float'}]})
+    mapping = schema_to_mapping(json_schema, json_schema['id'], {}, config)
+    assert mapping['properties']['field'] == {'type': expected}
+
+
+def test_numeric_narrowing_redefinition():
+    """Check that fields defined multiple times get the widest type."""
+    json_schema = {
+        'id': 'https://example.org/root_schema#',
+        'type': 'object',
+        'allOf': [{
+            'properties': {
+                'small': {'type': 'integer', 'minimum': 0, 'maximum': 10},
+                'nb': {'type': 'integer', 'minimum': 0, 'maximum': 10},
+            },
+        }, {
+            'properties': {
+                'nb': {'type': 'integer', 'minimum': 0, 'maximum': 1000},
+                'ratio': {'type': 'number', 'minimum': 0, 'maximum': 10,
+                          'multipleOf': 0.5},
+            },
+        }, {
+            'properties': {
+                # unbounded definition
+                'ratio': {'type': 'number'},
+            },
+        }],
+    }
+    config = ElasticMappingGeneratorConfig()
+    config.load({'numeric_narrowing': 'exact', 'es_version': 6})
+    mapping = schema_to_mapping(json_schema, json_schema['id'], {}, config)
+    assert mapping['properties'] == {
+        'small': {'type': 'byte'},
+        'nb': {'type': 'short'},
+        'ratio': {'type': 'double'},
+    }
+    assert parallel_schema_to_mapping(json_schema, json_schema['id'], {},
+                                      config, processes=2) == mapping
+    with pytest.raises(ValueError):
+        config.load({'numeric_narrowing': 'lossy'})
+
+
+# subfield added by the multi-fields configuration of test_keyword_inference
+english = {'type': 'text', 'analyzer': 'english'}
+
+
+@pytest.mark.parametrize('es_version, field, expected', [
+    (6, {'type': 'string', 'maxLength': 20},
+     {'type': 'keyword', 'ignore_above': 20, 'fields': {'english': english}}),
+    (2, {'type': 'string', 'maxLength': 20},
+     {'type': 'string', 'index': 'not_analyzed', 'ignore_above': 20,
+      'fields': {'english': {'type': 'string', 'analyzer': 'english'}}}),
+    (6, {'type': 'string', 'pattern': '^[0-9]{4}-[0-9]{4}$'},
+     {'type': 'keyword', 'ignore_above': 256,
+      'fields': {'english': english}}),
+    # long free text has no keyword subfield
+    (6, {'type': 'string', 'maxLength': 10000},
+     {'type': 'text', 'fields': {'english': english}}),
+    (6, {'type': 'string'},
+     {'type': 'text', 'fields': {'raw': {'type': 'keyword'},
+                                 'english': english}}),
+    # the format mapping overrides the inference
+    (6, {'type': 'string', 'format': 'date-time', 'maxLength': 30},
+     {'type': 'date', 'format': None,
+      'fields': {'raw': {'type': 'keyword'}, 'english': english}}),
+])
+def test_keyword_inference(es_version, field, expected):
+    """Test inferring keyword strings from their constraints."""
+    json_schema = {
+        'id': 'https://example.org/root_schema#',
+        'type': 'object',
+        'properties': {'field': field},
+    }
+    config = ElasticMappingGeneratorConfig()
+    config.load({
+        'es_version': es_version,
+        'keyword_max_length': 256,
+        'keyword_patterns': True,
+        'types': [{'json_type': 'string', 'json_format': 'date-time',
+                   'es_type': 'date'}],
+        'multi_fields': [{
+            'fields': {'raw': {'type': 'keyword'},
+                       'english': {'type': 'string',
+                                   'analyzer': 'english'}},
+        }],
+    })
+    mapping = schema_to_mapping(json_schema, json_schema['id'], {}, config)
+    assert mapping['properties']['field'] == expected
+
+
+@pytest.mark.parametrize('es_version, field, expected', [
+    (6, {'enum': ['a', 'b', 'c']},
+     {'type': 'keyword', 'eager_global_ordinals': True, 'norms': False}),
+    (2, {'type': 'string', 'enum': ['a', 'b', 'c']},
+     {'type': 'string', 'index': 'not_analyzed'}),
+    (6, {'enum': ['v{}'.format(index) for index in range(20)]},
+     {'type': 'text'}),
+    (6, {'enum': [0, 100, 1000]}, {'type': 'short'}),
+    (6, {'type': 'integer', 'enum': [-1, 1]}, {'type': 'byte'}),
+    (6, {'type': 'number', 'enum': [0.5, 1]}, {'type': 'double'}),
+])
+def test_enum_optimization(es_version, field, expected):
+    """Test mapping low cardinality enums and numeric enums."""
+    json_schema = {
+        'id': 'https://example.org/root_schema#',
+        'type': 'object',
+        'properties': {'field': field},
+    }
+    config = ElasticMappingGeneratorConfig()
+    config.load({'es_version': es_version, 'enum_keyword_limit': 10,
+                 'numeric_narrowing': 'exact'})
+    mapping = schema_to_mapping(json_schema, json_schema['id'], {}, config)
+    assert mapping['properties']['field'] == expected
+
+
+def test_string_inference_redefinition():
+    """Check that inferred string types depend on all the definitions."""
+    json_schema = {
+        'id': 'https://example.org/root_schema#',
+        'type': 'object',
+        'allOf': [{
+            'properties': {
+                'code': {'type': 'string', 'maxLength': 5},
+                'status': {'enum': ['a', 'b']},
+                'short': {'type': 'string', 'maxLength': 5},
+            },
+        }, {
+            'properties': {
+                'code': {'type': 'string'},
+                'status': {'type': 'string'},
+            },
+        }],
+    }
+    config = ElasticMappingGeneratorConfig()
+    config.load({'es_version': 6, 'keyword_max_length': 10,
+                 'enum_keyword_limit': 10})
+    mapping = schema_to_mapping(json_schema, json_schema['id'], {}, config)
+    assert mapping['properties'] == {
+        'code': {'type': 'text'},
+        'status': {'type': 'text'},
+        'short': {'type': 'keyword', 'ignore_above': 5},
+    }
+    assert parallel_schema_to_mapping(json_schema, json_schema['id'], {},
+                                      config, processes=2) == mapping
+
+
+def test_dynamic_templates():
+    """Test mapping patternProperties and additionalProperties."""
+    json_schema = {
+        'id': 'https://example.org/root_schema#',
+        'type': 'object',
+        'properties': {
+            'title': {'type': 'string'},
+            'meta': {
+                'type': 'object',
+                'patternProperties': {'^x-': {'type': 'string'}},
+                'additionalProperties': False,
+            },
+            'counts': {
+                'type': 'object',
+                'additionalProperties': {'type': 'integer'},
+            },
+            'closed': {
+                'type': 'object',
+                'properties': {'name': {'type': 'string'}},
+                'additionalProperties': False,
+            },
+            'open': {
+                'type': 'object',
+                'properties': {'name': {'type': 'string'}},
+                'additionalProperties': True,
+            },
+        },
+        'additionalProperties': False,
+    }
+    config = ElasticMappingGeneratorConfig()
+    config.load({'closed_objects': 'strict', 'es_version': 6})
+    es_mapping = {
+        'numeric_detection': True,
+        'date_detection': True,
+        'properties': {
+            'title': {'type': 'text'},
+            'meta': {'type': 'object', 'dynamic': True, 'properties': {}},
+            'counts': {'type': 'object', 'dynamic': True, 'properties': {}},
+            'closed': {
+                'type': 'object',
+                'dynamic': 'strict',
+                'properties': {'name': {'type': 'text'}},
+            },
+            'open': {
+                'type': 'object',
+                'dynamic': True,
+                'properties': {'name': {'type': 'text'}},
+            },
+        },
+        'dynamic': 'strict',
+        'dynamic_templates': [{
+            'meta.*[^x-]': {
+                'path_match': 'meta.*',
+                'path_unmatch': 'meta.*.*',
+                'match_pattern': 'regex',
+                'match': 'x-.*',
+                'mapping': {'type': 'text'},
+            },
+        }, {
+            'counts.*': {
+                'path_match': 'counts.*',
+                'path_unmatch': 'counts.*.*',
+                'mapping': {'type': 'integer'},
+            },
+        }],
+    }
+    mapping = schema_to_mapping(json_schema, json_schema['id'], {}, config)
+    assert mapping == es_mapping
+    events = list(iter_mapping_events(json_schema, json_schema['id'], {},
+                                      config))
+    assert build_mapping(events) == es_mapping
+    assert parallel_schema_to_mapping(json_schema, json_schema['id'], {},
+                                      config, processes=2) == es_mapping
+
+    # additionalProperties: false keeps the default dynamic mapping
+    mapping = schema_to_mapping(json_schema, json_schema['id'], {},
+                                ElasticMappingGeneratorConfig())
+    assert 'dynamic' not in mapping
+    assert 'dynamic' not in mapping['properties']['closed']
+
+
+@pytest.mark.parametrize('pattern, regex', [
+    ('^x-', 'x-.*'),
+    ('_id$', '.*_id'),
+    ('^[a-z]+$', '[a-z]+'),
+    ('a|b', '.*(?:a|b).*'),
+])
+def test_pattern_properties_regex(pattern, regex):
+    """Test converting json schema patterns to elasticsearch regexes."""
+    json_schema = {
+        'id': 'https://example.org/root_schema#',
+        'type': 'object',
+        'patternProperties': {pattern: {'type': 'boolean'}},
+    }
+    mapping = schema_to_mapping(json_schema, json_schema['id'], {},
+                                ElasticMappingGeneratorConfig())
+    template, = mapping['dynamic_templates']
+    assert template['*[{}]'.format(pattern)]['match'] == regex
+
+
+@pytest.mark.parametrize('es_version, catch_all_type', [
+    (2, 'string'), (6, 'text'),
+])
+def test_catch_all_field(es_version, catch_all_type):
+    """Test copying fields to a catch-all field instead of "_all"."""
+    json_schema = {
+        'id': 'https://example.org/root_schema#',
+        'type': 'object',
+        'properties': {
+            'title': {'type': 'string'},
+            'abstract': {
+                'type': 'string',
+                'x-domapping': {'catch_all': True},
+            },
+            'control_number': {'type': 'string'},
+            'metadata': {
+                'type': 'object',
+                'properties': {
+                    'keywords': {'type': 'string'},
+                    'internal': {'type': 'string'},
+                    'secret': {
+                        'type': 'string',
+                        'x-domapping': {'catch_all': False},
+                    },
+                },
+            },
+        },
+    }
+    config = ElasticMappingGeneratorConfig()
+    config.load({
+        'es_version': es_version,
+        'catch_all': {
+            'field': 'everything',
+            'include': ['title', 'metadata.**'],
+            'exclude': ['metadata.internal'],
+            'mapping': {'analyzer': 'english'},
+        },
+    })
+    copied = {'type': catch_all_type, 'copy_to': 'everything'}
+    es_mapping = {
+        'numeric_detection': True,
+        'date_detection': True,
+        'properties': {
+            'title': copied,
+            'abstract': copied,
+            'control_number': {'type': catch_all_type},
+            'metadata': {
+                'type': 'object',
+                'properties': {
+                    'keywords': copied,
+                    'internal': {'type': catch_all_type},
+                    'secret': {'type': catch_all_type},
+                },
+            },
+            'everything': {'type': catch_all_type, 'analyzer': 'english'},
+        },
+    }
+    if es_version < 6:
+        es_mapping['_all'] = {'enabled': False}
+    mapping = schema_to_mapping(json_schema, json_schema['id'], {}, config)
+    assert mapping == es_mapping
+    events = list(iter_mapping_events(json_schema, json_schema['id'], {},
+                                      config))
+    assert build_mapping(events) == es_mapping
+    assert parallel_schema_to_mapping(json_schema, json_schema['id'], {},
+                                      config, processes=2) == es_mapping
+
+    # the catch-all field cannot replace a schema field
+    config.set_catch_all('title')
+    with pytest.raises(JsonSchemaSupportError):
+        schema_to_mapping(json_schema, json_schema['id'], {}, config)
+
+
+def test_source_filters_and_store():
+    """Test generating "_source" filters and stored fields."""
+    json_schema = {
+        'id': 'https://example.org/root_schema#',
+        'type': 'object',
+        'properties': {
+            'title': {'type': 'string'},
+            'control_number': {'type': 'string'},
+            'fulltext': {
+                'type': 'string',
+                'x-domapping': {'source': False},
+            },
+            'raw': {
+                'type': 'object',
+                'properties': {
+                    'marc': {
+                        'type': 'string',
+                        'x-domapping': {'source': False},
+                    },
+                    'checksum': {
+                        'type': 'string',
+                        'x-domapping': {'source': True},
+                        'x-elasticsearch': {'store': True},
+                    },
+                },
+            },
+        },
+    }
+    config = ElasticMappingGeneratorConfig()
+    config.load({
+        'es_version': 6,
+        'source': {
+            'excludes': ['fulltext', 'attachments.*'],
+            'store': ['title', 'control_number'],
+        },
+    })
+    es_mapping = {
+        'numeric_detection': True,
+        'date_detection': True,
+        '_source': {
+            'includes': ['raw.checksum'],
+            'excludes': ['fulltext', 'attachments.*', 'raw.marc'],
+        },
+        'properties': {
+            'title': {'type': 'text', 'store': True},
+            'control_number': {'type': 'text', 'store': True},
+            'fulltext': {'type': 'text'},
+            'raw': {
+                'type': 'object',
+                'properties': {
+                    'marc': {'type': 'text'},
+                    'checksum': {'type': 'text', 'store': True},
+                },
+            },
+        },
+    }
+    mapping = schema_to_mapping(json_schema, json_schema['id'], {}, config)
+    assert mapping == es_mapping
+    events = list(iter_mapping_events(json_schema, json_schema['id'], {},
+                                      config))
+    assert build_mapping(events) == es_mapping
+    assert parallel_schema_to_mapping(json_schema, json_schema['id'], {},
+                                      config, processes=2) == es_mapping
+
+    # no filter without annotations and configuration
+    del json_schema['properties']['fulltext']
+    del json_schema['properties']['raw']
+    mapping = schema_to_mapping(json_schema, json_schema['id'], {},
+                                ElasticMappingGeneratorConfig())
+    assert '_source' not in mapping
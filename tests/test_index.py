@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of DoMapping.
+# Copyright (C) 2015, 2016 CERN.
+#
+# DoMapping is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# DoMapping is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DoMapping; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Tests of domapping.index."""
+
+import pytest
+
+from domapping.errors import JsonSchemaSupportError
+from domapping.index import schema_to_index
+from domapping.mapping import ElasticMappingGeneratorConfig
+
+
+def _schema(index):
+    """Create a schema with an index annotation."""
+    return {
+        'id': 'https://example.org/root_schema#',
+        'type': 'object',
+        'x-domapping': {'index': index},
+        'properties': {
+            'year': {'type': 'integer'},
+            'title': {'type': 'string'},
+            'authors': {
+                'type': 'array',
+                'items': {
+                    'type': 'object',
+                    'x-elasticsearch': {'nested': True},
+                    'properties': {'rank': {'type': 'integer'}},
+                },
+            },
+        },
+    }
+
+
+def _config(es_version=6):
+    """Create a configuration with keyword subfields."""
+    config = ElasticMappingGeneratorConfig()
+    config.load({'es_version': es_version, 'presets': ['keyword-raw']})
+    return config
+
+
+def test_schema_to_index():
+    """Test generating the index body of a schema."""
+    json_schema = _schema({
+        'sort': [{'field': 'year', 'order': 'desc'}, 'title.raw'],
+        'routing': {'required': True, 'partition_size': 2},
+    })
+    body = schema_to_index(json_schema, json_schema['id'], {}, _config(),
+                           settings={'index.number_of_shards': 3},
+                           mapping_type='doc')
+    assert body['settings'] == {
+        'index.number_of_shards': 3,
+        'index.sort.field': ['year', 'title.raw'],
+        'index.sort.order': ['desc', 'asc'],
+        'index.routing_partition_size': 2,
+    }
+    mapping = body['mappings']['doc']
+    assert mapping['_routing'] == {'required': True}
+    assert mapping['properties']['year'] == {'type': 'integer'}
+
+    # without annotation the body only contains the mapping
+    del json_schema['x-domapping']
+    body = schema_to_index(json_schema, json_schema['id'], {}, _config())
+    assert body['settings'] == {}
+    assert '_routing' not in body['mappings']
+
+
+@pytest.mark.parametrize('index, es_version', [
+    # not sortable
+    ({'sort': ['title']}, 6),
+    ({'sort': ['authors']}, 6),
+    ({'sort': ['authors.rank']}, 6),
+    ({'sort': ['missing']}, 6),
+    ({'sort': [{'field': 'year', 'order': 'up'}]}, 6),
+    ({'sort': [{'order': 'asc'}]}, 6),
+    # index sorting was added in elasticsearch 6
+    ({'sort': ['year']}, 5),
+    ({'routing': {'partition_size': 2}}, 6),
+    ({'routing': {'required': True, 'partition_size': 0}}, 6),
+    ({'routing': 'yes'}, 6),
+    ({'shards': 2}, 6),
+])
+def test_invalid_index_annotations(index, es_version):
+    """Test rejecting invalid index annotations."""
+    json_schema = _schema(index)
+    with pytest.raises(JsonSchemaSupportError):
+        schema_to_index(json_schema, json_schema['id'], {},
+                        _config(es_version))
+
+
+def test_sort_without_doc_values():
+    """Test rejecting sort fields whose doc values are disabled."""
+    json_schema = _schema({'sort': ['year']})
+    config = _config()
+    config.load({'presets': ['ingest']})
+    with pytest.raises(JsonSchemaSupportError):
+        schema_to_index(json_schema, json_schema['id'], {}, config)
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of DoMapping.
+# Copyright (C) 2015, 2016 CERN.
+#
+# DoMapping is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# DoMapping is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DoMapping; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Tests of domapping.lint."""
+
+import json
+
+import pytest
+
+from domapping.lint import lint_files, lint_schema, load_corpus
+from domapping.mapping import ElasticMappingGeneratorConfig
+
+ROOT = 'https://example.org/root_schema#'
+
+INVALID_SCHEMA = {
+    'id': ROOT,
+    'type': 'object',
+    'properties': {
+        'title': {'type': 'string'},
+        'untyped': {'description': 'no type'},
+        'multi': {'type': ['string', 'integer']},
+        'author': {
+            'type': 'object',
+            'properties': {
+                'name': {'type': 'string'},
+                'missing': {'$ref': '#/definitions/missing'},
+                'list': {'type': 'array'},
+            },
+        },
+        'redefined': {
+            'allOf': [{'type': 'string'}, {'type': 'integer'}],
+        },
+        'annotated': {
+            'type': 'string',
+            'x-elasticsearch': {'nested': True},
+        },
+    },
+}
+
+
+def test_lint_schema():
+    """Test collecting every error of a schema."""
+    errors = lint_schema(INVALID_SCHEMA, ROOT, {},
+                         ElasticMappingGeneratorConfig())
+    assert sorted((error['type'], error['path']) for error in errors) == [
+        ('JsonSchemaSupportError', ROOT + '/annotated'),
+        ('JsonSchemaSupportError', ROOT + '/author/list'),
+        ('JsonSchemaSupportError', ROOT + '/multi'),
+        ('JsonSchemaSupportError', ROOT + '/redefined/allOf[1]'),
+        ('RefResolutionError', ROOT + '/author/missing'),
+        ('UnknownFieldTypeError', ROOT + '/untyped'),
+    ]
+    assert all(error['message'] for error in errors)
+
+    assert lint_schema({'id': ROOT, 'type': 'object',
+                        'properties': {'title': {'type': 'string'}}},
+                       ROOT, {}, ElasticMappingGeneratorConfig()) == []
+    # errors of the root schema stop the compilation
+    errors = lint_schema({'id': ROOT, 'type': 'string'}, ROOT, {},
+                         ElasticMappingGeneratorConfig())
+    assert len(errors) == 1
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_lint_files(tmpdir, processes):
+    """Test linting schema files with references between them."""
+    valid = {
+        'id': 'https://example.org/valid.json',
+        'type': 'object',
+        'properties': {
+            'author': {'$ref': 'https://example.org/author.json'},
+        },
+    }
+    author = {
+        'id': 'https://example.org/author.json',
+        'type': 'object',
+        'properties': {'name': {'type': 'string'}},
+    }
+    paths = []
+    for name, schema in (('valid.json', valid), ('author.json', author),
+                         ('invalid.json', INVALID_SCHEMA)):
+        path = tmpdir.join(name)
+        path.write(json.dumps(schema))
+        paths.append(str(path))
+    broken = tmpdir.join('broken.json')
+    broken.write('{')
+    paths.append(str(broken))
+    malformed = tmpdir.join('malformed.json')
+    malformed.write(json.dumps({
+        'type': 'object',
+        'properties': {
+            'text': 'string',
+            'tags': {'type': 'object', 'properties': []},
+            'name': {'type': 'string'},
+        },
+    }))
+    paths.append(str(malformed))
+    for index, schema_id in enumerate(([], {'a': 1}, 5)):
+        bad_id = tmpdir.join('bad_id{}.json'.format(index))
+        bad_id.write(json.dumps({'id': schema_id, 'type': 'object'}))
+        paths.append(str(bad_id))
+
+    results = lint_files(paths, ElasticMappingGeneratorConfig(),
+                         context_schemas=load_corpus(paths),
+                         processes=processes)
+    assert results[paths[0]] == []
+    assert results[paths[1]] == []
+    assert len(results[paths[2]]) == 6
+    assert results[paths[3]][0]['path'] == str(broken)
+    assert sorted(error['path'].rsplit('/', 1)[1]
+                  for error in results[paths[4]]) == ['tags', 'text']
+    for path in paths[5:]:
+        assert [error['path'] for error in results[path]] == [path]
+
+
+def test_lint_files_unexpected_error(tmpdir):
+    """Test reporting an unexpected failure for the whole file."""
+    config = ElasticMappingGeneratorConfig()
+    config.load({'keyword_max_length': 10})
+    bounds = tmpdir.join('bounds.json')
+    bounds.write(json.dumps({
+        'type': 'object',
+        'properties': {'code': {'type': 'string', 'maxLength': 'short'}},
+    }))
+    valid = tmpdir.join('valid.json')
+    valid.write(json.dumps({
+        'type': 'object',
+        'properties': {'code': {'type': 'string', 'maxLength': 5}},
+    }))
+    paths = [str(bounds), str(valid)]
+    results = lint_files(paths, config, processes=1)
+    assert [error['path'] for error in results[paths[0]]] == [paths[0]]
+    assert results[paths[1]] == []
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of DoMapping.
+# Copyright (C) 2015, 2016 CERN.
+#
+# DoMapping is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# DoMapping is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DoMapping; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Tests of domapping.minify."""
+
+import copy
+
+import pytest
+
+from domapping.mapping import ElasticMappingGeneratorConfig, schema_to_mapping
+from domapping.minify import minify_mapping
+
+
+def test_minify_mapping():
+    """Test removing the default parameters of a mapping."""
+    mapping = {
+        '_all': {'enabled': True},
+        'numeric_detection': False,
+        'date_detection': True,
+        'dynamic': 'strict',
+        'properties': {
+            'date': {'type': 'date', 'format': None, 'index': True,
+                     'doc_values': True},
+            'title': {
+                'type': 'text',
+                'norms': True,
+                'index_options': 'positions',
+                'analyzer': 'english',
+                'search_analyzer': 'english',
+                'fields': {
+                    'raw': {'type': 'keyword', 'ignore_above': 256,
+                            'norms': False},
+                },
+            },
+            'count': {'type': 'integer', 'boost': 1, 'store': False,
+                      'coerce': False},
+            'flag': {'type': 'boolean', 'doc_values': False},
+            'author': {
+                'type': 'object',
+                'dynamic': 'strict',
+                'enabled': True,
+                'properties': {
+                    'meta': {
+                        'type': 'nested',
+                        'dynamic': True,
+                        'properties': {},
+                    },
+                },
+            },
+        },
+        'dynamic_templates': [{
+            'extra': {
+                'path_match': 'extra.*',
+                'mapping': {'type': 'keyword', 'doc_values': True},
+            },
+        }],
+    }
+    original = copy.deepcopy(mapping)
+    assert minify_mapping(mapping, es_version=6) == {
+        'dynamic': 'strict',
+        'properties': {
+            'date': {'type': 'date'},
+            'title': {
+                'type': 'text',
+                'analyzer': 'english',
+                'fields': {'raw': {'type': 'keyword', 'ignore_above': 256}},
+            },
+            'count': {'type': 'integer', 'coerce': False},
+            'flag': {'type': 'boolean', 'doc_values': False},
+            'author': {
+                'properties': {
+                    # the inherited "dynamic" is "strict"
+                    'meta': {'type': 'nested', 'dynamic': True,
+                             'properties': {}},
+                },
+            },
+        },
+        'dynamic_templates': [{
+            'extra': {'path_match': 'extra.*',
+                      'mapping': {'type': 'keyword'}},
+        }],
+    }
+    assert mapping == original
+
+
+@pytest.mark.parametrize('field, minified', [
+    ({'type': 'string', 'index': 'analyzed'}, {'type': 'string'}),
+    ({'type': 'string', 'index': 'not_analyzed', 'doc_values': True},
+     {'type': 'string', 'index': 'not_analyzed'}),
+    ({'type': 'string', 'doc_values': True},
+     {'type': 'string', 'doc_values': True}),
+    ({'type': 'long', 'index': 'not_analyzed', 'similarity': 'default'},
+     {'type': 'long'}),
+    ({'type': 'long', 'index': True}, {'type': 'long', 'index': True}),
+])
+def test_minify_elasticsearch_2(field, minified):
+    """Test the defaults of elasticsearch 2 fields."""
+    mapping = {'properties': {'field': field}}
+    assert minify_mapping(mapping) == {'properties': {'field': minified}}
+
+
+def test_minify_generated_mapping():
+    """Test minifying a generated mapping."""
+    json_schema = {
+        'id': 'https://example.org/root_schema#',
+        'type': 'object',
+        'properties': {
+            'created': {'type': 'string', 'format': 'date-time'},
+            'tags': {'type': 'array', 'items': {'type': 'string'}},
+        },
+    }
+    config = ElasticMappingGeneratorConfig()
+    config.map_type('date', 'string', 'date-time')
+    mapping = schema_to_mapping(json_schema, json_schema['id'], {}, config)
+    assert mapping['properties']['created'] == {'type': 'date',
+                                                'format': None}
+    assert minify_mapping(mapping, config.es_version) == {
+        'numeric_detection': True,
+        'properties': {
+            'created': {'type': 'date'},
+            'tags': {'type': 'string'},
+        },
+    }
+
+
+def test_minify_inherited_parameters():
+    """Test keeping the parameters which differ from the inherited ones."""
+    mapping = {
+        'include_in_all': True,
+        'properties': {
+            'o': {
+                'type': 'object',
+                'include_in_all': False,
+                'properties': {
+                    'a': {'type': 'string', 'include_in_all': True},
+                    'b': {'type': 'string', 'include_in_all': False},
+                },
+            },
+            'c': {'type': 'string', 'include_in_all': True},
+        },
+    }
+    assert minify_mapping(mapping) == {
+        'properties': {
+            'o': {
+                'include_in_all': False,
+                'properties': {
+                    'a': {'type': 'string', 'include_in_all': True},
+                    'b': {'type': 'string'},
+                },
+            },
+            'c': {'type': 'string'},
+        },
+    }
@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of DoMapping.
+# Copyright (C) 2015, 2016 CERN.
+#
+# DoMapping is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# DoMapping is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DoMapping; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Tests of domapping.parallel."""
+
+import json
+import threading
+import time
+
+import pytest
+import responses
+
+from domapping.compiler import RECURSION_POLICIES
+from domapping.errors import JsonSchemaSupportError, SchemaRecursionError, \
+    UnknownFieldTypeError
+from domapping.mapping import ElasticMappingGeneratorConfig, schema_to_mapping
+from domapping.parallel import generate_many, parallel_schema_to_mapping
+from domapping.resolver import ResolutionCache, StripedCache
+
+
+def test_parallel_schema_to_mapping():
+    """Check that the parallel and sequential generations match."""
+    json_schema = {
+        'id': 'https://example.org/root_schema.json',
+        'type': 'object',
+        'allOf': [{
+            'type': 'object',
+            'properties': {
+                'attr{}'.format(idx): {'type': 'string'}
+                for idx in range(20)
+            },
+        }, {
+            'id': 'sub/',
+            'type': 'object',
+            'properties': {
+                'obj': {
+                    'type': 'object',
+                    'properties': {
+                        'local_ref': {
+                            '$ref':
+                            '../root_schema.json#/definitions/local_def',
+                        },
+                        'ext_ref': {
+                            '$ref': 'https://example.org/external_schema.json'
+                            '#/definitions/ext_def',
+                        },
+                    },
+                },
+            },
+            'dependencies': {
+                'attr1': {
+                    'properties': {
+                        'obj': {
+                            'type': 'object',
+                            'properties': {
+                                'dep_attr': {'type': 'integer'},
+                            },
+                        },
+                    },
+                },
+            },
+        }],
+        'definitions': {
+            'local_def': {'type': 'boolean'},
+        },
+    }
+    external_schema = {
+        'id': 'https://example.org/external_schema.json',
+        'definitions': {
+            'ext_def': {'type': 'number'},
+        },
+    }
+    config = ElasticMappingGeneratorConfig()
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.GET, 'https://example.org/external_schema.json',
+                 body=json.dumps(external_schema),
+                 status=200,
+                 content_type='application/json')
+        expected = schema_to_mapping(json_schema, json_schema['id'], {},
+                                     config)
+        result = parallel_schema_to_mapping(json_schema, json_schema['id'],
+                                            {}, config, processes=2)
+    assert result == expected
+    assert list(result['properties']) == list(expected['properties'])
+    assert result['properties']['obj']['properties'] == {
+        'local_ref': {'type': 'boolean'},
+        'ext_ref': {'type': 'double'},
+        'dep_attr': {'type': 'integer'},
+    }
+
+
+@pytest.mark.parametrize('json_schema, expected_exception', [
+    # redefinition in two allOf branches
+    ({
+        'anyOf': [{
+            'type': 'object',
+            'properties': {'attr': {'type': 'string'}, 'other': {
+                'type': 'boolean'}},
+        }, {
+            'type': 'object',
+            'properties': {'attr': {
+                'type': 'object',
+                'properties': {'sub': {'type': 'string'}},
+            }},
+        }],
+    }, JsonSchemaSupportError),
+    # nested redefinition
+    ({
+        'allOf': [{
+            'properties': {'attr': {
+                'type': 'object',
+                'properties': {'sub': {'type': 'string'}},
+            }},
+        }, {
+            'properties': {'attr': {
+                'type': 'object',
+                'properties': {'sub': {'type': 'boolean'}},
+            }},
+        }],
+    }, JsonSchemaSupportError),
+    # errors raised in workers are propagated
+    ({
+        'properties': {
+            'attr': {'format': 'not important'},
+            'other': {'type': 'string'},
+        },
+    }, UnknownFieldTypeError),
+    # root schema which cannot be split
+    ({'type': 'string'}, JsonSchemaSupportError),
+    # the first of multiple compilation errors is raised
+    ({
+        'properties': dict(('attr{}'.format(index), {'format': 'date'})
+                           for index in range(20)),
+    }, UnknownFieldTypeError),
+    # the keywords of an object are compiled after its properties
+    ({
+        'allOf': [{
+            'properties': {'a': {'type': 'string'}},
+            'additionalProperties': {'format': 'date'},
+        }, {
+            'properties': {'b': {'format': 'date'}},
+        }],
+    }, UnknownFieldTypeError),
+    # emission errors of properties defined in a root "allOf"
+    ({
+        'allOf': [{
+            'properties': {'a': {'type': 'string'}},
+        }, {
+            'properties': dict(('attr{}'.format(index), {
+                'type': 'string',
+                'x-elasticsearch': {'nested': True},
+            }) for index in range(20)),
+        }],
+    }, JsonSchemaSupportError),
+])
+def test_parallel_errors(json_schema, expected_exception):
+    """Check that the parallel generation raises the sequential errors."""
+    json_schema['id'] = 'https://example.org/root_schema.json'
+    config = ElasticMappingGeneratorConfig()
+    with pytest.raises(expected_exception) as sequential_error:
+        schema_to_mapping(json_schema, json_schema['id'], {}, config)
+    with pytest.raises(expected_exception) as parallel_error:
+        parallel_schema_to_mapping(json_schema, json_schema['id'], {},
+                                   config, processes=2)
+    assert parallel_error.value.message == sequential_error.value.message
+    assert parallel_error.value.path == sequential_error.value.path
+
+
+@pytest.mark.parametrize('recursion_policy', RECURSION_POLICIES)
+@pytest.mark.parametrize('json_schema', [
+    # the root is reached again from a schema dependency
+    {
+        'type': 'object',
+        'properties': {
+            'a': {'type': 'string'},
+            'b': {'type': 'integer'},
+        },
+        'dependencies': {'a': {'$ref': '#'}},
+    },
+    # the root is referenced by a property
+    {
+        'type': 'object',
+        'properties': {
+            'name': {'type': 'string'},
+            'parent': {'$ref': '#'},
+        },
+    },
+    # the root is a reference, expanded again in a property
+    {
+        '$ref': '#/definitions/node',
+        'definitions': {
+            'node': {
+                'type': 'object',
+                'properties': {
+                    'name': {'type': 'string'},
+                    'children': {
+                        'type': 'array',
+                        'items': {'$ref': '#/definitions/node'},
+                    },
+                },
+            },
+        },
+    },
+])
+def test_parallel_recursion(json_schema, recursion_policy):
+    """Check that recursive schemas are mapped as sequentially."""
+    json_schema = dict(json_schema, id='https://example.org/root_schema.json')
+    config = ElasticMappingGeneratorConfig()
+    options = dict(recursion_policy=recursion_policy, max_recursion=1)
+    if recursion_policy == 'error':
+        with pytest.raises(SchemaRecursionError) as sequential_error:
+            schema_to_mapping(json_schema, json_schema['id'], {}, config,
+                              **options)
+        with pytest.raises(SchemaRecursionError) as parallel_error:
+            parallel_schema_to_mapping(json_schema, json_schema['id'], {},
+                                       config, processes=2, **options)
+        assert parallel_error.value.message == \
+            sequential_error.value.message
+        return
+    mapping = schema_to_mapping(json_schema, json_schema['id'], {}, config,
+                                **options)
+    assert parallel_schema_to_mapping(json_schema, json_schema['id'], {},
+                                      config, processes=2,
+                                      **options) == mapping
+
+
+def test_generate_many_stress():
+    """Map many schemas concurrently with shared configuration and cache."""
+    external_schema = {
+        'id': 'https://example.org/external_schema.json',
+        'definitions': {
+            'ext_date': {'type': 'string', 'format': 'mydate'},
+            'ext_obj': {
+                'type': 'object',
+                'properties': {
+                    'ext_nb': {'type': 'integer'},
+                    'ext_date': {
+                        '$ref': 'https://example.org/external_schema.json'
+                        '#/definitions/ext_date',
+                    },
+                },
+            },
+        },
+    }
+    jobs = []
+    for idx in range(200):
+        json_schema = {
+            'id': 'https://example.org/schema{}.json'.format(idx),
+            'type': 'object',
+            'definitions': {
+                'local_def': {'type': 'boolean'},
+            },
+            'properties': {
+                'date': {'type': 'string', 'format': 'mydate'},
+                'local': {'$ref': '#/definitions/local_def'},
+                'ext': {
+                    '$ref': 'external_schema.json#/definitions/ext_obj',
+                },
+                'attr{}'.format(idx): {'type': 'string'},
+            },
+        }
+        jobs.append((json_schema, json_schema['id'], {}))
+    config = ElasticMappingGeneratorConfig().map_type(
+        es_type='date', json_type='string', json_format='mydate',
+        es_props={'store': True})
+    config.date_format = 'YYYY'
+    cache = ResolutionCache()
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.GET, 'https://example.org/external_schema.json',
+                 body=json.dumps(external_schema),
+                 status=200,
+                 content_type='application/json')
+        results = generate_many(jobs, config, threads=8, cache=cache)
+        # the external schema is fetched only once
+        assert len(rsps.calls) == 1
+    # the configuration is left untouched
+    assert config._formats_map['mydate']['props'] == {'store': True}
+    date_mapping = {'type': 'date', 'format': 'YYYY', 'store': True}
+    for idx, result in enumerate(results):
+        assert result['properties'] == {
+            'date': date_mapping,
+            'local': {'type': 'boolean'},
+            'ext': {
+                'type': 'object',
+                'properties': {
+                    'ext_nb': {'type': 'integer'},
+                    'ext_date': date_mapping,
+                },
+            },
+            'attr{}'.format(idx): {'type': 'string'},
+        }
+
+
+def test_striped_cache():
+    """Check that a value is computed only once by concurrent threads."""
+    cache = StripedCache(stripes=4)
+    computed = []
+
+    def compute(key):
+        def compute_value():
+            computed.append(key)
+            time.sleep(0.001)
+            return key * 2
+        return compute_value
+
+    def worker():
+        for key in range(20):
+            assert cache.get(key, compute(key)) == key * 2
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(computed) == list(range(20))
+    assert len(cache) == 20 and 3 in cache
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of DoMapping.
+# Copyright (C) 2015, 2016 CERN.
+#
+# DoMapping is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# DoMapping is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DoMapping; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Tests of domapping.projection."""
+
+import json
+
+import pytest
+from click.testing import CliRunner
+
+from domapping.cli import schema_to_mapping_cli
+from domapping.compiler import compile_schema
+from domapping.mapping import ElasticMappingGeneratorConfig, schema_to_mapping
+from domapping.parallel import parallel_schema_to_mapping
+from domapping.projection import SKIP, Projection
+
+json_schema = {
+    'id': 'https://example.org/root_schema.json',
+    'type': 'object',
+    'allOf': [{
+        'properties': {
+            'title': {'type': 'string'},
+            'metadata': {
+                'type': 'object',
+                'properties': {
+                    'author': {
+                        'type': 'object',
+                        'properties': {
+                            'name': {'type': 'string'},
+                            'internal': {'type': 'string'},
+                        },
+                    },
+                },
+            },
+            'files': {
+                'type': 'array',
+                'items': {
+                    'type': 'object',
+                    'properties': {
+                        'key': {'type': 'string'},
+                        'size': {'type': 'integer'},
+                    },
+                },
+            },
+            # never resolved when it is not selected
+            'remote': {'$ref': 'https://unreachable.invalid/schema.json'},
+        },
+    }, {
+        'properties': {
+            'metadata': {
+                'type': 'object',
+                'properties': {'date': {'type': 'string'}},
+            },
+        },
+        'dependencies': {
+            'title': {
+                'properties': {
+                    'files': {
+                        'type': 'object',
+                        'properties': {'checksum': {'type': 'string'}},
+                    },
+                },
+            },
+        },
+    }],
+}
+
+
+@pytest.mark.parametrize('path, include, exclude, selected', [
+    (['a'], None, None, True),
+    (['a', 'b'], ['a.b'], None, True),
+    (['a'], ['a.b'], None, 'partial'),
+    (['a', 'c'], ['a.b'], None, False),
+    (['a', 'b', 'c'], ['a.b'], None, True),
+    (['x', 'y', 'b'], ['**.b'], None, True),
+    (['x', 'y'], ['**.b'], None, 'partial'),
+    (['a', 'b'], ['a.*'], ['a.b'], False),
+    (['a', 'bc'], ['a.*'], ['a.b'], True),
+    (['a', 'b', 'internal'], None, ['**.internal'], False),
+    (['ab'], ['a?'], None, True),
+])
+def test_projection(path, include, exclude, selected):
+    """Test the selection of field paths."""
+    projection = Projection(include, exclude)
+    state = projection.root()
+    for name in path:
+        state = projection.child(state, name)
+        if state is SKIP:
+            break
+    if selected is False:
+        assert state is SKIP
+    else:
+        assert state is not SKIP
+        assert projection.is_partial(state) == (selected == 'partial')
+    assert projection.matches(path) == (selected is True)
+
+
+def test_partial_compilation():
+    """Check that only the selected fields are compiled."""
+    compiled = compile_schema(json_schema, json_schema['id'], {},
+                              include=['metadata', 'files.*'],
+                              exclude=['**.internal', 'files.size'])
+    assert compiled == {
+        'id': json_schema['id'],
+        'type': 'object',
+        'properties': {
+            'metadata': {
+                'type': 'object',
+                'properties': {
+                    'author': {
+                        'type': 'object',
+                        'properties': {'name': {'type': 'string'}},
+                    },
+                    'date': {'type': 'string'},
+                },
+            },
+            'files': {
+                'type': 'object',
+                'properties': {
+                    'key': {'type': 'string'},
+                    'checksum': {'type': 'string'},
+                },
+            },
+        },
+    }
+    # partially selected fields without selected subfields are removed
+    compiled = compile_schema(json_schema, json_schema['id'], {},
+                              include=['title.missing', 'files.missing'])
+    assert compiled['properties'] == {}
+
+    config = ElasticMappingGeneratorConfig()
+    options = dict(include=['metadata.**'], exclude=['metadata.date'])
+    assert parallel_schema_to_mapping(json_schema, json_schema['id'], {},
+                                      config, processes=2, **options) == \
+        schema_to_mapping(json_schema, json_schema['id'], {}, config,
+                          **options)
+
+    runner = CliRunner()
+    result = runner.invoke(schema_to_mapping_cli,
+                           ['-', '-', '--include', 'title'],
+                           input=json.dumps(json_schema))
+    assert not result.exception
+    assert json.loads(result.output)['properties'] == {
+        'title': {'type': 'string'},
+    }
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of DoMapping.
+# Copyright (C) 2015, 2016 CERN.
+#
+# DoMapping is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# DoMapping is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DoMapping; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Tests of domapping.resolver."""
+
+import json
+
+import jsonschema
+import pytest
+import responses
+
+from domapping.mapping import ElasticMappingGeneratorConfig, schema_to_mapping
+from domapping.resolver import ResolutionCache, SchemaResolver
+
+root_schema = {
+    'id': 'https://example.org/root.json',
+    'definitions': {
+        'a/b': {'type': 'string'},
+        'c~d e': {'type': 'integer'},
+        'list': [{'type': 'boolean'}],
+        'named': {'id': '#named', 'type': 'number'},
+        'sub': {
+            'id': 'sub/schema.json',
+            'definitions': {'inner': {'type': 'object'}},
+        },
+    },
+}
+
+
+@pytest.mark.parametrize('ref, url, expected', [
+    ('#', 'https://example.org/root.json', root_schema),
+    ('#/definitions/a~1b', None, {'type': 'string'}),
+    ('#/definitions/c~0d%20e', None, {'type': 'integer'}),
+    ('#/definitions/list/0', None, {'type': 'boolean'}),
+    ('#/definitions/list/0/type', None, 'boolean'),
+    ('#named', None, {'type': 'number', 'id': '#named'}),
+    ('sub/schema.json#/definitions/inner',
+     'https://example.org/sub/schema.json#/definitions/inner',
+     {'type': 'object'}),
+])
+def test_schema_resolver(ref, url, expected):
+    """Check the resolution of pointers and ids."""
+    resolver = SchemaResolver(root_schema['id'], root_schema)
+    assert resolver.resolve(ref) == (url or root_schema['id'] + ref,
+                                     expected)
+    if not ref.startswith('sub/'):
+        # the result is the same as the one of the jsonschema resolver
+        reference = jsonschema.RefResolver(root_schema['id'], root_schema)
+        assert reference.resolve(ref)[1] == expected
+
+
+def test_schema_resolver_scopes():
+    """Check the resolution scopes and the errors."""
+    resolver = SchemaResolver(root_schema['id'], root_schema)
+    resolver.push_scope('sub/schema.json')
+    assert resolver.resolution_scope == 'https://example.org/sub/schema.json'
+    assert resolver.resolve('#/definitions/inner')[1] == {'type': 'object'}
+    resolver.pop_scope()
+    assert resolver.base_uri == root_schema['id']
+    with resolver.resolving('#/definitions/sub') as resolved:
+        assert resolved is root_schema['definitions']['sub']
+        assert resolver.resolution_scope == \
+            root_schema['id'] + '#/definitions/sub'
+    with pytest.raises(jsonschema.RefResolutionError):
+        resolver.resolve('#/definitions/missing')
+    with pytest.raises(jsonschema.RefResolutionError):
+        resolver.resolve('file:///missing/schema.json')
+
+
+def test_remote_references():
+    """Check that references inside remote documents use their url."""
+    external_schema = {
+        'definitions': {
+            'obj': {
+                'type': 'object',
+                'properties': {'date': {'$ref': '#/definitions/date'}},
+            },
+            'date': {'type': 'string'},
+        },
+    }
+    json_schema = {
+        'id': 'https://example.org/schema.json',
+        'type': 'object',
+        'properties': {
+            'ext': {'$ref': 'schemas/external.json#/definitions/obj'},
+        },
+        'definitions': {'date': {'type': 'integer'}},
+    }
+    cache = ResolutionCache()
+    config = ElasticMappingGeneratorConfig()
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.GET, 'https://example.org/schemas/external.json',
+                 body=json.dumps(external_schema),
+                 status=200,
+                 content_type='application/json')
+        for _ in range(2):
+            mapping = schema_to_mapping(json_schema, json_schema['id'], {},
+                                        config, cache=cache)
+            assert mapping['properties']['ext']['properties'] == {
+                'date': {'type': 'string'},
+            }
+        assert len(rsps.calls) == 1
+    assert 'https://example.org/schemas/external.json' in cache.indexes
+
+
+def test_large_schema_few_references():
+    """Check that only the referenced parts of a large schema are indexed."""
+    properties = {
+        'field{}'.format(index): {
+            'type': 'object',
+            'properties': {'value': {'type': 'string'}},
+        } for index in range(5000)
+    }
+    properties['flag'] = {'$ref': '#/definitions/flag'}
+    json_schema = {
+        'id': 'https://example.org/large.json',
+        'type': 'object',
+        'properties': properties,
+        'definitions': {
+            'flag': {'type': 'boolean'},
+            'named': {'id': '#named', 'type': 'integer'},
+        },
+    }
+    resolver = SchemaResolver(json_schema['id'], json_schema)
+    mapping = schema_to_mapping(json_schema, json_schema['id'], {},
+                                ElasticMappingGeneratorConfig(),
+                                resolver=resolver)
+    assert mapping['properties']['flag'] == {'type': 'boolean'}
+    index = resolver._indexes[json_schema['id']]
+    assert sorted(index.pointers) == ['', '/definitions/flag']
+    # the ids are only collected to resolve a plain name fragment
+    assert index._ids is None
+    assert resolver.resolve('#named')[1] == {'id': '#named',
+                                             'type': 'integer'}
+    assert index._ids is not None
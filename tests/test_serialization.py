@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of DoMapping.
+# Copyright (C) 2015, 2016 CERN.
+#
+# DoMapping is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# DoMapping is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DoMapping; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Tests of domapping.serialization."""
+
+import json
+import sys
+
+import pytest
+from click.testing import CliRunner
+from six import integer_types
+from six.moves import reload_module
+
+from domapping import serialization
+from domapping.cli import jinja_to_mapping_cli, schema_to_mapping_cli
+
+mapping = {
+    'properties': {
+        'title': {'type': 'string'},
+        'url': {'type': 'string', 'format': 'http://example.org/'},
+        'nb': {'type': 'double'},
+    },
+}
+
+
+@pytest.mark.parametrize('fmt', serialization.FORMATS)
+def test_encode_decode(fmt):
+    """Check that encoded objects are decoded back to the same value."""
+    data = serialization.encode(mapping, fmt=fmt)
+    assert serialization.decode(data, fmt=fmt) == mapping
+    if fmt != 'msgpack':
+        # json and gzip are detected automatically
+        assert serialization.decode(data) == mapping
+
+
+def test_dumps():
+    """Check compact and indented output."""
+    compact = serialization.dumps(mapping)
+    assert ' ' not in compact.replace('http://example.org/', '')
+    assert json.loads(compact) == mapping
+    # indented output is always the one of the standard library
+    assert serialization.dumps(mapping, indent=4) == \
+        json.dumps(mapping, indent=4)
+    # values rejected by the fast backend are still serialized
+    assert serialization.loads(serialization.dumps({'a': 2 ** 70})) == \
+        {'a': 2 ** 70}
+
+
+@pytest.mark.parametrize('fast', [True, False])
+def test_loads(monkeypatch, fast):
+    """Check that both backends parse huge integers exactly."""
+    if not fast:
+        monkeypatch.setattr(serialization, '_fast_loads', None)
+    document = '{"enum": [1, 100000000000000000000000], "a": 1e23}'
+    for data in (document, document.encode('utf-8')):
+        parsed = serialization.loads(data)
+        assert parsed == {'enum': [1, 10 ** 23], 'a': 1e23}
+        assert isinstance(parsed['enum'][1], integer_types)
+        assert isinstance(parsed['a'], float)
+    assert serialization.loads(b'{"a": [1.5, "x"]}') == {'a': [1.5, 'x']}
+
+
+def test_stdlib_backend(monkeypatch):
+    """Check the standard library backend used without the fast ones."""
+    monkeypatch.setitem(sys.modules, 'orjson', None)
+    monkeypatch.setitem(sys.modules, 'ujson', None)
+    try:
+        reload_module(serialization)
+        assert serialization.backend == 'json'
+        parsed = serialization.loads(b'{"a": [1, 100000000000000000000000]}')
+        assert parsed == {'a': [1, 10 ** 23]}
+        assert serialization.dumps({'a': [1, 'x']}) == '{"a":[1,"x"]}'
+    finally:
+        monkeypatch.undo()
+        reload_module(serialization)
+
+
+def test_unknown_format():
+    """Check that unknown formats are rejected."""
+    with pytest.raises(ValueError):
+        serialization.encode(mapping, fmt='xml')
+
+
+def test_cli_output_formats():
+    """Test --compact and --format options."""
+    schema = {
+        'id': 'https://example.org/root_schema#',
+        'type': 'object',
+        'properties': {'name': {'type': 'string'}},
+    }
+    runner = CliRunner()
+    result = runner.invoke(schema_to_mapping_cli, ['-', '-', '--compact'],
+                           input=json.dumps(schema))
+    assert not result.exception
+    assert '\n' not in result.output
+    expected = json.loads(result.output)
+    assert expected['properties'] == {'name': {'type': 'string'}}
+
+    result = runner.invoke(schema_to_mapping_cli, ['-', '-', '-f', 'gzip'],
+                           input=json.dumps(schema))
+    assert not result.exception
+    assert result.stdout_bytes[:2] == b'\x1f\x8b'
+    assert serialization.decode(result.stdout_bytes, 'gzip') == expected
+
+    result = runner.invoke(jinja_to_mapping_cli,
+                           ['-', '-', '-f', 'msgpack'],
+                           input=json.dumps(expected))
+    assert not result.exception
+    assert serialization.decode(result.stdout_bytes, 'msgpack') == expected